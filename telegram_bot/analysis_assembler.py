@@ -0,0 +1,313 @@
+"""
+Локальная сборка финального разбора
+
+- assemble_analysis() — режим 'assembled': вместо дорогой LLM-компоновки (шаг 5,
+  до 3000 токенов) разбирает помеченные блоки шагов 1-4 (ПРОГРАММЫ, УРОКИ ДУШИ,
+  КОНТРАКТ, СЛОИ...) и сам раскладывает их по 8 разделам. Модель пишет только прозу,
+  которую не из чего скопировать: пункты контракта, "Эта жизнь" и "Следующий шаг".
+- render_structured_analysis() — режим 'structured': тот же текст из JSON-документа,
+  который модель вернула одним вызовом. Документ сначала проходит
+  parse_structured_analysis(): проверка схемы и приведение типов в одном месте.
+"""
+
+import json
+import re
+
+# Метки блоков в ответах шагов. Модель иногда выделяет их ** или #, поэтому
+# допускаем обрамление; уточнения в скобках ("СЛОИ (КОНКРЕТНЫЕ ПОКОЛЕНИЯ)") отбрасываем.
+LABEL_RE = re.compile(
+    r'^[\s*#]*'
+    r'(ТЕМА|ПРОГРАММЫ|УРОКИ ДУШИ|ЧТО МЕНЯТЬ|КОНТРАКТ|РАСШИФРОВКА|СЛОИ|РОДОВЫЕ[_ ]ДЕТАЛИ|ПРОШЛЫЕ ЖИЗНИ|'
+    r'ФОРМАТ|ПРОШЛОЕ|СЕЙЧАС|БУДУЩЕЕ|ЭТА ЖИЗНЬ|СЛЕДУЮЩИЙ ШАГ)'
+    r'(?:\s*\([^)]*\))?[\s*]*:[\s*]*(.*)$'
+)
+
+# Эмодзи, с которых шаг 3 начинает строку каждой чакры
+CHAKRA_EMOJIS = ('🔴', '🟠', '🟡', '💚', '💙', '💜', '🤍')
+
+# Подписи чакр в разборе — в том же порядке, что и эмодзи
+CHAKRA_LABELS = (
+    'Муладхара (1-я чакра, безопасность)',
+    'Свадхистхана (2-я чакра, чувства и желания)',
+    'Манипура (3-я чакра, сила воли)',
+    'Анахата (4-я чакра, сердце и любовь)',
+    'Вишудха (5-я чакра, самовыражение)',
+    'Аджна (6-я чакра, интуиция)',
+    'Сахасрара (7-я чакра, связь с высшим)',
+)
+
+FINAL_TEMPLATE = """## Сканер подсознания по Мета-Методу
+
+**Что такое "Сканер подсознания"?**
+Это глубинный анализ запроса через призму Мета-Метода. Я смотрю на программы подсознания, родовые влияния, энергетику чакр и даю конкретные практики для трансформации.
+
+✨ **Сканер подсознания по Мета-Методу для {username}**
+
+**Запрос:**
+{request_text}
+
+**1. Контракты и подключки**
+
+Контракт: {contract}
+
+• Как эта программа проявлялась в прошлом
+{past}
+
+• Как это влияет сейчас
+{now}
+
+• Как это может повлиять в будущем
+{future}
+
+**2. Слои программ. Откуда идёт программа**
+
+• Эта жизнь
+{this_life}
+
+• Родовой слой
+{layers}
+
+• Конкретные родовые сценарии
+{family_details}
+
+• Прошлые жизни
+{past_lives}
+
+**3. Энергоцентры (Чакры) и поток энергии**
+
+Важно понимать, где энергия застревает на уровне 7 чакр в отношении запроса.
+
+{chakras}
+
+**4. Главные программы, мешающие движению**
+{programs}
+
+**5. Главные уроки души**
+{lessons}
+
+**6. Что важно изменить. Рекомендации**
+{changes}
+
+**7. Трансформационные фразы**
+
+ФОРМАТ: {phrases_format}
+
+{phrases}
+
+**8. Следующий шаг**
+
+{next_step}
+"""
+
+
+def parse_labelled_blocks(text: str) -> dict:
+    """
+    Разбивает ответ шага на блоки по меткам "МЕТКА:"
+    Возвращает {метка: текст_блока}, например {'ПРОГРАММЫ': '- «...»\\n- «...»'}
+    """
+    blocks = {}
+    current = None
+
+    for line in text.split('\n'):
+        match = LABEL_RE.match(line)
+        if match:
+            current = match.group(1).replace(' ДЕТАЛИ', '_ДЕТАЛИ')
+            blocks[current] = [match.group(2).strip()] if match.group(2).strip() else []
+        elif current:
+            blocks[current].append(line.rstrip())
+
+    return {label: '\n'.join(lines).strip() for label, lines in blocks.items()}
+
+
+def extract_chakra_lines(step3_text: str) -> str:
+    """Строки чакр из ответа шага 3 (эмодзи + название + процент); если формат сбился — весь ответ"""
+    lines = [line.strip() for line in step3_text.split('\n') if line.strip().startswith(CHAKRA_EMOJIS)]
+    return '\n'.join(lines) if lines else step3_text.strip()
+
+
+def split_phrases(step4_text: str) -> tuple:
+    """Отделяет указание "ФОРМАТ: полный/короткий" от самих фраз шага 4"""
+    phrases_format = 'короткий'
+    phrases = []
+
+    for line in step4_text.strip().split('\n'):
+        match = LABEL_RE.match(line)
+        if match and match.group(1) == 'ФОРМАТ':
+            phrases_format = match.group(2).strip().strip('"').strip() or phrases_format
+        else:
+            phrases.append(line.rstrip())
+
+    return phrases_format, '\n'.join(phrases).strip()
+
+
+def assemble_analysis(username: str, request_text: str,
+                      step1: str, step2: str, step3: str, step4: str, prose: str) -> str:
+    """
+    Собирает финальный разбор в формате шага 5 из результатов шагов 1-4
+    и короткого ответа модели с прозой (ПРОШЛОЕ/СЕЙЧАС/БУДУЩЕЕ/ЭТА ЖИЗНЬ/СЛЕДУЮЩИЙ ШАГ)
+    """
+    programs = parse_labelled_blocks(step1)
+    ancestral = parse_labelled_blocks(step2)
+    written = parse_labelled_blocks(prose)
+    phrases_format, phrases = split_phrases(step4)
+
+    return FINAL_TEMPLATE.format(
+        username=username,
+        request_text=request_text.strip(),
+        contract=ancestral.get('КОНТРАКТ', ''),
+        past=written.get('ПРОШЛОЕ', ''),
+        now=written.get('СЕЙЧАС', ''),
+        future=written.get('БУДУЩЕЕ', ''),
+        this_life=written.get('ЭТА ЖИЗНЬ') or 'Основной источник — родовой уровень',
+        layers=ancestral.get('СЛОИ', ''),
+        family_details=ancestral.get('РОДОВЫЕ_ДЕТАЛИ', ''),
+        past_lives=ancestral.get('ПРОШЛЫЕ ЖИЗНИ') or 'Опыт не прослеживается напрямую',
+        chakras=extract_chakra_lines(step3),
+        programs=programs.get('ПРОГРАММЫ', ''),
+        lessons=programs.get('УРОКИ ДУШИ', ''),
+        changes=programs.get('ЧТО МЕНЯТЬ', ''),
+        phrases_format=phrases_format,
+        phrases=phrases,
+        next_step=written.get('СЛЕДУЮЩИЙ ШАГ', ''),
+    )
+
+
+def _bullets(items: list, marker: str = '-') -> str:
+    """Список строк в markdown-список"""
+    return '\n'.join(f"{marker} {str(item).strip()}" for item in items if str(item).strip())
+
+
+def _quoted(text: str) -> str:
+    """Программа в кавычках-«ёлочках», даже если модель их не поставила"""
+    text = text.strip().strip('"«»').strip()
+    return f"«{text}»"
+
+
+class StructuredAnalysisError(ValueError):
+    """JSON режима 'structured' не по схеме — ответ модели запрашивается заново"""
+
+
+# Поля JSON-документа: строки и списки строк
+STRUCTURED_TEXT_FIELDS = ('contract', 'this_life', 'layers', 'family_details', 'past_lives')
+STRUCTURED_LIST_FIELDS = ('programs', 'lessons', 'changes', 'next_steps')
+
+
+def parse_structured_analysis(text: str) -> dict:
+    """
+    Ответ модели режима 'structured' → документ строго по схеме
+    (metamethod_prompts.STRUCTURED_ANALYSIS_PROMPT): текстовые поля — строки,
+    списки — списки непустых строк, ровно 7 чакр с целым процентом 0-100
+    ("75%", "75.5" и 75.0 приводятся к числу). Иначе — StructuredAnalysisError
+    """
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise StructuredAnalysisError(f"ответ модели — не JSON: {e}") from None
+    if not isinstance(data, dict):
+        raise StructuredAnalysisError(f"ответ модели — {type(data).__name__}, а не JSON-объект")
+
+    chakras = data.get('chakras')
+    if not isinstance(chakras, list) or len(chakras) != len(CHAKRA_LABELS):
+        count = len(chakras) if isinstance(chakras, list) else type(chakras).__name__
+        raise StructuredAnalysisError(f"chakras: нужно {len(CHAKRA_LABELS)} записей, получено {count}")
+
+    decoding = _field_dict(data, 'decoding')
+    phrases = _field_dict(data, 'phrases')
+    return {
+        **{key: _field_text(data.get(key), key) for key in STRUCTURED_TEXT_FIELDS},
+        **{key: _field_list(data.get(key), key) for key in STRUCTURED_LIST_FIELDS},
+        'decoding': {key: _field_text(decoding.get(key), f'decoding.{key}') for key in ('past', 'present', 'future')},
+        'chakras': [_chakra_record(chakra, index) for index, chakra in enumerate(chakras, 1)],
+        'phrases': {
+            'format': _field_text(phrases.get('format'), 'phrases.format'),
+            'formula': _field_text(phrases.get('formula'), 'phrases.formula'),
+            'short': _field_list(phrases.get('short'), 'phrases.short'),
+        },
+    }
+
+
+def _field_dict(data: dict, key: str) -> dict:
+    value = data.get(key)
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise StructuredAnalysisError(f"{key}: ожидался объект, получен {type(value).__name__}")
+    return value
+
+
+def _field_text(value, key: str) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        return str(value).strip()
+    raise StructuredAnalysisError(f"{key}: ожидалась строка, получен {type(value).__name__}")
+
+
+def _field_list(value, key: str) -> list:
+    """Список строк; одна строка вместо списка — список из неё"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        raise StructuredAnalysisError(f"{key}: ожидался список, получен {type(value).__name__}")
+    items = [_field_text(item, key) for item in value]
+    return [item for item in items if item]
+
+
+def _chakra_record(chakra, index: int) -> dict:
+    """Запись чакры: процент — целое 0-100, состояние без точки в конце"""
+    if not isinstance(chakra, dict):
+        raise StructuredAnalysisError(f"chakras[{index}]: ожидался объект, получен {type(chakra).__name__}")
+    percent = chakra.get('percent')
+    if isinstance(percent, str):
+        percent = percent.strip().rstrip('%').strip().replace(',', '.')
+    try:
+        percent = round(float(percent))
+    except (TypeError, ValueError):
+        raise StructuredAnalysisError(f"chakras[{index}].percent: не число ({chakra.get('percent')!r})") from None
+    return {
+        'percent': max(0, min(100, percent)),
+        'state': _field_text(chakra.get('state'), f'chakras[{index}].state').rstrip('.'),
+        'comment': _field_text(chakra.get('comment'), f'chakras[{index}].comment'),
+    }
+
+
+def render_structured_analysis(username: str, request_text: str, data: dict) -> str:
+    """
+    Собирает финальный разбор в формате шага 5 из документа режима 'structured'
+    (data — результат parse_structured_analysis())
+    """
+    decoding = data['decoding']
+    phrases = data['phrases']
+
+    chakra_lines = [
+        f"{emoji} {label} - {chakra['percent']}%. {chakra['state']}. {chakra['comment']}".rstrip()
+        for emoji, label, chakra in zip(CHAKRA_EMOJIS, CHAKRA_LABELS, data['chakras'])
+    ]
+
+    phrase_parts = []
+    if phrases['formula']:
+        phrase_parts.append(phrases['formula'])
+    if phrases['short']:
+        phrase_parts.append(_bullets(phrases['short'], marker='•'))
+
+    return FINAL_TEMPLATE.format(
+        username=username,
+        request_text=request_text.strip(),
+        contract=data['contract'],
+        past=decoding['past'],
+        now=decoding['present'],
+        future=decoding['future'],
+        this_life=data['this_life'] or 'Основной источник — родовой уровень',
+        layers=data['layers'],
+        family_details=data['family_details'],
+        past_lives=data['past_lives'] or 'Опыт не прослеживается напрямую',
+        chakras='\n'.join(chakra_lines),
+        programs=_bullets([_quoted(program) for program in data['programs']]),
+        lessons='\n'.join(f"{i}. {lesson}" for i, lesson in enumerate(data['lessons'], 1)),
+        changes=_bullets(data['changes']),
+        phrases_format=phrases['format'] or 'короткий',
+        phrases='\n\n'.join(phrase_parts),
+        next_step=_bullets(data['next_steps']),
+    )
@@ -0,0 +1,220 @@
+"""
+Очередь сканов с приоритетными полосами по тарифу
+
+Скан (склонение имени + все шаги анализа) занимает место в AnalysisQueue на всё время
+работы с моделью. Полосы:
+- 'vip'  — тариф vip
+- 'paid' — оплаченные сканы (1scan, 3scans, year)
+- 'free' — бесплатный доступ (metaliza_free_access, payment_status 'free')
+- 'speculative' — спекулятивные шаги 1-4 до старта скана (speculative_scan.py):
+  ниже всех полос, не больше ANALYSIS_SPECULATIVE_LIMIT одновременно
+
+Место получает первая непустая полоса по приоритету, если у неё не выбран свой
+лимит одновременных сканов (ANALYSIS_LANE_LIMITS). Защита от голодания: скан,
+который ждёт дольше ANALYSIS_STARVATION_SECONDS, получает место раньше всех
+(кроме фоновых полос — спекуляция не обгоняет настоящие сканы).
+
+Время ожидания по полосам — lane_wait_percentiles() для логов и
+analyses.queue_wait_seconds/priority_lane в БД (представление queue_wait_by_lane).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Полосы по убыванию приоритета
+LANES = ('vip', 'paid', 'free', 'speculative')
+
+# Фоновая работа: место — только когда свободно, защита от голодания не действует
+BACKGROUND_LANES = ('speculative',)
+
+ANALYSIS_MAX_CONCURRENT = getattr(config, 'ANALYSIS_MAX_CONCURRENT', 10)
+ANALYSIS_LANE_LIMITS = getattr(config, 'ANALYSIS_LANE_LIMITS', {'vip': 10, 'paid': 8, 'free': 3})
+ANALYSIS_STARVATION_SECONDS = getattr(config, 'ANALYSIS_STARVATION_SECONDS', 120)
+ANALYSIS_SPECULATIVE_LIMIT = getattr(config, 'ANALYSIS_SPECULATIVE_LIMIT', 2)
+
+# Последние ожидания в каждой полосе — для p50/p95 в логах
+LANE_WAIT_WINDOW = 200
+_lane_waits = {lane: deque(maxlen=LANE_WAIT_WINDOW) for lane in LANES}
+
+
+def lane_for(subscription_type: str = None, payment_status: str = None) -> str:
+    """Полоса по тарифу сессии пользователя"""
+    if subscription_type == 'vip':
+        return 'vip'
+    if subscription_type == 'free' or payment_status == 'free':
+        return 'free'
+    return 'paid'
+
+
+def lane_wait_percentiles() -> dict:
+    """{полоса: {'count', 'p50', 'p95'}} по последним ожиданиям места в очереди (секунды)"""
+    report = {}
+    for lane, waits in _lane_waits.items():
+        values = sorted(waits)
+        if not values:
+            continue
+        report[lane] = {
+            'count': len(values),
+            'p50': values[min(len(values) - 1, len(values) * 50 // 100)],
+            'p95': values[min(len(values) - 1, len(values) * 95 // 100)],
+        }
+    return report
+
+
+class QueueTicket:
+    """Место скана в очереди; wait — сколько секунд скан ждал места"""
+    __slots__ = ('lane', 'future', 'on_position', 'position', 'enqueued', 'wait')
+
+    def __init__(self, lane: str, future, on_position):
+        self.lane = lane
+        self.future = future
+        self.on_position = on_position
+        self.position = None
+        self.enqueued = time.monotonic()
+        self.wait = 0.0
+
+
+class AnalysisQueue:
+    def __init__(self, max_concurrent: int = ANALYSIS_MAX_CONCURRENT, lane_limits: dict = None,
+                 starvation_seconds: float = ANALYSIS_STARVATION_SECONDS):
+        self.max_concurrent = max_concurrent
+        self.lane_limits = {'speculative': ANALYSIS_SPECULATIVE_LIMIT, **ANALYSIS_LANE_LIMITS, **(lane_limits or {})}
+        self.starvation_seconds = starvation_seconds
+        self.waiting = {lane: deque() for lane in LANES}
+        self.running = {lane: 0 for lane in LANES}
+        self._starvation_timer = None
+        self._callbacks = set()
+
+    @asynccontextmanager
+    async def slot(self, lane: str, on_position=None):
+        """
+        async with queue.slot('paid', on_position) as ticket: ... — держит место на время скана.
+        on_position — async-функция (позиция_в_очереди), вызывается, пока скан ждёт
+        """
+        if lane not in self.waiting:
+            raise ValueError(f"Неизвестная полоса очереди: {lane}")
+
+        ticket = QueueTicket(lane, asyncio.get_running_loop().create_future(), on_position)
+        self.waiting[lane].append(ticket)
+        self._grant()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket in self.waiting[lane]:
+                self.waiting[lane].remove(ticket)
+                self._notify_positions()
+            elif ticket.future.done() and not ticket.future.cancelled():
+                # Место успели выдать в момент отмены — возвращаем
+                self._release(lane)
+            raise
+
+        try:
+            yield ticket
+        finally:
+            self._release(lane)
+
+    def waiting_count(self) -> int:
+        """Сколько сканов ждут места"""
+        return sum(len(queue) for queue in self.waiting.values())
+
+    def _release(self, lane: str):
+        self.running[lane] -= 1
+        self._grant()
+
+    def _next_ticket(self):
+        """Следующий скан: сначала голодающие (по времени ожидания), затем по приоритету полос"""
+        now = time.monotonic()
+        open_lanes = [
+            lane for lane in LANES
+            if self.waiting[lane] and self.running[lane] < self.lane_limits.get(lane, self.max_concurrent)
+        ]
+        if not open_lanes:
+            return None
+
+        starving = [
+            lane for lane in open_lanes
+            if lane not in BACKGROUND_LANES and now - self.waiting[lane][0].enqueued >= self.starvation_seconds
+        ]
+        if starving:
+            return min((self.waiting[lane][0] for lane in starving), key=lambda t: t.enqueued)
+        return self.waiting[open_lanes[0]][0]
+
+    def _grant(self):
+        """Раздаёт свободные места и пересчитывает позиции ожидающих"""
+        while sum(self.running.values()) < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            self.waiting[ticket.lane].popleft()
+            if ticket.future.done():
+                continue  # отменён, пока ждал
+
+            ticket.wait = time.monotonic() - ticket.enqueued
+            _lane_waits[ticket.lane].append(ticket.wait)
+            self.running[ticket.lane] += 1
+            ticket.future.set_result(ticket)
+            if ticket.wait > 1:
+                logger.info(f"🚥 Скан из полосы '{ticket.lane}' ждал места {ticket.wait:.1f}с")
+
+        self._notify_positions()
+        self._schedule_starvation_check()
+
+    def _schedule_starvation_check(self):
+        """Ожидающий скан может стать голодающим без освобождения мест — перепроверяем по таймеру"""
+        if self._starvation_timer is not None:
+            self._starvation_timer.cancel()
+            self._starvation_timer = None
+
+        tickets = [ticket for lane, queue in self.waiting.items() if lane not in BACKGROUND_LANES
+                   for ticket in queue]
+        if not tickets:
+            return
+        oldest = min(ticket.enqueued for ticket in tickets)
+        delay = max(0.0, oldest + self.starvation_seconds - time.monotonic())
+        self._starvation_timer = asyncio.get_running_loop().call_later(delay + 0.01, self._grant)
+
+    def _notify_positions(self):
+        """Позиция = порядок получения места (голодающие первыми, дальше по приоритету полос)"""
+        now = time.monotonic()
+        tickets = [ticket for lane in LANES for ticket in self.waiting[lane]]
+        starving = sorted(
+            (t for t in tickets if t.lane not in BACKGROUND_LANES and now - t.enqueued >= self.starvation_seconds),
+            key=lambda t: t.enqueued
+        )
+        ordered = starving + [t for t in tickets if t not in starving]
+
+        for position, ticket in enumerate(ordered, 1):
+            if ticket.on_position and ticket.position != position:
+                ticket.position = position
+                task = asyncio.ensure_future(self._report(ticket.on_position, position))
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+
+    @staticmethod
+    async def _report(on_position, position: int):
+        try:
+            await on_position(position)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка обработчика позиции в очереди: {e}")
+
+
+_queue = None
+
+
+def get_analysis_queue() -> AnalysisQueue:
+    """Очередь сканов процесса"""
+    global _queue
+    if _queue is None:
+        _queue = AnalysisQueue()
+        logger.info(
+            f"🚥 Очередь сканов: до {ANALYSIS_MAX_CONCURRENT} одновременно, лимиты полос {ANALYSIS_LANE_LIMITS}"
+        )
+    return _queue
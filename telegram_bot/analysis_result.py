@@ -0,0 +1,237 @@
+"""
+Структурированный результат анализа
+
+AnalysisResult собирается один раз — в анализаторе, сразу после финального шага —
+и дальше его читают PDF-генераторы, БД и экспорт датасета. Разделы, программы и
+чакры разбираются за один проход по тексту, повторно текст никто не парсит.
+"""
+
+import re
+from dataclasses import dataclass, field, asdict
+
+from analysis_assembler import CHAKRA_EMOJIS, CHAKRA_LABELS, render_structured_analysis
+
+# Заголовок раздела — отдельная строка в ** (у послания впереди 💫)
+HEADING_RE = re.compile(r'^(?:💫\s*)?\*\*([^*\n]+?)\*\*\s*$', re.MULTILINE)
+
+# Номер раздела в начале заголовка: "1." или "1)"
+SECTION_NUMBER_RE = re.compile(r'^(\d+)[\.\)]\s*')
+
+# "Сканер подсознания по Мета-Методу для Анна"
+TITLE_RE = re.compile(r'Сканер подсознания[^\n]*?для\s+(\w+)')
+
+# "🔴 Муладхара (1-я чакра, безопасность) - 40%. Ослаблена. Комментарий"
+# В старых разборах вместо эмодзи — "●"; название начинается с буквы, чтобы не принять
+# за чакру легенду вида "● 65-89% — ..."
+CHAKRA_LINE_RE = re.compile(
+    r'^(' + '|'.join(CHAKRA_EMOJIS) + r'|●)\s*([^\W\d_].*?)\s*[-–—:]\s*(\d{1,3})\s*%\.?\s*(.*)$',
+    re.MULTILINE
+)
+
+# Начало заголовка → ключ раздела. Порядок важен: первое совпадение побеждает.
+# Старые ключи (family, past_lives, archetype...) — для разборов в формате 10 разделов.
+SECTION_KEYS = (
+    ('Запрос', 'request'),
+    ('Контракты', 'contracts'),
+    ('Слои программ', 'layers'),
+    ('Энергоцентры', 'energy'),
+    ('Поток энергии', 'energy'),
+    ('Главные программы', 'programs'),
+    ('Главные уроки', 'lessons'),
+    ('Что важно изменить', 'changes'),
+    ('Трансформационные фразы', 'phrases'),
+    ('Следующий шаг', 'recommendation'),
+    ('Рекомендация', 'recommendation'),
+    ('Родовые влияния', 'family'),
+    ('Конкретные родовые сценарии', 'family'),
+    ('Связи из прошлых жизней', 'past_lives'),
+    ('Архетипический анализ', 'archetype'),
+    ('Вдохновляющее послание', 'message'),
+)
+
+# Маркеры пунктов в списке программ
+LIST_MARKERS = '-–—•*'
+
+
+@dataclass(slots=True, frozen=True)
+class ChakraScore:
+    """Одна чакра: номер 1-7, название, процент наполненности, состояние и комментарий"""
+    index: int
+    name: str
+    percent: int
+    state: str
+    comment: str
+
+    @property
+    def color(self) -> str:
+        """Цвет кружка по проценту: зелёный от 90%, оранжевый от 65%, иначе красный"""
+        if self.percent >= 90:
+            return '#00C851'
+        if self.percent >= 65:
+            return '#FF8800'
+        return '#FF4444'
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    """
+    Результат анализа для PDF, БД и экспорта
+
+    text — полный текст разбора (markdown, как его видит пользователь)
+    sections — {ключ_раздела: текст_раздела}, ключи из SECTION_KEYS
+    programs — формулировки программ без кавычек и маркеров
+    chakras — ChakraScore по порядку 1-7
+    """
+    username: str
+    request_text: str
+    text: str
+    sections: dict = field(default_factory=dict)
+    programs: list = field(default_factory=list)
+    chakras: list = field(default_factory=list)
+
+    @classmethod
+    def from_text(cls, text: str, username: str, request_text: str = '') -> 'AnalysisResult':
+        """Разбирает готовый текст разбора (режимы 'llm' и 'assembled', старые записи из БД)"""
+        sections = parse_sections(text)
+        return cls(
+            username=username,
+            request_text=request_text or sections.get('request', ''),
+            text=text,
+            sections=sections,
+            programs=parse_programs(sections.get('programs', '')),
+            chakras=parse_chakras(sections.get('energy', '')),
+        )
+
+    @classmethod
+    def from_structured(cls, data: dict, username: str, request_text: str) -> 'AnalysisResult':
+        """
+        Из документа режима 'structured' (результат parse_structured_analysis()):
+        программы и чакры берутся из JSON как есть
+        """
+        text = render_structured_analysis(username, request_text, data)
+        chakras = [
+            ChakraScore(
+                index=index,
+                name=_chakra_name(label),
+                percent=chakra['percent'],
+                state=chakra['state'],
+                comment=chakra['comment'],
+            )
+            for index, (label, chakra) in enumerate(zip(CHAKRA_LABELS, data['chakras']), 1)
+        ]
+        programs = [program.strip('"«»').strip() for program in data['programs']]
+        return cls(
+            username=username,
+            request_text=request_text,
+            text=text,
+            sections=parse_sections(text),
+            programs=[program for program in programs if program],
+            chakras=chakras,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'AnalysisResult':
+        """Обратно из to_dict() (колонка analyses.analysis_structured)"""
+        return cls(
+            username=data.get('username', ''),
+            request_text=data.get('request_text', ''),
+            text=data.get('text', ''),
+            sections=dict(data.get('sections') or {}),
+            programs=list(data.get('programs') or []),
+            chakras=[ChakraScore(**chakra) for chakra in data.get('chakras') or []],
+        )
+
+    def to_dict(self) -> dict:
+        """Словарь для JSONB в БД и экспорта"""
+        return asdict(self)
+
+    def map_text(self, transform) -> 'AnalysisResult':
+        """
+        Новый результат, в котором transform(строка) применён ко всему тексту:
+        разбору, разделам, программам и комментариям чакр (например, замена местоимений на имя)
+        """
+        return AnalysisResult(
+            username=self.username,
+            request_text=self.request_text,
+            text=transform(self.text),
+            sections={key: transform(value) for key, value in self.sections.items()},
+            programs=[transform(program) for program in self.programs],
+            chakras=[
+                ChakraScore(c.index, c.name, c.percent, transform(c.state), transform(c.comment))
+                for c in self.chakras
+            ],
+        )
+
+    @property
+    def title_name(self) -> str:
+        """Имя из заголовка "Сканер подсознания ... для Имя" (если заголовка нет — username)"""
+        match = TITLE_RE.search(self.text)
+        return match.group(1) if match else self.username
+
+
+def _section_key(heading: str) -> str:
+    """Ключ раздела по заголовку или None, если заголовок не из SECTION_KEYS"""
+    title = SECTION_NUMBER_RE.sub('', heading.strip())
+    for prefix, key in SECTION_KEYS:
+        if title.startswith(prefix):
+            return key
+    return None
+
+
+def parse_sections(text: str) -> dict:
+    """
+    Делит текст разбора на разделы за один проход по заголовкам.
+    Раздел тянется до следующего известного или пронумерованного заголовка;
+    прочие строки в ** (подзаголовки внутри раздела) остаются в тексте раздела.
+    """
+    sections = {}
+    current_key, body_start = None, 0
+
+    for match in HEADING_RE.finditer(text):
+        heading = match.group(1)
+        key = _section_key(heading)
+        if key is None and not SECTION_NUMBER_RE.match(heading):
+            continue
+
+        if current_key and current_key not in sections:
+            sections[current_key] = text[body_start:match.start()].strip()
+        current_key, body_start = key, match.end()
+
+    if current_key and current_key not in sections:
+        sections[current_key] = text[body_start:].strip()
+
+    return {key: body for key, body in sections.items() if body}
+
+
+def parse_programs(programs_text: str) -> list:
+    """Пункты раздела "Главные программы" без маркеров и кавычек; перенос строки продолжает пункт"""
+    programs = []
+    for line in programs_text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if line[0] in LIST_MARKERS or line[0] in '"«' or not programs:
+            programs.append(line.lstrip(LIST_MARKERS).strip().strip('"«»').strip())
+        else:
+            programs[-1] += ' ' + line.strip('"«»')
+    return [program for program in programs if program]
+
+
+def parse_chakras(energy_text: str) -> list:
+    """Строки чакр раздела "Энергоцентры" → ChakraScore (номер — по эмодзи, для "●" — по порядку)"""
+    chakras = []
+    for marker, label, percent, rest in CHAKRA_LINE_RE.findall(energy_text):
+        state, _, comment = rest.partition('. ')
+        chakras.append(ChakraScore(
+            index=CHAKRA_EMOJIS.index(marker) + 1 if marker in CHAKRA_EMOJIS else len(chakras) + 1,
+            name=_chakra_name(label),
+            percent=int(percent),
+            state=state.strip().rstrip('.'),
+            comment=comment.strip(),
+        ))
+    return chakras
+
+
+def _chakra_name(label: str) -> str:
+    """Название чакры без уточнения в скобках: Муладхара (1-я чакра, безопасность) → Муладхара"""
+    return label.split('(')[0].strip()
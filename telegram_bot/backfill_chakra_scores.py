@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Бэкфилл таблицы chakra_scores для старых анализов
+
+Идёт по analyses пачками по возрастанию id, разбирает проценты чакр
+(из analysis_structured, а для старых записей — из текста analysis_result)
+и пишет их в chakra_scores одной вставкой на пачку. Можно прерывать и запускать
+заново: уже заполненные анализы пропускаются.
+
+Запуск: python backfill_chakra_scores.py [размер_пачки]
+"""
+
+import sys
+import time
+
+from database import get_db
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def backfill(batch_size: int = DEFAULT_BATCH_SIZE):
+    db = get_db()
+    last_id = 0
+    saved = skipped = 0
+    started = time.perf_counter()
+
+    while True:
+        rows = db.get_analyses_without_chakra_scores(after_id=last_id, limit=batch_size)
+        if not rows:
+            break
+
+        items = []
+        for row in rows:
+            chakras = db.analysis_result_from_row(row).chakras
+            if chakras:
+                items.append((row['id'], chakras))
+            else:
+                skipped += 1
+
+        saved += db.save_chakra_scores_batch(items)
+        last_id = rows[-1]['id']
+        print(f"  до #{last_id}: записано {saved}, без чакр {skipped}")
+
+    print(f"\n✅ Готово за {time.perf_counter() - started:.1f}с: записано {saved}, без чакр в тексте {skipped}")
+
+
+if __name__ == '__main__':
+    backfill(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BATCH_SIZE)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Проверка отзывчивости бота во время сканирования
+
+Запускает анализ на фейковом клиенте OpenAI (каждый шаг "думает" STEP_DELAY секунд)
+и параллельно имитирует обработчики других пользователей (кнопки, квиз, оплата).
+Сравнивает синхронный путь analyze() и асинхронный analyze_async().
+
+Вторая часть проходит через диспетчер python-telegram-bot (Application и
+ConversationHandler, Bot API подменён FakeBotApi): один пользователь запускает
+скан, другие в это время шлют /ping. Сравниваются обработка апдейтов по одному
+(как было) и PerUserUpdateProcessor из update_processor.py.
+
+Запуск: python bench_event_loop.py
+"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ConversationHandler, MessageHandler, filters
+from telegram.request import BaseRequest
+
+from metamethod_analyzer import MetaMethodAnalyzer
+from update_processor import PerUserUpdateProcessor
+
+STEP_DELAY = 0.3          # Имитация времени ответа модели на один шаг
+HANDLER_INTERVAL = 0.05   # Как часто "другие пользователи" нажимают кнопки
+OTHER_USERS = 20          # Сколько других пользователей шлют /ping во время скана
+
+
+def _fake_response():
+    usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=500, total_tokens=1500)
+    message = SimpleNamespace(content="ТЕМА: тест")
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+class _SyncCompletions:
+    def create(self, **kwargs):
+        time.sleep(STEP_DELAY)
+        return _fake_response()
+
+
+class _AsyncCompletions:
+    async def create(self, **kwargs):
+        await asyncio.sleep(STEP_DELAY)
+        return _fake_response()
+
+
+def _fake_client(completions):
+    return SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+async def _other_users(stop: asyncio.Event) -> list:
+    """Имитирует обработчики других пользователей, возвращает задержки обслуживания"""
+    delays = []
+    while not stop.is_set():
+        expected = time.perf_counter() + HANDLER_INTERVAL
+        await asyncio.sleep(HANDLER_INTERVAL)
+        delays.append(time.perf_counter() - expected)
+    return delays
+
+
+async def _run(label: str, scan) -> None:
+    stop = asyncio.Event()
+    handlers = asyncio.create_task(_other_users(stop))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await scan()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    delays = await handlers
+
+    print(f"{label}:")
+    print(f"  Время сканирования: {elapsed:.2f}с")
+    print(f"  Обслужено обработчиков: {len(delays)}")
+    print(f"  Макс. задержка обработчика: {max(delays) * 1000:.0f} мс")
+
+
+async def main():
+    analyzer = MetaMethodAnalyzer(
+        client=_fake_client(_SyncCompletions()),
+        async_client=_fake_client(_AsyncCompletions())
+    )
+
+    async def sync_scan():
+        analyzer.analyze("Хочу выйти на новый уровень дохода", "Анна")
+
+    async def async_scan():
+        await analyzer.analyze_async("Хочу выйти на новый уровень дохода", "Анна")
+
+    await _run("Синхронный analyze() внутри обработчика", sync_scan)
+    await _run("Асинхронный analyze_async()", async_scan)
+
+
+class FakeBotApi(BaseRequest):
+    """Bot API без сети: getMe и любые sendMessage отвечают сразу"""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if url.endswith('/getMe'):
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Бот', 'username': 'bench_bot'}
+        else:
+            result = {'message_id': 1, 'date': int(time.time()), 'chat': {'id': 1, 'type': 'private'}}
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def _message_update(update_id: int, user_id: int, text: str, bot) -> Update:
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}] if text.startswith('/') else []
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text, 'entities': entities,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Анна'},
+        },
+    }, bot)
+
+
+async def _run_dispatch(label: str, scan, concurrent_updates) -> None:
+    """Скан в обработчике ConversationHandler, другие пользователи в это время шлют /ping"""
+    builder = Application.builder().token('1:bench').request(FakeBotApi()).get_updates_request(FakeBotApi())
+    if concurrent_updates:
+        builder = builder.concurrent_updates(concurrent_updates)
+    application = builder.build()
+
+    sent = {}
+    answered = {}
+    scan_done = asyncio.Event()
+
+    async def start(update, context):
+        return 1
+
+    async def run_scan(update, context):
+        await scan()
+        scan_done.set()
+        return ConversationHandler.END
+
+    async def ping(update, context):
+        answered[update.update_id] = time.perf_counter() - sent[update.update_id]
+
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler('start', start)],
+        states={1: [MessageHandler(filters.TEXT & ~filters.COMMAND, run_scan)]},
+        fallbacks=[],
+    ))
+    application.add_handler(CommandHandler('ping', ping))
+
+    async with application:
+        await application.start()
+        await application.update_queue.put(_message_update(1, 100, '/start', application.bot))
+        await application.update_queue.put(_message_update(2, 100, 'Хочу выйти на новый уровень дохода',
+                                                           application.bot))
+        await asyncio.sleep(HANDLER_INTERVAL)
+
+        # Другие пользователи пишут, пока идёт скан
+        for i in range(OTHER_USERS):
+            update_id = 100 + i
+            sent[update_id] = time.perf_counter()
+            await application.update_queue.put(_message_update(update_id, 200 + i, '/ping', application.bot))
+            await asyncio.sleep(HANDLER_INTERVAL)
+
+        await scan_done.wait()
+        while len(answered) < OTHER_USERS:
+            await asyncio.sleep(HANDLER_INTERVAL)
+        await application.stop()
+
+    delays = sorted(answered.values())
+    print(f"{label}:")
+    print(f"  Ответ другим пользователям p50 / макс: {delays[len(delays) // 2] * 1000:.0f} / "
+          f"{delays[-1] * 1000:.0f} мс")
+
+
+async def main_dispatch():
+    analyzer = MetaMethodAnalyzer(
+        client=_fake_client(_SyncCompletions()),
+        async_client=_fake_client(_AsyncCompletions())
+    )
+
+    async def async_scan():
+        await analyzer.analyze_async("Хочу выйти на новый уровень дохода", "Анна")
+
+    print("\nЧерез диспетчер python-telegram-bot (скан — analyze_async()):")
+    await _run_dispatch("Апдейты по одному (без concurrent_updates)", async_scan, None)
+    await _run_dispatch("PerUserUpdateProcessor", async_scan, PerUserUpdateProcessor())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
+    asyncio.run(main_dispatch())
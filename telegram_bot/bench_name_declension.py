@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк локального склонения имён на именах из таблицы analyses
+
+Для каждого имени смотрит, откуда взялись бы склонения: словарь, правила по
+окончанию или запрос к модели (неизвестное имя). Печатает покрытие без модели,
+скорость локального склонения и самые частые неизвестные имена — кандидатов
+в name_declensions.json. Затем прогоняет те же имена через кэш склонений
+(LRU без БД, размер NAME_DECLENSION_CACHE_SIZE): доля попаданий и сколько
+запросов к модели осталось бы, когда каждое неизвестное имя спрашивается один раз.
+
+Запуск:
+  python bench_name_declension.py [лимит_анализов]   — имена из БД
+  python bench_name_declension.py --names names.txt   — имена из файла (по одному в строке)
+"""
+
+import sys
+import time
+from collections import Counter
+
+from declension_cache import DeclensionCache
+from name_declension import CASES, NameDeclensionEngine, normalize_name
+from name_helper import extract_name_from_request
+
+DEFAULT_LIMIT = 10000
+REPEATS = 20  # Повторов прохода по именам для замера скорости
+
+
+def names_from_db(limit: int) -> list:
+    from database import get_db
+
+    names = []
+    for row in get_db().get_analysis_names(limit):
+        name = row['username'] or extract_name_from_request(row['request_text'] or '') or row['first_name']
+        if name and name.strip():
+            names.append(name.strip().split()[0])
+    return names
+
+
+def names_from_file(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [line.split()[0] for line in f if line.strip()]
+
+
+def classify(engine: NameDeclensionEngine, name: str) -> str:
+    """Откуда взялись бы склонения: dictionary / rules / model"""
+    if engine.lookup(name):
+        return 'dictionary'
+    return 'rules' if engine.decline(name) else 'model'
+
+
+def main(names: list):
+    engine = NameDeclensionEngine()
+
+    sources = Counter()
+    unknown = Counter()
+    for name in names:
+        source = classify(engine, name)
+        sources[source] += 1
+        if source == 'model':
+            unknown[normalize_name(name)] += 1
+
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        for name in names:
+            engine.decline(name)
+    per_name_us = (time.perf_counter() - started) / (REPEATS * len(names)) * 1e6
+
+    total = len(names)
+    print(f"Имён: {total} (уникальных {len(set(map(normalize_name, names)))}), "
+          f"в словаре {len(engine.dictionary)}\n")
+    for source, title in (('dictionary', 'словарь'), ('rules', 'правила'), ('model', 'нужна модель')):
+        print(f"{title:>14}: {sources[source]:>6}  ({sources[source] / total * 100:.1f}%)")
+
+    local = sources['dictionary'] + sources['rules']
+    print(f"\nПокрытие без модели: {local / total * 100:.1f}% — запросов к модели меньше на {local} из {total}")
+    print(f"Локальное склонение: {per_name_us:.1f} мкс на имя")
+
+    # Имена идут от новых к старым — в кэш подаём по времени
+    cache = DeclensionCache(db=None)
+    model_calls = 0
+    for name in reversed(names):
+        declensions, source = cache.get(name)
+        if not declensions:
+            source = classify(engine, name)
+            model_calls += source == 'model'
+            cache.put(name, engine.decline(name) or {case: name for case in CASES}, source)
+        cache.count(source)
+    print(f"\nКэш склонений: попаданий {cache.hit_rate():.1%}, без модели {cache.saved_api_calls()} из {total}, "
+          f"запросов к модели {model_calls} (без кэша {sources['model']})")
+
+    if unknown:
+        print("\nЧастые неизвестные имена:")
+        for name, count in unknown.most_common(20):
+            print(f"  {name}: {count}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--names':
+        names = names_from_file(sys.argv[2])
+    else:
+        names = names_from_db(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LIMIT)
+
+    if not names:
+        print("Нет имён для бенчмарка")
+        sys.exit(1)
+    main(names)
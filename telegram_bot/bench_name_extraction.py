@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Точность, полнота и скорость извлечения имени из текста запроса
+
+Корпус — request_text прошлых анализов и имя, под которым прошёл анализ
+(analysis_structured->>'username', иначе first_name). Если это имя есть в тексте
+запроса, правильный ответ — оно, иначе правильный ответ — «имени нет».
+Прежние регулярные выражения сравниваются с газетиром (name_extraction.py):
+
+  точность — доля верных среди найденных имён (ошибка — лишнее «Здравствуйте»)
+  полнота — доля найденных среди запросов, где имя есть в тексте
+            (каждый промах — лишний вопрос «напиши своё имя»)
+
+Старые записи с именем, извлечённым прежними выражениями, завышают их полноту —
+корпус с такими записями только в их пользу.
+
+Запуск:
+  python bench_name_extraction.py [лимит_анализов]    — корпус из БД
+  python bench_name_extraction.py --file corpus.tsv    — строки «имя<TAB>текст» (имя может быть пустым)
+
+name_extraction_sample.tsv — размеченная вручную выборка в этом формате, вместе с
+запросами, где в тексте чужое имя («Дмитрий меня не слышит»): правильный ответ там —
+«имени нет». Прогоняется после любой правки name_extraction.py.
+"""
+
+import re
+import sys
+import time
+
+from name_declension import normalize_name
+from name_extraction import NAME_EXTRACTION_MIN_CONFIDENCE, TOKEN_RE, find_name
+
+DEFAULT_LIMIT = 10000
+REPEATS = 5  # Повторов прохода по корпусу для замера скорости
+
+
+def extract_name_legacy(request_text: str) -> str:
+    """Прежняя extract_name_from_request — для сравнения"""
+    patterns = [
+        r'[Мм]еня зовут\s+([А-ЯЁ][а-яё]+)',
+        r'[Яя]\s+[-—]\s+([А-ЯЁ][а-яё]+)',
+        r'[Яя]\s+([А-ЯЁ][а-яё]+)\s+и',
+        r'[Яя]\s+([А-ЯЁ][а-яё]+)[\.,]',
+        r'^([А-ЯЁ][а-яё]+)[\.,]',
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, request_text)
+        if match:
+            return match.group(1)
+    return None
+
+
+def extract_name_gazetteer(request_text: str) -> str:
+    name, confidence = find_name(request_text)
+    return name if confidence >= NAME_EXTRACTION_MIN_CONFIDENCE else None
+
+
+def expected_name(name: str, text: str) -> str:
+    """Имя, если оно встречается в тексте отдельным словом; иначе None"""
+    if not name:
+        return None
+    name = normalize_name(name.strip().split()[0])
+    words = {normalize_name(token) for token in TOKEN_RE.findall(text) if token[0].isalpha()}
+    return name if name in words else None
+
+
+def corpus_from_db(limit: int) -> list:
+    from database import get_db
+
+    corpus = []
+    for row in get_db().get_analysis_names(limit):
+        text = (row['request_text'] or '').strip()
+        if text:
+            corpus.append((text, expected_name(row['username'] or row['first_name'], text)))
+    return corpus
+
+
+def corpus_from_file(path: str) -> list:
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            name, _, text = line.rstrip('\n').partition('\t')
+            corpus.append((text.replace('\\n', '\n'), expected_name(name, text.replace('\\n', '\n'))))
+    return corpus
+
+
+def evaluate(extract, corpus: list) -> dict:
+    tp = fp = fn = 0
+    for text, expected in corpus:
+        found = extract(text)
+        found = normalize_name(found) if found else None
+        if found and found == expected:
+            tp += 1
+        elif found:
+            fp += 1
+        if expected and found != expected:
+            fn += 1
+
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        for text, _ in corpus:
+            extract(text)
+    per_text_us = (time.perf_counter() - started) / (REPEATS * len(corpus)) * 1e6
+
+    return {
+        'precision': tp / (tp + fp) if tp + fp else 0.0,
+        'recall': tp / (tp + fn) if tp + fn else 0.0,
+        'tp': tp, 'fp': fp, 'fn': fn,
+        'us': per_text_us,
+    }
+
+
+def main(corpus: list):
+    with_name = sum(1 for _, expected in corpus if expected)
+    print(f"Запросов: {len(corpus)}, с именем в тексте: {with_name}\n")
+
+    for title, extract in (('регулярные выражения', extract_name_legacy), ('газетир', extract_name_gazetteer)):
+        result = evaluate(extract, corpus)
+        print(f"{title:>20}: точность {result['precision']:.1%}, полнота {result['recall']:.1%} "
+              f"(верно {result['tp']}, ошибок {result['fp']}, пропусков {result['fn']}), "
+              f"{result['us']:.1f} мкс на запрос")
+
+    # Где газетир ошибся — чтобы пополнять газетир и списки контекста
+    misses = [(text, expected, extract_name_gazetteer(text)) for text, expected in corpus
+              if extract_name_gazetteer(text) != expected]
+    if misses:
+        print("\nРасхождения газетира (ожидалось → найдено):")
+        for text, expected, found in misses[:20]:
+            print(f"  {expected or '—'} → {found or '—'}: {text[:80]!r}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--file':
+        corpus = corpus_from_file(sys.argv[2])
+    else:
+        corpus = corpus_from_db(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LIMIT)
+
+    if not corpus:
+        print("Нет запросов для бенчмарка")
+        sys.exit(1)
+    main(corpus)
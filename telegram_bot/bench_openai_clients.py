@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк: новый клиент OpenAI на каждый скан против общего клиента процесса
+
+Поднимает локальный stub-сервер OpenAI API (HTTP/1.1 с keep-alive). Каждое новое
+соединение сервер "принимает" с задержкой CONNECT_DELAY — это имитация TCP+TLS
+рукопожатия до api.openai.com. Скан = склонение имени + 5 шагов анализа.
+
+- "новый клиент": как было — свой клиент у склонения и свой у анализатора на каждый скан
+- "общий клиент": openai_clients.get_openai_client() на все сканы
+
+Запуск: python bench_openai_clients.py [сканов]
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import OpenAI
+
+import openai_clients
+from config import OPENAI_API_KEY
+
+CONNECT_DELAY = 0.08   # Имитация TCP+TLS рукопожатия (RTT до API ~40 мс × 2)
+STEP_CALLS = 5         # Шагов анализа на скан
+DEFAULT_SCANS = 20
+
+RESPONSE = json.dumps({
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+    connections = 0
+    _lock = threading.Lock()
+
+    def setup(self):
+        # Вызывается один раз на соединение
+        with StubHandler._lock:
+            StubHandler.connections += 1
+        time.sleep(CONNECT_DELAY)
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _call(client):
+    client.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "ping"}])
+
+
+def run_fresh(base_url: str, scans: int) -> float:
+    """Как раньше: новый клиент на склонение и новый на анализатор в каждом скане"""
+    started = time.perf_counter()
+    for _ in range(scans):
+        name_client = OpenAI(api_key=OPENAI_API_KEY, base_url=base_url)
+        _call(name_client)
+        analyzer_client = OpenAI(api_key=OPENAI_API_KEY, base_url=base_url)
+        for _ in range(STEP_CALLS):
+            _call(analyzer_client)
+        name_client.close()
+        analyzer_client.close()
+    return time.perf_counter() - started
+
+
+def run_shared(base_url: str, scans: int) -> float:
+    """Общий клиент процесса из openai_clients"""
+    openai_clients.OPENAI_BASE_URL = base_url
+    client = openai_clients.get_openai_client()
+    started = time.perf_counter()
+    for _ in range(scans):
+        for _ in range(1 + STEP_CALLS):
+            _call(client)
+    return time.perf_counter() - started
+
+
+def main(scans: int):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    results = []
+    for label, run in (("новый клиент", run_fresh), ("общий клиент", run_shared)):
+        StubHandler.connections = 0
+        elapsed = run(base_url, scans)
+        results.append((label, elapsed, StubHandler.connections))
+
+    server.shutdown()
+
+    print(f"Сканов: {scans}, вызовов на скан: {1 + STEP_CALLS}, рукопожатие: {CONNECT_DELAY * 1000:.0f} мс\n")
+    for label, elapsed, connections in results:
+        print(f"{label}: {elapsed / scans * 1000:.1f} мс/скан, соединений: {connections}")
+
+    saved = (results[0][1] - results[1][1]) / scans
+    print(f"\nЭкономия на установке соединений: {saved * 1000:.1f} мс на скан")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCANS)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк вёрстки PDF: построчный разбор текста против SectionLayout
+
+Корпус — синтетические анализы (bench_pdf_renderer.synthetic_analysis), по
+умолчанию 1000; каждый второй — в старом формате разборов (кружки «●» вместо
+эмодзи чакр, легенда цветов). Для каждого способа вёрстки замеряется:
+
+  story  — только сборка flowables из AnalysisResult
+  build  — сборка и вёрстка документа (doc.build в память, без записи на диск)
+
+Прежняя вёрстка — копия build_story() до SectionLayout: на каждой строке
+re.match, проверки подстрок и поиск процента для цвета кружка. SectionLayout
+собирает story из analysis.sections/programs/chakras (таблица чакр, список
+программ, блок фраз), поэтому PDF отличаются: вместо сравнения байт бенчмарк
+проверяет, что в story SectionLayout есть все программы и все чакры, а цвет
+каждой чакры в таблице соответствует её проценту.
+
+Запуск: python bench_pdf_layout.py [сколько анализов]
+"""
+
+import io
+import re
+import sys
+import time
+from datetime import datetime
+
+from reportlab.lib.units import cm
+from reportlab.platypus import PageBreak, Paragraph, Spacer, Table
+from reportlab.platypus.doctemplate import NextPageTemplate
+
+from analysis_assembler import CHAKRA_EMOJIS
+from analysis_result import AnalysisResult
+from bench_pdf_renderer import BACKGROUND_PATH, synthetic_analysis
+from pdf_generator_with_background import PdfRenderer
+from pdf_layout import replace_emoji_for_pdf
+
+DEFAULT_COUNT = 1000
+
+
+class LineByLineRenderer(PdfRenderer):
+    """Прежняя build_story() — для сравнения"""
+
+    def build_story(self, analysis):
+        styles = self.styles
+        analysis_text = replace_emoji_for_pdf(analysis.text)
+        chakra_scores = iter(analysis.chakras)
+        story = [NextPageTemplate('Later')]
+
+        for line in analysis_text.strip().split('\n'):
+            line = line.strip()
+
+            if not line:
+                story.append(Spacer(1, 0.3*cm))
+                continue
+            if 'Сканер подсознания' in line or '✨' in line:
+                continue
+            if "ФОРМАТ:" in line:
+                continue
+
+            if line.startswith("🔹") and "Запрос:" in line:
+                clean_line = line.replace("🔹", "").replace("**", "").strip()
+                story.append(Paragraph(clean_line, styles["CustomHeading"]))
+                continue
+            elif re.match(r'^\*?\*?\d+\.', line) or line.startswith('**'):
+                clean_line = line.replace('**', '').strip()
+                if clean_line.startswith('5.'):
+                    story.append(PageBreak())
+                story.append(Paragraph(clean_line, styles['CustomHeading']))
+            else:
+                if line.startswith('—') or line.startswith('-') or line.startswith('•'):
+                    clean_line = '  ' + line
+                else:
+                    clean_line = line
+
+                if '● 90-100%' in clean_line:
+                    clean_line = clean_line.replace('●', '<font color="#00C851">●</font>')
+                elif '● 65-89%' in clean_line:
+                    clean_line = clean_line.replace('●', '<font color="#FF8800">●</font>')
+                elif '● менее 65%' in clean_line:
+                    clean_line = clean_line.replace('●', '<font color="#FF4444">●</font>')
+                elif line.startswith('●') and '%' in line:
+                    chakra = next(chakra_scores, None)
+                    if chakra:
+                        clean_line = clean_line.replace('●', f'<font color="{chakra.color}">●</font>', 1)
+
+                story.append(Paragraph(clean_line, styles['CustomBody']))
+
+        story.append(Spacer(1, 1*cm))
+        footer_text = f"<font size=8 color='#6B3D4F'>Сгенерировано {datetime.now().strftime('%d.%m.%Y')}</font>"
+        story.append(Paragraph(footer_text, styles['CustomBody']))
+        return story
+
+
+def legacy_format(analysis: AnalysisResult) -> AnalysisResult:
+    """Тот же анализ в старом формате: «●» вместо эмодзи чакр и легенда цветов"""
+    text = analysis.text
+    for emoji in CHAKRA_EMOJIS:
+        text = text.replace(emoji, '●')
+    text = text.replace('\n●', "\n● 90-100% — зелёная зона\n● 65-89% — оранжевая зона\n● менее 65% — красная зона\n●", 1)
+    return AnalysisResult.from_text(text, analysis.username, analysis.request_text)
+
+
+def bench_story(renderer, corpus: list) -> float:
+    """Мкс на сборку story одного анализа"""
+    started = time.perf_counter()
+    for analysis in corpus:
+        renderer.build_story(analysis)
+    return (time.perf_counter() - started) / len(corpus) * 1e6
+
+
+def bench_build(renderer, corpus: list) -> tuple:
+    """(мс на PDF, PDF каждого анализа) — полная вёрстка в память"""
+    pdfs = []
+    started = time.perf_counter()
+    for analysis in corpus:
+        pdf = io.BytesIO()
+        renderer.render(analysis, analysis.username, pdf)
+        pdfs.append(pdf.getvalue())
+    return (time.perf_counter() - started) / len(corpus) * 1000, pdfs
+
+
+def percent_color(percent: int) -> str:
+    """Цвет зоны по проценту — независимо от ChakraScore.color"""
+    return '#00C851' if percent >= 90 else '#FF8800' if percent >= 65 else '#FF4444'
+
+
+def check_story(story: list, analysis: AnalysisResult) -> bool:
+    """Все программы на месте, таблица чакр — по строке на чакру, цвет кружка — по проценту чакры"""
+    texts = ' '.join(flowable.text for flowable in story if isinstance(flowable, Paragraph))
+    if not all(program in texts for program in analysis.programs):
+        return False
+    tables = [flowable for flowable in story if isinstance(flowable, Table)]
+    if len(tables) != 1 or len(tables[0]._cellvalues) != len(analysis.chakras):
+        return False
+    table = tables[0]
+    for row, chakra in enumerate(analysis.chakras):
+        _, name, percent, _ = table._cellvalues[row]
+        if name != chakra.name or percent != f'{chakra.percent}%':
+            return False
+        dot_color = '#' + table._cellStyles[row][0].color.hexval()[2:]
+        if dot_color.upper() != percent_color(chakra.percent).upper():
+            return False
+    return True
+
+
+def main(count: int):
+    corpus = [synthetic_analysis(seed) for seed in range(count)]
+    corpus = [legacy_format(analysis) if i % 2 else analysis for i, analysis in enumerate(corpus)]
+    print(f"Анализов: {count} (половина — в старом формате с «●»)\n")
+
+    results = {}
+    for title, renderer in (('построчно', LineByLineRenderer(BACKGROUND_PATH)),
+                            ('по разделам', PdfRenderer(BACKGROUND_PATH))):
+        renderer.render(corpus[0], corpus[0].username, io.BytesIO())  # прогрев: фон и шрифты
+        story_us = bench_story(renderer, corpus)
+        build_ms, pdfs = bench_build(renderer, corpus)
+        results[title] = (story_us, build_ms)
+        pages = sum(pdf.count(b'/Type /Page\n') for pdf in pdfs) / len(pdfs)
+        print(f"  {title:>12}: story {story_us:7.0f} мкс, PDF {build_ms:6.1f} мс, {pages:.1f} стр.")
+
+    (old_story, old_build), (new_story, new_build) = results.values()
+    print(f"\n  Ускорение: story x{old_story / new_story:.2f}, PDF целиком x{old_build / new_build:.2f}")
+
+    layout = PdfRenderer(BACKGROUND_PATH).layout
+    valid = sum(check_story(layout.build(analysis), analysis) for analysis in corpus)
+    print(f"  Программы и чакры на месте, цвет кружка — по проценту чакры: {valid} из {len(corpus)}")
+    return valid == len(corpus)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT) else 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: отзывчивость бота при N одновременных рендерах PDF
+
+N сканов одновременно доходят до генерации PDF, параллельно имитируются
+обработчики других пользователей (кнопки, квиз, оплата) — как в bench_event_loop.py.
+Сравниваются:
+  в обработчике — generate_pdf() прямо в корутине (как было)
+  поток         — PdfRenderPool(size=0): asyncio.to_thread, один GIL с ботом
+  пул процессов — PdfRenderPool(size=PDF_POOL_SIZE), прогретые воркеры
+
+Анализы — синтетические (bench_pdf_renderer.synthetic_analysis).
+
+Запуск: python bench_pdf_pool.py [N одновременных рендеров]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from bench_pdf_renderer import synthetic_analysis
+from pdf_generator_with_background import generate_pdf, get_pdf_renderer
+from pdf_pool import PDF_POOL_MAX_PENDING, PDF_POOL_SIZE, PdfRenderPool
+
+DEFAULT_CONCURRENCY = 8
+HANDLER_INTERVAL = 0.02   # Как часто "другие пользователи" нажимают кнопки
+
+
+async def _other_users(stop: asyncio.Event) -> list:
+    """Имитирует обработчики других пользователей, возвращает задержки обслуживания"""
+    delays = []
+    while not stop.is_set():
+        expected = time.perf_counter() + HANDLER_INTERVAL
+        await asyncio.sleep(HANDLER_INTERVAL)
+        delays.append(time.perf_counter() - expected)
+    return delays
+
+
+async def _run(label: str, render, corpus: list, output_dir: str):
+    stop = asyncio.Event()
+    handlers = asyncio.create_task(_other_users(stop))
+    await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        render(analysis, os.path.join(output_dir, f'load_{i}.pdf')) for i, analysis in enumerate(corpus)
+    ))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    delays = sorted(await handlers)
+
+    print(f"{label}:")
+    print(f"  {len(corpus)} PDF за {elapsed:.2f}с ({len(corpus) / elapsed:.1f} PDF/с)")
+    print(f"  Обслужено обработчиков: {len(delays)}")
+    print(f"  Задержка обработчика p95 / макс: {delays[len(delays) * 95 // 100] * 1000:.0f} / "
+          f"{delays[-1] * 1000:.0f} мс")
+
+
+async def main(concurrency: int):
+    corpus = [synthetic_analysis(seed) for seed in range(concurrency)]
+    print(f"Одновременных рендеров: {concurrency}, пул: {PDF_POOL_SIZE} процессов, "
+          f"в работе и очереди до {PDF_POOL_MAX_PENDING}\n")
+
+    # Процесс бота тоже прогрет — сравниваем только место, где идёт рендер
+    get_pdf_renderer()
+
+    async def inline(analysis, path):
+        generate_pdf(analysis, analysis.username, path)
+
+    thread_pool = PdfRenderPool(size=0)
+    process_pool = PdfRenderPool()
+    await process_pool.start()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        await _run("generate_pdf() в обработчике", inline, corpus, output_dir)
+        await _run("Поток (PDF_POOL_SIZE = 0)",
+                   lambda analysis, path: thread_pool.render(analysis, analysis.username, path),
+                   corpus, output_dir)
+        await _run(f"Пул процессов ({PDF_POOL_SIZE})",
+                   lambda analysis, path: process_pool.render(analysis, analysis.username, path),
+                   corpus, output_dir)
+
+    process_pool.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CONCURRENCY))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рендера PDF: рендеров в секунду и размер файла
+
+  до               — как generate_pdf() работала раньше: на каждый PDF заново
+                     разбираются TTF DejaVu, собираются стили и шаблоны страниц,
+                     фон читается и сжимается canvas.drawImage()
+  фон drawImage    — один PdfRenderer на процесс (get_pdf_renderer), фон по-старому
+  фон XObject      — PdfRenderer и фон, разобранный один раз на процесс (BackgroundImage:
+                     ImageReader, форма PageBackground на документ), потоки без ASCII85
+  фон XObject JPEG — то же с PDF_BACKGROUND_JPEG_QUALITY = 90
+
+«до» и «фон drawImage» идут с rl_config.useA85 = 1, как было до общего фона.
+
+Корпус — сохранённые анализы из БД; без БД (или с --synthetic) — синтетические
+анализы, собранные из JSON как в режиме 'structured'.
+
+Запуск:
+  python bench_pdf_renderer.py [лимит_анализов]
+  python bench_pdf_renderer.py --synthetic [сколько]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+from reportlab import rl_config
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from analysis_assembler import CHAKRA_LABELS
+from analysis_result import AnalysisResult
+from pdf_generator_with_background import BackgroundImage, FONT_FILES, PdfRenderer, draw_background, get_pdf_renderer
+
+DEFAULT_LIMIT = 50
+JPEG_QUALITY = 90
+BACKGROUND_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pdf_background.png')
+
+NAMES = ('Анна', 'Мария', 'Дмитрий', 'Елена', 'Ольга', 'Ирина', 'Сергей', 'Татьяна')
+REQUESTS = (
+    "Не хватает финансов, хочу выйти на новый уровень дохода",
+    "Хочу встретить свою судьбу и построить счастливые отношения",
+    "Хочу реализоваться и перестать бояться проявляться публично",
+    "Постоянная усталость и выгорание, нет сил ни на что",
+    "Что блокирует мой бизнес? Всё время откладываю запуск",
+)
+SENTENCES = (
+    "Программа пришла по женской линии рода и закрепилась в детстве.",
+    "Энергия уходит на удержание контроля, и на движение вперёд её не остаётся.",
+    "Тело помнит опыт, в котором проявляться было опасно.",
+    "Когда ты даёшь место этому опыту, напряжение постепенно уходит.",
+    "Важно разрешить себе получать, не доказывая собственную ценность.",
+    "Связь с отцом ослаблена, поэтому опора ищется во внешнем.",
+)
+
+
+def _text(rng: random.Random, sentences: int) -> str:
+    return ' '.join(rng.choice(SENTENCES) for _ in range(sentences))
+
+
+def synthetic_analysis(seed: int) -> AnalysisResult:
+    """Анализ размером с настоящий (~3500 символов), собранный как в режиме 'structured'"""
+    rng = random.Random(seed)
+    data = {
+        'contract': _text(rng, 2),
+        'decoding': {'past': _text(rng, 2), 'present': _text(rng, 2), 'future': _text(rng, 2)},
+        'this_life': _text(rng, 1),
+        'layers': _text(rng, 2),
+        'family_details': _text(rng, 3),
+        'past_lives': _text(rng, 1),
+        'chakras': [
+            {'percent': rng.randint(30, 100), 'state': 'Ослаблена', 'comment': _text(rng, 1)}
+            for _ in CHAKRA_LABELS
+        ],
+        'programs': [_text(rng, 1) for _ in range(rng.randint(3, 5))],
+        'lessons': [_text(rng, 1) for _ in range(3)],
+        'changes': [_text(rng, 1) for _ in range(3)],
+        'phrases': {'format': 'короткий', 'formula': _text(rng, 1), 'short': [_text(rng, 1) for _ in range(4)]},
+        'next_steps': [_text(rng, 1) for _ in range(2)],
+    }
+    return AnalysisResult.from_structured(data, rng.choice(NAMES), rng.choice(REQUESTS))
+
+
+def corpus_from_db(limit: int) -> list:
+    from database import get_db
+
+    db = get_db()
+    return [db.analysis_result_from_row(row) for row in db.get_recent_analysis_rows(limit)]
+
+
+class DrawImageRenderer(PdfRenderer):
+    """Фон как раньше: canvas.drawImage() с путём к файлу на каждой странице"""
+
+    def _draw_background(self, canvas, doc):
+        if self.background_path and os.path.exists(self.background_path):
+            canvas.saveState()
+            page_width, page_height = A4
+            canvas.drawImage(self.background_path, 0, 0, width=page_width, height=page_height,
+                             preserveAspectRatio=False)
+            canvas.restoreState()
+
+
+class JpegBackgroundRenderer(PdfRenderer):
+    """Фон XObject в JPEG"""
+
+    def __init__(self, background_path):
+        super().__init__(background_path)
+        self.background = BackgroundImage(background_path, JPEG_QUALITY)
+
+    def _draw_background(self, canvas, doc):
+        draw_background(canvas, self.background)
+
+
+def render_cold(analysis: AnalysisResult, output_path: str):
+    """Как было до PdfRenderer: шрифты, стили, шаблоны страниц и фон заново на каждый PDF"""
+    for font_name, font_path in FONT_FILES:
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+    DrawImageRenderer(BACKGROUND_PATH).render(analysis, analysis.username, output_path)
+
+
+def with_a85(render):
+    """Рендер со старым ASCII85 (pdf_generator_with_background выключает его для всего процесса)"""
+    def run(analysis, path):
+        rl_config.useA85 = 1
+        try:
+            render(analysis, path)
+        finally:
+            rl_config.useA85 = 0
+    return run
+
+
+def renderer_variants() -> list:
+    """(название, функция рендера) — renderer готовится до замера, как в процессе бота"""
+    draw_image = DrawImageRenderer(BACKGROUND_PATH)
+    xobject = get_pdf_renderer(BACKGROUND_PATH)
+    jpeg = JpegBackgroundRenderer(BACKGROUND_PATH)
+    return [
+        ('до', with_a85(render_cold)),
+        ('фон drawImage', with_a85(lambda analysis, path: draw_image.render(analysis, analysis.username, path))),
+        ('фон XObject', lambda analysis, path: xobject.render(analysis, analysis.username, path)),
+        (f'фон XObject JPEG {JPEG_QUALITY}', lambda analysis, path: jpeg.render(analysis, analysis.username, path)),
+    ]
+
+
+def bench(render, corpus: list, output_dir: str) -> tuple:
+    """(рендеров в секунду, средний размер PDF в КБ)"""
+    paths = [os.path.join(output_dir, f'bench_{i}.pdf') for i in range(len(corpus))]
+    started = time.perf_counter()
+    for analysis, path in zip(corpus, paths):
+        render(analysis, path)
+    per_second = len(corpus) / (time.perf_counter() - started)
+    return per_second, sum(os.path.getsize(path) for path in paths) / len(paths) / 1024
+
+
+def main(corpus: list):
+    print(f"Анализов: {len(corpus)}, средняя длина {sum(len(a.text) for a in corpus) // len(corpus)} символов\n")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        baseline = None
+        for title, render in renderer_variants():
+            # Прогрев: импорт модулей ReportLab и первый рендер не в счёт
+            render(corpus[0], os.path.join(output_dir, 'warmup.pdf'))
+            per_second, size_kb = bench(render, corpus, output_dir)
+            baseline = baseline or (per_second, size_kb)
+            print(f"  {title:>18}: {per_second:6.1f} PDF/с ({1000 / per_second:6.1f} мс на PDF) x{per_second / baseline[0]:<6.2f}"
+                  f"  {size_kb:5.0f} КБ ({size_kb / baseline[1] - 1:+.0%})")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--synthetic':
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LIMIT
+        corpus = [synthetic_analysis(seed) for seed in range(count)]
+    else:
+        corpus = corpus_from_db(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LIMIT)
+
+    if not corpus:
+        print("Нет анализов для бенчмарка")
+        sys.exit(1)
+    main(corpus)
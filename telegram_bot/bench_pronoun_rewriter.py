@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Проверка и бенчмарк замены местоимений на имя (pronoun_rewriter.py)
+
+1. Эталонный корпус pronoun_rewriter_golden.json: для каждого примера
+   replace_pronouns_with_name() должна дать ровно expected. Расхождения
+   печатаются, скрипт завершается с кодом 1 — корпус прогоняется после
+   любой правки pronoun_rewriter.py.
+2. Бенчмарк на текстах размером с анализ (~3500 символов): прежняя реализация
+   (шесть паттернов и шесть проходов re.sub на каждый вызов) против однопроходной.
+   «Плотный» текст — только примеры корпуса (местоимение в каждой фразе),
+   «анализ» — примеры вперемешку с нейтральными фразами, как в ответе модели.
+
+Запуск: python bench_pronoun_rewriter.py [повторов]
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+from name_declension import get_declension_engine
+from name_helper import replace_pronouns_with_name
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pronoun_rewriter_golden.json')
+DEFAULT_REPEATS = 2000
+ANALYSIS_LENGTH = 3500
+
+
+def replace_pronouns_legacy(text: str, declensions: dict) -> str:
+    """Прежняя replace_pronouns_with_name — для сравнения скорости"""
+    if not declensions:
+        return text
+
+    replacements = [
+        (r'\b([Уу]|[Дд]ля|[Бб]ез|[Оо]т|[Ии]з-за|[Кк]роме)\s+тебя\b', lambda m: f'{m.group(1)} {declensions["genitive"]}'),
+        (r'\b[Тт]ебе\b', f'{declensions["dative"]}'),
+        (r'\b([Нн]а|[Пп]ро|[Зз]а|[Вв])\s+тебя\b', lambda m: f'{m.group(1)} {declensions["accusative"]}'),
+        (r'\b([Сс]|[Сс]о|[Зз]а|[Пп]еред|[Нн]ад|[Пп]од)\s+тобой\b', lambda m: f'{m.group(1)} {declensions["instrumental"]}'),
+        (r'\b[Тт]обою\b', f'{declensions["instrumental"]}'),
+        (r'\b[Тт]ы\b', f'{declensions["nominative"]}'),
+    ]
+
+    result = text
+    for pattern, replacement in replacements:
+        if callable(replacement):
+            result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
+        else:
+            result = re.sub(pattern, replacement, result)
+
+    return result
+
+
+def check_golden(engine) -> int:
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        cases = json.load(f)
+
+    failed = 0
+    for case in cases:
+        result = replace_pronouns_with_name(case['text'], engine.decline(case['name']))
+        if result != case['expected']:
+            failed += 1
+            print(f"❌ {case['name']}: {case['text']}\n   ожидалось: {case['expected']}\n   получено:  {result}")
+    print(f"Эталонный корпус: {len(cases) - failed} из {len(cases)} совпало")
+    return failed
+
+
+# Фразы без обращения — между примерами корпуса в тексте «анализ»
+NEUTRAL = (
+    "Муладхара отвечает за чувство опоры, безопасности и связь с родом.",
+    "Энергия проходит через тело и постепенно наполняет все центры.",
+    "Родовые программы передаются по женской и мужской линии.",
+    "Свадхистхана связана с удовольствием, творчеством и принятием себя.",
+)
+
+
+def analysis_text(cases: list, neutral_per_case: int = 0) -> str:
+    """Текст размером с анализ из примеров корпуса (и нейтральных фраз между ними)"""
+    sentences = []
+    for i, case in enumerate(cases):
+        sentences.append(case['text'])
+        sentences.extend(NEUTRAL[(i + j) % len(NEUTRAL)] for j in range(neutral_per_case))
+    text = ''
+    while len(text) < ANALYSIS_LENGTH:
+        text += ' '.join(sentences) + '\n\n'
+    return text[:ANALYSIS_LENGTH]
+
+
+def bench(function, text: str, declensions: dict, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        # Как в боте: склонения приходят новым словарём на каждый скан
+        function(text, dict(declensions))
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def main(repeats: int):
+    engine = get_declension_engine()
+    failed = check_golden(engine)
+
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        cases = json.load(f)
+    declensions = engine.decline('Анна')
+
+    for title, text in (('плотный', analysis_text(cases)), ('анализ', analysis_text(cases, neutral_per_case=4))):
+        legacy_us = bench(replace_pronouns_legacy, text, declensions, repeats)
+        current_us = bench(replace_pronouns_with_name, text, declensions, repeats)
+        print(f"\nТекст «{title}»: {len(text)} символов, {repeats} повторов")
+        print(f"  шесть проходов re.sub: {legacy_us:8.1f} мкс на текст")
+        print(f"  один проход:           {current_us:8.1f} мкс на текст  (x{legacy_us / current_us:.1f})")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPEATS)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Проверка повторов, хеджирования и дедлайнов шагов анализа
+
+Поднимает локальный фейковый сервер OpenAI API, который подмешивает задержки и ошибки:
+часть ответов медленные (SLOW_RATE × SLOW_LATENCY), часть — 500/429 (ERROR_RATE).
+Прогоняет одни и те же сканы (5 шагов, без стрима):
+
+- "без политики": один запрос на шаг, без повторов и хеджирования
+- "с политикой": таймауты шагов, повторы с backoff, дубль после p90
+- "жёсткий дедлайн": общий дедлайн скана меньше времени одного медленного шага
+
+и печатает долю успешных сканов, p50/p95/макс времени скана и число запросов к серверу.
+
+Запуск: python bench_step_resilience.py [сканов]
+"""
+
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai import AsyncOpenAI
+
+from llm_scheduler import LLMScheduler
+from metamethod_analyzer import MetaMethodAnalyzer, StepPolicy, AnalysisDeadlineError
+
+BASE_LATENCY = (0.05, 0.15)   # Обычный ответ, секунд
+SLOW_RATE = 0.08              # Доля медленных ответов
+SLOW_LATENCY = 2.0            # Медленный ответ, секунд
+ERROR_RATE = 0.08             # Доля ответов 500 / 429
+DEFAULT_SCANS = 30
+CONCURRENCY = 10
+
+RESPONSE = json.dumps({
+    "id": "chatcmpl-fake",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ТЕМА: тест"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 100, "completion_tokens": 50, "total_tokens": 150},
+}).encode()
+
+ERROR = json.dumps({"error": {"message": "injected", "type": "server_error"}}).encode()
+
+
+class FaultyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    requests = 0
+
+    def do_POST(self):
+        FaultyHandler.requests += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        roll = random.random()
+        if roll < ERROR_RATE:
+            status, body = random.choice((500, 429)), ERROR
+        else:
+            status, body = 200, RESPONSE
+            time.sleep(SLOW_LATENCY if roll < ERROR_RATE + SLOW_RATE else random.uniform(*BASE_LATENCY))
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QuietServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # клиент отменил запрос (таймаут, проигравший дубль) — обрыв соединения ожидаем
+
+
+def _policies(policy: StepPolicy) -> dict:
+    return {step: policy for step in ('programs', 'ancestral', 'chakras', 'phrases', 'composition')}
+
+
+CONFIGS = [
+    ("без политики", _policies(StepPolicy(timeout=30, retries=0, hedge=False)), 60),
+    ("с политикой", _policies(StepPolicy(timeout=1.5, retries=3, backoff_base=0.1, backoff_max=1.0,
+                                         hedge=True, hedge_min_samples=10)), 60),
+    ("жёсткий дедлайн", _policies(StepPolicy(timeout=30, retries=0, hedge=False)), 1.0),
+]
+
+
+async def run_config(client, policies: dict, scan_deadline: float, scans: int) -> dict:
+    analyzer = MetaMethodAnalyzer(
+        client=object(), async_client=client, mode='llm',
+        scheduler=LLMScheduler(rpm=100000, tpm=10 ** 9),
+        step_policies=policies, scan_deadline=scan_deadline,
+    )
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    outcomes = []
+
+    async def scan(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await analyzer.analyze_async("Хочу выйти на новый уровень дохода", f"user{index}", user_id=index)
+                outcomes.append(('ok', time.perf_counter() - started))
+            except AnalysisDeadlineError:
+                outcomes.append(('deadline', time.perf_counter() - started))
+            except Exception:
+                outcomes.append(('error', time.perf_counter() - started))
+
+    FaultyHandler.requests = 0
+    await asyncio.gather(*(scan(i) for i in range(scans)))
+
+    durations = sorted(duration for status, duration in outcomes if status == 'ok')
+    return {
+        'ok': len(durations),
+        'deadline': sum(1 for status, _ in outcomes if status == 'deadline'),
+        'error': sum(1 for status, _ in outcomes if status == 'error'),
+        'p50': durations[len(durations) // 2] if durations else 0,
+        'p95': durations[min(len(durations) - 1, len(durations) * 95 // 100)] if durations else 0,
+        'max': max((duration for _, duration in outcomes), default=0),
+        'requests': FaultyHandler.requests,
+    }
+
+
+async def main(scans: int):
+    server = QuietServer(('127.0.0.1', 0), FaultyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = AsyncOpenAI(api_key="sk-fake", base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+
+    print(f"Сканов: {scans}, ошибок {ERROR_RATE:.0%}, медленных {SLOW_RATE:.0%} по {SLOW_LATENCY:.1f}с\n")
+    for label, policies, scan_deadline in CONFIGS:
+        r = await run_config(client, policies, scan_deadline, scans)
+        print(f"{label}:")
+        print(f"  Успешно: {r['ok']}/{scans}, дедлайн: {r['deadline']}, ошибок: {r['error']}")
+        print(f"  Время скана p50/p95: {r['p50']:.2f}с / {r['p95']:.2f}с, макс: {r['max']:.2f}с")
+        print(f"  Запросов к серверу: {r['requests']}")
+
+    await client.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SCANS))
@@ -3,6 +3,7 @@ Telegram Bot для анализа фото по Мета-Методу + Postgre
 Все анализы сохраняются в БД для подготовки датасета
 """
 
+import asyncio
 import os
 import logging
 import time
@@ -17,12 +18,12 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-from openai import OpenAI
 from pdf_generator import create_analysis_pdf
-from config import TELEGRAM_TOKEN, OPENAI_API_KEY, OPENAI_MODEL
+from config import TELEGRAM_TOKEN, OPENAI_MODEL
+from openai_clients import get_openai_client
 from database import get_db
 from metamethod_analyzer import analyze_with_metamethod
-from name_helper import extract_name_from_request, get_name_declensions_gpt, replace_pronouns_with_name
+from name_helper import extract_name_from_request, get_name_declensions_async, replace_pronouns_with_name
 
 # Настройка логирования
 logging.basicConfig(
@@ -32,7 +33,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Инициализация OpenAI клиента
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_openai_client()
 
 # Инициализация БД
 db = get_db()
@@ -156,21 +157,31 @@ async def process_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE, p
     try:
         start_time = time.time()
 
-        # Получаем склонения имени для замены местоимений
+        # Склонения имени нужны только после анализа — получаем их параллельно с его шагами
         logger.info(f"📝 Получаю склонения для имени: {user_sessions[user_id].username}")
-        name_declensions = get_name_declensions_gpt(user_sessions[user_id].username)
+        declension_task = asyncio.create_task(
+            get_name_declensions_async(user_sessions[user_id].username, user_id=user_id)
+        )
+
+        try:
+            # Выполняем анализ через multi-step MetaMethod analyzer
+            analysis_result, usage_info = await analyze_with_metamethod(
+                user_sessions[user_id].request_text,
+                user_sessions[user_id].username,
+                user_id=user_id
+            )
+            name_declensions = await declension_task
+        finally:
+            declension_task.cancel()
+
         user_sessions[user_id].name_declensions = name_declensions
         logger.info(f"✅ Склонения получены: {name_declensions}")
 
-        # Выполняем анализ через multi-step MetaMethod analyzer
-        analysis_result, usage_info = await analyze_with_metamethod(
-            user_sessions[user_id].request_text,
-            user_sessions[user_id].username
-        )
-
         # Заменяем местоимения на склонённые формы имени
         logger.info("🔄 Заменяю местоимения на склонённое имя...")
-        analysis_result = replace_pronouns_with_name(analysis_result, name_declensions)
+        analysis_result = analysis_result.map_text(
+            lambda text: replace_pronouns_with_name(text, name_declensions)
+        )
 
         processing_time = int(time.time() - start_time)
 
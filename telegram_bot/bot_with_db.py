@@ -17,9 +17,9 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-from openai import OpenAI
 from pdf_generator_with_background import generate_pdf
-from config import TELEGRAM_TOKEN, OPENAI_API_KEY, OPENAI_MODEL
+from config import TELEGRAM_TOKEN, OPENAI_MODEL
+from openai_clients import get_openai_client
 from database import get_db
 from metamethod_analyzer import analyze_with_metamethod
 
@@ -31,7 +31,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Инициализация OpenAI клиента
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_openai_client()
 
 # Инициализация БД
 db = get_db()
@@ -17,9 +17,9 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-from openai import OpenAI
 from pdf_generator_with_background import generate_pdf
-from config import TELEGRAM_TOKEN, OPENAI_API_KEY, OPENAI_MODEL
+from config import TELEGRAM_TOKEN, OPENAI_MODEL
+from openai_clients import get_openai_client
 from database import get_db
 from metamethod_analyzer import analyze_with_metamethod
 from name_helper import extract_name_from_request, get_name_declensions_gpt, replace_pronouns_with_name
@@ -32,7 +32,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Инициализация OpenAI клиента
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = get_openai_client()
 
 # Инициализация БД
 db = get_db()
@@ -4,6 +4,7 @@ Telegram Bot для анализа фото по Мета-Методу с вор
 """
 
 import os
+import re
 import logging
 import time
 from datetime import datetime, timedelta
@@ -17,13 +18,21 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-from openai import OpenAI
-from pdf_generator_with_background import generate_pdf
-from config import TELEGRAM_TOKEN, OPENAI_API_KEY, OPENAI_MODEL
+from pdf_pool import get_pdf_pool
+import config
+from config import TELEGRAM_TOKEN, OPENAI_MODEL
+from openai_clients import get_openai_client, aclose_openai_clients
 from database import get_db
-from metamethod_analyzer import analyze_with_metamethod
+from metamethod_analyzer import (
+    analyze_with_metamethod, stage_latency_percentiles, AnalysisDeadlineError, DEFAULT_ANALYSIS_MODE
+)
+from scan_checkpoint import ScanCheckpoint
+from speculative_scan import SpeculativeRun
+from analysis_queue import get_analysis_queue, lane_for, lane_wait_percentiles
 from sales_funnel_texts import *
-from name_helper import extract_name_from_request, get_name_declensions_gpt, replace_pronouns_with_name
+from name_helper import extract_name_from_request, get_name_declensions_async, replace_pronouns_with_name
+from declension_cache import get_declension_cache
+from update_processor import PerUserUpdateProcessor
 import asyncio
 
 # Настройка логирования
@@ -33,8 +42,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация OpenAI клиента
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Общий OpenAI клиент процесса (тот же пул соединений, что у анализатора и склонений)
+client = get_openai_client()
 
 # Инициализация БД
 db = get_db()
@@ -47,7 +56,7 @@ db = get_db()
 class UserSession:
     """Хранит данные сессии пользователя"""
     def __init__(self):
-        self.photo_path = None
+        self.photo = None  # Байты фото: скачано в память, на диск не пишется
         self.request_text = None
         self.username = None
         self.start_time = None
@@ -57,11 +66,55 @@ class UserSession:
         self.last_funnel_message_time = None
         self.scans_count = 0  # Количество доступных сканирований
         self.subscription_type = None  # '1scan', '3scans', 'year', 'vip'
+        self.speculation = None  # SpeculativeRun: шаги 1-4 по запросу, пока ждём имя или фото
 
 
 # Словарь для хранения сессий пользователей
 user_sessions = {}
 
+# Не чаще раза в N секунд правим сообщение о прогрессе (лимиты Telegram на edit)
+PROGRESS_EDIT_INTERVAL = 3
+
+# Соединений с Telegram Bot API: обработчики разных пользователей работают параллельно
+# (у python-telegram-bot по умолчанию одно соединение на все вызовы бота)
+TELEGRAM_CONNECTION_POOL_SIZE = getattr(config, 'TELEGRAM_CONNECTION_POOL_SIZE', 32)
+
+# Сканы, прерванные остановкой бота, продолжаем при запуске, если им не больше N часов
+SCAN_RESUME_MAX_AGE_HOURS = 24
+
+# Продолжаемые сканы: ссылки на задачи, чтобы их не собрал GC посреди скана
+_resumed_scans = set()
+
+# Копия каждого PDF на диске для архива; None — PDF только в памяти и в Telegram
+PDF_ARCHIVE_DIR = getattr(config, 'PDF_ARCHIVE_DIR', None)
+
+# Заголовок раздела в финальном разборе: **3. Энергоцентры (Чакры) и поток энергии**
+SECTION_HEADING_RE = re.compile(r'\*\*(\d+)\.\s*([^*\n]+?)\*\*')
+
+
+def speculate(user_id: int):
+    """Запускает шаги 1-4 по уже известному запросу, пока бот ждёт имя или фото"""
+    session = user_sessions[user_id]
+    if session.speculation and session.speculation.matches(session.request_text, DEFAULT_ANALYSIS_MODE):
+        return
+    discard_speculation(user_id, 'changed')
+
+    # Только для тех, кто сможет запустить скан, — иначе платим за шаги, которые не пригодятся
+    if session.payment_status not in ['paid', 'free'] or session.scans_count <= 0:
+        return
+    # Сканы ждут места в очереди — не отнимаем у них бюджет модели
+    if get_analysis_queue().waiting_count():
+        return
+    session.speculation = SpeculativeRun.start(db, session.request_text, user_id, DEFAULT_ANALYSIS_MODE)
+
+
+def discard_speculation(user_id: int, reason: str):
+    """Отменяет спекулятивные шаги пользователя (changed / abandoned)"""
+    session = user_sessions.get(user_id)
+    if session and session.speculation:
+        session.speculation.cancel(reason)
+        session.speculation = None
+
 
 # ===== ВОРОНКА ПРОДАЖ =====
 
@@ -72,6 +125,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     telegram_username = update.effective_user.username
     last_name = update.effective_user.last_name
 
+    # Начали заново — спекулятивные шаги прошлой сессии не понадобятся
+    discard_speculation(user_id, 'abandoned')
+
     # Проверяем deep link параметр
     start_param = context.args[0] if context.args else None
 
@@ -425,17 +481,9 @@ async def receive_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
         await update.message.reply_text("Перейти к тарифам:", reply_markup=reply_markup)
         return ConversationHandler.END
 
-    # Получаем фото лучшего качества
+    # Получаем фото лучшего качества — в память, в БД оно попадёт при регистрации скана
     photo_file = await update.message.photo[-1].get_file()
-
-    # Создаём папку для фото, если её нет
-    os.makedirs('user_photos', exist_ok=True)
-
-    # Сохраняем фото
-    photo_path = f'user_photos/{user_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg'
-    await photo_file.download_to_drive(photo_path)
-
-    user_sessions[user_id].photo_path = photo_path
+    user_sessions[user_id].photo = bytes(await photo_file.download_as_bytearray())
 
     # Проверяем, есть ли подпись к фото (caption)
     caption = update.message.caption
@@ -458,7 +506,8 @@ async def receive_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
             return await process_analysis(update, context, processing_msg)
         else:
-            # Имя не найдено - просим ввести
+            # Имя не найдено - просим ввести, а шаги 1-4 запускаем уже сейчас
+            speculate(user_id)
             await update.message.reply_text(
                 "Для персонализации анализа, пожалуйста, напиши своё имя.\n\n"
                 "Например: Анна, Дмитрий, Мария"
@@ -480,7 +529,7 @@ async def receive_request(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Получение текстового запроса и проверка имени"""
     user_id = update.effective_user.id
 
-    if user_id not in user_sessions or not user_sessions[user_id].photo_path:
+    if user_id not in user_sessions or not user_sessions[user_id].photo:
         await update.message.reply_text(
             "Сначала отправь фото! Используй /start для начала."
         )
@@ -497,7 +546,8 @@ async def receive_request(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.info(f"✅ Имя извлечено из запроса: {extracted_name}")
         return await start_analysis(update, context, user_id)
     else:
-        # Имя не найдено - просим ввести
+        # Имя не найдено - просим ввести, а шаги 1-4 запускаем уже сейчас
+        speculate(user_id)
         await update.message.reply_text(
             "Для персонализации анализа, пожалуйста, напиши своё имя.\n\n"
             "Например: Анна, Дмитрий, Мария"
@@ -512,6 +562,9 @@ async def handle_text_without_photo(update: Update, context: ContextTypes.DEFAUL
     if user_id in user_sessions:
         user_sessions[user_id].request_text = update.message.text
 
+        # Запрос известен — шаги 1-4 считаются, пока ждём фото (и имя)
+        speculate(user_id)
+
         # Пробуем извлечь имя из запроса
         extracted_name = extract_name_from_request(update.message.text)
 
@@ -549,13 +602,9 @@ async def handle_photo_after_request(update: Update, context: ContextTypes.DEFAU
         )
         return ConversationHandler.END
 
-    # Получаем фото
+    # Получаем фото (в память)
     photo_file = await update.message.photo[-1].get_file()
-    os.makedirs('user_photos', exist_ok=True)
-    photo_path = f'user_photos/{user_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg'
-    await photo_file.download_to_drive(photo_path)
-
-    user_sessions[user_id].photo_path = photo_path
+    user_sessions[user_id].photo = bytes(await photo_file.download_as_bytearray())
 
     processing_msg = await update.message.reply_text(
         "⏳ Провожу глубокий многоуровневый анализ...\n"
@@ -582,7 +631,7 @@ async def receive_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     logger.info(f"✅ Имя получено отдельно: {name}")
 
     # Проверяем, есть ли уже фото
-    if user_sessions[user_id].photo_path:
+    if user_sessions[user_id].photo:
         # Фото уже есть - запускаем анализ
         return await start_analysis(update, context, user_id)
     else:
@@ -604,116 +653,409 @@ async def start_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE, use
     return await process_analysis(update, context, processing_msg)
 
 
-async def process_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE, processing_msg) -> int:
-    """Выполнение анализа и отправка результата"""
-    user_id = update.effective_user.id
+class AnalysisProgress:
+    """
+    Показывает пользователю реальный прогресс анализа в сообщении processing_msg.
+    Получает события этапов от анализатора и стрим финальной компоновки,
+    правит сообщение не чаще раза в PROGRESS_EDIT_INTERVAL секунд.
+    """
+    def __init__(self, processing_msg):
+        self.processing_msg = processing_msg
+        self.stage_titles = {}  # step -> название, приходит в событии pipeline_started
+        self.stage_status = {}  # step -> running / done / restored (готов с прошлой попытки)
+        self.stage_durations = {}
+        self.composition_text = ''
+        self.queue_position = None  # место в очереди сканов или планировщика, пока ждём
+        self.last_edit_time = 0
+
+    async def on_progress(self, event: dict):
+        """Событие начала/конца этапа от анализатора"""
+        if event['type'] == 'pipeline_started':
+            self.stage_titles = dict(zip(event['steps'], event['titles']))
+        elif event['type'] == 'stage_restored':
+            self.stage_status[event['step']] = 'restored'
+        elif event['type'] == 'queued':
+            self.queue_position = event['position']
+        elif event['type'] == 'stage_started':
+            self.stage_status[event['step']] = 'running'
+            self.queue_position = None
+        elif event['type'] == 'stage_finished':
+            self.stage_status[event['step']] = 'done'
+            self.stage_durations[event['step']] = event['duration']
+        await self.refresh()
+
+    async def on_queue_position(self, position: int):
+        """Позиция скана в очереди, пока он ждёт места"""
+        self.queue_position = position
+        await self.refresh()
+
+    async def on_composition_delta(self, text: str):
+        """Очередной фрагмент стрима финальной компоновки"""
+        self.composition_text = text
+        await self.refresh()
+
+    async def refresh(self):
+        """Правит сообщение, если с прошлой правки прошло достаточно времени"""
+        now = time.time()
+        if now - self.last_edit_time < PROGRESS_EDIT_INTERVAL:
+            return
+        self.last_edit_time = now
 
-    try:
-        start_time = time.time()
+        try:
+            await self.processing_msg.edit_text(self.render())
+        except Exception as e:
+            # Например, 'Message is not modified' — на анализ не влияет
+            logger.debug(f"Не удалось обновить сообщение о прогрессе: {e}")
+
+    def render(self) -> str:
+        """Текст сообщения о прогрессе"""
+        lines = ["⏳ Провожу глубокий многоуровневый анализ...\n"]
+
+        if self.queue_position:
+            lines.append(f"🕐 Сейчас много сканирований, ты в очереди: {self.queue_position}-я\n")
+
+        for step, title in self.stage_titles.items():
+            status = self.stage_status.get(step)
+            if status == 'done':
+                lines.append(f"✅ {title} — {self.stage_durations[step]:.0f}с")
+            elif status == 'restored':
+                lines.append(f"✅ {title} — готово ранее")
+            elif status == 'running':
+                lines.append(f"🔄 {title}...")
+            else:
+                lines.append(f"▫️ {title}")
 
-        # Получаем склонения имени для замены местоимений
-        logger.info(f"📝 Получаю склонения для имени: {user_sessions[user_id].username}")
-        name_declensions = get_name_declensions_gpt(user_sessions[user_id].username)
-        user_sessions[user_id].name_declensions = name_declensions
-        logger.info(f"✅ Склонения получены: {name_declensions}")
+        if self.composition_text:
+            sections = SECTION_HEADING_RE.findall(self.composition_text)
+            if sections:
+                number, section_title = sections[-1]
+                lines.append(f"\n✍️ Раздел {number} из 8: {section_title.strip()}")
+            lines.append(f"Написано {len(self.composition_text)} символов")
 
-        # Выполняем анализ
-        analysis_result, usage_info = await analyze_with_metamethod(
-            user_sessions[user_id].request_text,
-            user_sessions[user_id].username
-        )
+        return '\n'.join(lines)
 
-        # Заменяем местоимения на склонённые формы имени
-        logger.info("🔄 Заменяю местоимения на склонённое имя...")
-        analysis_result = replace_pronouns_with_name(analysis_result, name_declensions)
 
-        processing_time = int(time.time() - start_time)
+async def timed(coro) -> tuple:
+    """(результат корутины, секунды её выполнения)"""
+    started = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - started
 
-        # Генерируем PDF
-        safe_filename = f"analysis_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        pdf_path = generate_pdf(
-            analysis_result,
-            user_sessions[user_id].username,
-            output_path=safe_filename
-        )
 
-        # Сохраняем в БД
-        analysis_id = db.save_analysis(
+async def run_scan(bot, scan: dict, processing_msg) -> tuple:
+    """
+    Скан по записи analysis_scans: очередь → склонение имени → анализ → PDF → БД → отправка PDF.
+    Ответ модели каждого шага сохраняется в чекпоинт, готовые шаги повторно не вызываются.
+    Возвращает (analysis_id, processing_time)
+    """
+    user_id = scan['user_id']
+    start_time = time.time()
+
+    # Показываем реальный прогресс этапов и стрима компоновки
+    progress = AnalysisProgress(processing_msg)
+
+    # Место в очереди сканов — по полосе тарифа (vip → paid → free)
+    lane = scan['priority_lane'] or 'paid'
+    async with get_analysis_queue().slot(lane, on_position=progress.on_queue_position) as queue_ticket:
+        progress.queue_position = None
+
+        # Склонения имени нужны только для замены местоимений после анализа —
+        # получаем их параллельно с шагами анализа
+        logger.info(f"📝 Получаю склонения для имени: {scan['username']}")
+        declension_task = asyncio.create_task(timed(
+            get_name_declensions_async(scan['username'], user_id=user_id)
+        ))
+
+        try:
+            # Выполняем анализ (шаги, готовые с прошлой попытки, берутся из чекпоинта)
+            analysis_started = time.perf_counter()
+            analysis_result, usage_info = await analyze_with_metamethod(
+                scan['request_text'],
+                scan['username'],
+                on_composition_delta=progress.on_composition_delta,
+                on_progress=progress.on_progress,
+                mode=scan['analysis_mode'],
+                user_id=user_id,
+                checkpoint=ScanCheckpoint(db, scan['id'])
+            )
+            analysis_seconds = time.perf_counter() - analysis_started
+
+            name_declensions, declension_seconds = await declension_task
+        finally:
+            declension_task.cancel()
+
+    if user_id in user_sessions:
+        user_sessions[user_id].name_declensions = name_declensions
+    logger.info(f"✅ Склонения получены: {name_declensions}")
+    # Последовательно склонение добавило бы к скану свою длительность целиком
+    logger.info(
+        f"⏱ Склонение {declension_seconds:.2f}с параллельно анализу {analysis_seconds:.2f}с "
+        f"(сэкономлено {min(declension_seconds, analysis_seconds):.2f}с)"
+    )
+
+    # Заменяем местоимения на склонённые формы имени
+    logger.info("🔄 Заменяю местоимения на склонённое имя...")
+    analysis_result = analysis_result.map_text(
+        lambda text: replace_pronouns_with_name(text, name_declensions)
+    )
+
+    processing_time = int(time.time() - start_time)
+    logger.info(f"📈 Латентность этапов (p50/p95): {stage_latency_percentiles()}")
+    logger.info(f"🚥 Ожидание в очереди по полосам (p50/p95): {lane_wait_percentiles()}")
+
+    # Генерируем PDF в памяти; на диск — только копия для архива, если задан PDF_ARCHIVE_DIR
+    pdf_bytes = await get_pdf_pool().render_bytes(analysis_result, scan['username'])
+    pdf_path = archive_pdf(pdf_bytes, user_id)
+
+    # Сохраняем в БД (psycopg2 синхронный — в потоке, цикл событий не ждёт БД).
+    # analysis_id пишется в скан той же транзакцией: продолжение скана после падения
+    # здесь берёт уже сохранённый анализ, а не вставляет второй
+    analysis_id = scan['analysis_id']
+    if analysis_id is None:
+        analysis_id = await asyncio.to_thread(
+            db.save_analysis,
             user_id=user_id,
-            photo_path=user_sessions[user_id].photo_path,
-            request_text=user_sessions[user_id].request_text,
+            photo_path=scan['photo_path'],
+            request_text=scan['request_text'],
             analysis_result=analysis_result,
             pdf_path=pdf_path,
             processing_time=processing_time,
             tokens_used=usage_info["total_tokens"],
             api_cost_usd=usage_info["cost_usd"],
-            model_used=OPENAI_MODEL
+            model_used=OPENAI_MODEL,
+            priority_lane=lane,
+            queue_wait_seconds=queue_ticket.wait,
+            scan_id=scan['id']
         )
+    else:
+        logger.info(f"♻️ Скан #{scan['id']}: анализ #{analysis_id} уже сохранён, повторно не записываю")
+
+    await asyncio.to_thread(db.attach_scan_photo, scan['id'], analysis_id)
+    if scan['photo_path'] and os.path.exists(scan['photo_path']):
+        # Скан зарегистрирован до перехода на фото в памяти — фото ещё лежит в user_photos/
+        await asyncio.to_thread(db.save_photo_base64, analysis_id, scan['photo_path'])
+        os.remove(scan['photo_path'])
+
+    # До отправки: если бот упадёт между отправкой и mark_scan_done, после перезапуска
+    # скан не пойдёт заново и PDF не придёт пользователю второй раз
+    await asyncio.to_thread(db.mark_scan_sending, scan['id'], analysis_id)
+
+    # Отправляем PDF прямо из памяти
+    await bot.send_document(
+        chat_id=scan['chat_id'],
+        document=pdf_bytes,
+        filename=f"Сканер_подсознания_{scan['username']}.pdf",
+        caption="✨ Твой персональный Сканер подсознания готов!\n\n"
+                "Работай с трансформационными фразами каждый день. 🙏"
+    )
 
-        db.save_photo_base64(analysis_id, user_sessions[user_id].photo_path)
+    await asyncio.to_thread(db.mark_scan_done, scan['id'], analysis_id)
+    await processing_msg.delete()
 
-        # Отправляем PDF
-        with open(pdf_path, 'rb') as pdf_file:
-            await update.message.reply_document(
-                document=pdf_file,
-                filename=f"Сканер_подсознания_{user_sessions[user_id].username}.pdf",
-                caption="✨ Твой персональный Сканер подсознания готов!\n\n"
-                        "Работай с трансформационными фразами каждый день. 🙏"
-            )
+    return analysis_id, processing_time
 
-        await processing_msg.delete()
 
-        # Уменьшаем счётчик доступных сканирований
-        user_sessions[user_id].scans_count -= 1
+def archive_pdf(pdf_bytes: bytes, user_id: int):
+    """Копия PDF в PDF_ARCHIVE_DIR (путь для analyses.pdf_path); без архива — None"""
+    if not PDF_ARCHIVE_DIR:
+        return None
+    try:
+        os.makedirs(PDF_ARCHIVE_DIR, exist_ok=True)
+        pdf_path = os.path.join(PDF_ARCHIVE_DIR, f"analysis_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+        with open(pdf_path, 'wb') as pdf_file:
+            pdf_file.write(pdf_bytes)
+        return pdf_path
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить PDF в архив: {e}")
+        return None
+
+
+async def adopt_speculation(session: UserSession, scan_id: int):
+    """Переносит спекулятивные шаги 1-4 в чекпоинт скана, если они считались по тому же запросу"""
+    speculation, session.speculation = session.speculation, None
+    if speculation is None:
+        return
+    if not speculation.matches(session.request_text, DEFAULT_ANALYSIS_MODE):
+        speculation.cancel('changed')
+        return
+    try:
+        await speculation.adopt(ScanCheckpoint(db, scan_id))
+    except Exception as e:
+        # Скан просто сам посчитает эти шаги
+        logger.warning(f"⚠️ Не удалось использовать спекулятивные шаги: {e}")
 
-        # Очищаем файлы
+
+async def report_scan_error(scan_id, processing_msg, error: Exception):
+    """
+    Сообщает об ошибке скана. Готовые шаги остаются в чекпоинте —
+    кнопка "Продолжить анализ" доделает только недостающие
+    """
+    reply_markup = None
+    if scan_id is not None:
         try:
-            if os.path.exists(user_sessions[user_id].photo_path):
-                os.remove(user_sessions[user_id].photo_path)
-            if os.path.exists(pdf_path):
-                os.remove(pdf_path)
+            db.mark_scan_failed(scan_id, error)
         except Exception as e:
-            logger.warning(f"Ошибка при удалении файлов: {e}")
+            logger.error(f"Не удалось отметить ошибку скана #{scan_id}: {e}")
+        keyboard = [[InlineKeyboardButton("🔁 Продолжить анализ", callback_data=f"resume_scan:{scan_id}")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
 
-        # Предлагаем новый анализ
-        remaining = user_sessions[user_id].scans_count
-        if remaining > 0:
-            keyboard = [[InlineKeyboardButton("Провести новый анализ", callback_data="new_analysis")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+    if isinstance(error, AnalysisDeadlineError):
+        # Скан не уложился в общий дедлайн даже с повторами — сканирование не списываем
+        logger.error(f"Analysis deadline exceeded: {error}")
+        text = (
+            "⏳ Сейчас анализ идёт дольше обычного и не успел завершиться.\n"
+            "Сканирование не списано — попробуй продолжить через несколько минут."
+        )
+    else:
+        logger.error(f"Error during analysis: {error}")
+        text = (
+            f"❌ Произошла ошибка при анализе.\n"
+            f"Готовые этапы сохранены — нажми «Продолжить анализ» или начни заново через /start\n\n"
+            f"Ошибка: {str(error)}"
+        )
 
-            await update.message.reply_text(
-                f"У тебя осталось {remaining} сканирований.\n"
-                f"Хочешь провести ещё один анализ?",
-                reply_markup=reply_markup
-            )
+    try:
+        await processing_msg.edit_text(text, reply_markup=reply_markup)
+    except Exception as e:
+        logger.warning(f"Не удалось показать ошибку анализа: {e}")
 
-            logger.info(f"✅ Анализ #{analysis_id} завершён для {user_id} за {processing_time}с")
-            # Не завершаем диалог, чтобы кнопка работала
-            return WAITING_FOR_PHOTO
-        else:
-            keyboard = [[InlineKeyboardButton("💫 Купить ещё сканирования", url=PAYMENT_URL)]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
 
-            await update.message.reply_text(
-                "Это было твоё последнее доступное сканирование 🌿\n"
-                "Приобрети новый пакет для продолжения работы:",
-                reply_markup=reply_markup
-            )
+async def process_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE, processing_msg) -> int:
+    """Выполнение анализа и отправка результата"""
+    user_id = update.effective_user.id
+    session = user_sessions[user_id]
+    scan_id = None
 
-            logger.info(f"✅ Анализ #{analysis_id} завершён для {user_id} за {processing_time}с. Сканы закончились.")
-            # Завершаем диалог, так как сканы закончились
-            return ConversationHandler.END
+    try:
+        # Регистрируем скан до первого вызова модели — его шаги пишутся в чекпоинт
+        scan_id = db.create_scan(
+            user_id=user_id,
+            chat_id=update.effective_chat.id,
+            username=session.username,
+            request_text=session.request_text,
+            analysis_mode=DEFAULT_ANALYSIS_MODE,
+            priority_lane=lane_for(session.subscription_type, session.payment_status)
+        )
+        # Фото — в БД сразу: скан, продолжаемый после перезапуска, найдёт его там
+        if session.photo:
+            db.save_scan_photo(scan_id, session.photo)
+        await adopt_speculation(session, scan_id)
+        analysis_id, processing_time = await run_scan(context.bot, db.get_scan(scan_id), processing_msg)
 
     except Exception as e:
-        logger.error(f"Error during analysis: {e}")
-        await processing_msg.edit_text(
-            f"❌ Произошла ошибка при анализе.\n"
-            f"Попробуй ещё раз через /start\n\n"
-            f"Ошибка: {str(e)}"
+        await report_scan_error(scan_id, processing_msg, e)
+        return ConversationHandler.END
+
+    # Уменьшаем счётчик доступных сканирований
+    session.scans_count -= 1
+
+    # Предлагаем новый анализ
+    remaining = session.scans_count
+    if remaining > 0:
+        keyboard = [[InlineKeyboardButton("Провести новый анализ", callback_data="new_analysis")]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        await update.effective_message.reply_text(
+            f"У тебя осталось {remaining} сканирований.\n"
+            f"Хочешь провести ещё один анализ?",
+            reply_markup=reply_markup
         )
+
+        logger.info(f"✅ Анализ #{analysis_id} завершён для {user_id} за {processing_time}с")
+        # Не завершаем диалог, чтобы кнопка работала
+        return WAITING_FOR_PHOTO
+    else:
+        keyboard = [[InlineKeyboardButton("💫 Купить ещё сканирования", url=PAYMENT_URL)]]
+        reply_markup = InlineKeyboardMarkup(keyboard)
+
+        await update.effective_message.reply_text(
+            "Это было твоё последнее доступное сканирование 🌿\n"
+            "Приобрети новый пакет для продолжения работы:",
+            reply_markup=reply_markup
+        )
+
+        logger.info(f"✅ Анализ #{analysis_id} завершён для {user_id} за {processing_time}с. Сканы закончились.")
+        # Завершаем диалог, так как сканы закончились
         return ConversationHandler.END
 
 
+async def continue_scan(bot, scan: dict, processing_msg):
+    """
+    Продолжает скан с последнего готового шага (повтор после ошибки или перезапуска бота).
+    Скан уже должен быть снова в статусе running (db.restart_scan)
+    """
+    try:
+        analysis_id, processing_time = await run_scan(bot, scan, processing_msg)
+    except Exception as e:
+        await report_scan_error(scan['id'], processing_msg, e)
+        return
+
+    if scan['user_id'] in user_sessions:
+        user_sessions[scan['user_id']].scans_count -= 1
+    logger.info(f"✅ Скан #{scan['id']} продолжен: анализ #{analysis_id} за {processing_time}с")
+
+
+async def resume_scan_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Кнопка "Продолжить анализ" после ошибки"""
+    query = update.callback_query
+    await query.answer()
+
+    scan_id = int(query.data.split(':', 1)[1])
+    scan = db.get_scan(scan_id)
+
+    if not scan or scan['user_id'] != query.from_user.id:
+        await query.message.reply_text("Не нашла этот анализ 😔 Начни заново: /start")
+        return ConversationHandler.END
+    if scan['status'] == 'done':
+        await query.message.reply_text("Этот анализ уже готов и отправлен ✨")
+        return ConversationHandler.END
+    if scan['status'] in ('running', 'sending'):
+        await query.message.reply_text("Анализ уже продолжается, подожди немного ⏳")
+        return ConversationHandler.END
+
+    # Сразу в running — повторное нажатие кнопки не запустит второй скан
+    db.restart_scan(scan_id)
+    await query.edit_message_reply_markup(reply_markup=None)
+    processing_msg = await query.message.reply_text("⏳ Продолжаю анализ с места остановки...")
+    await continue_scan(context.bot, scan, processing_msg)
+    return ConversationHandler.END
+
+
+def _resumed_scan_done(task: asyncio.Task):
+    """Задача продолжения скана завершилась: отпускаем ссылку, неожиданную ошибку — в лог"""
+    _resumed_scans.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"❌ Продолжение скана упало: {task.exception()!r}")
+
+
+async def resume_interrupted_scans(application: Application):
+    """Сканы, которые шли, когда бот остановился, продолжаются для их пользователей"""
+    scans = db.get_interrupted_scans(SCAN_RESUME_MAX_AGE_HOURS)
+    for scan in scans:
+        if scan['status'] == 'sending':
+            # Анализ сохранён, PDF мог уже уйти — повторно не отправляем
+            logger.warning(f"⚠️ Скан #{scan['id']}: бот остановился во время отправки PDF, "
+                           f"анализ #{scan['analysis_id']} повторно не отправляется")
+            db.mark_scan_done(scan['id'], scan['analysis_id'])
+            continue
+        try:
+            processing_msg = await application.bot.send_message(
+                chat_id=scan['chat_id'],
+                text="🔄 Бот перезапускался — продолжаю твой анализ с места остановки ⏳"
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось продолжить скан #{scan['id']}: {e}")
+            db.mark_scan_failed(scan['id'], e)
+            continue
+        db.restart_scan(scan['id'])
+        task = asyncio.create_task(continue_scan(application.bot, scan, processing_msg))
+        _resumed_scans.add(task)
+        task.add_done_callback(_resumed_scan_done)
+
+    if scans:
+        logger.info(f"♻️ Продолжаю прерванные сканы: {len(scans)}")
+
+
 # ===== ПРОВЕРКА БЕСПЛАТНОГО ДОСТУПА =====
 
 async def check_free_access_email(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -870,13 +1212,16 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return await check_payment(update, context)
     elif query.data == 'retry_email':
         return await retry_email_input(update, context)
+    elif query.data.startswith('resume_scan:'):
+        return await resume_scan_callback(update, context)
     elif query.data == "new_analysis":
         await query.answer()
         user_id = query.from_user.id
         username = query.from_user.first_name or "Друг"
 
         if user_id in user_sessions:
-            user_sessions[user_id].photo_path = None
+            discard_speculation(user_id, 'abandoned')
+            user_sessions[user_id].photo = None
             user_sessions[user_id].request_text = None
             user_sessions[user_id].username = None
 
@@ -891,15 +1236,44 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена текущей операции"""
+    discard_speculation(update.effective_user.id, 'abandoned')
     await update.message.reply_text(
         "Операция отменена. Используй /start чтобы начать заново."
     )
     return ConversationHandler.END
 
 
+async def post_init(application: Application):
+    """Прогреваем пул рендера PDF и продолжаем сканы, прерванные прошлой остановкой бота"""
+    try:
+        await get_pdf_pool().start()
+    except Exception as e:
+        logger.error(f"Ошибка при запуске пула PDF: {e}")
+    try:
+        await resume_interrupted_scans(application)
+    except Exception as e:
+        logger.error(f"Ошибка при продолжении прерванных сканов: {e}")
+
+
+async def post_shutdown(application: Application):
+    """Закрываем пулы соединений с OpenAI и рендера PDF, дописываем кэш склонений при остановке бота"""
+    await get_declension_cache().aflush()
+    get_pdf_pool().shutdown()
+    await aclose_openai_clients()
+
+
 def main():
     """Запуск бота"""
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        # Скан одного пользователя не задерживает ответы другим; сообщения одного пользователя — по порядку
+        .concurrent_updates(PerUserUpdateProcessor())
+        .connection_pool_size(TELEGRAM_CONNECTION_POOL_SIZE)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     conv_handler = ConversationHandler(
         entry_points=[
@@ -935,6 +1309,8 @@ def main():
     )
 
     application.add_handler(conv_handler)
+    # "Продолжить анализ" — после ошибки диалог уже завершён, поэтому кнопка вне conv_handler
+    application.add_handler(CallbackQueryHandler(resume_scan_callback, pattern=r'^resume_scan:'))
 
     logger.info("🤖 Мета Лиза запущена с воронкой продаж!")
     logger.info(f"📊 Модель: {OPENAI_MODEL}")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Сравнение режимов анализа на фиксированном наборе запросов
+
+Для каждого режима (ANALYSIS_MODES) прогоняет одни и те же запросы через реальный API
+и печатает время, токены и стоимость на скан. Тексты разборов сохраняются
+в mode_comparison/ — чтобы сравнить качество глазами.
+
+Запуск: python compare_analysis_modes.py [режим ...]
+"""
+
+import asyncio
+import os
+import sys
+import time
+from tabulate import tabulate
+
+from metamethod_analyzer import MetaMethodAnalyzer, ANALYSIS_MODES
+
+OUTPUT_DIR = 'mode_comparison'
+
+# Фиксированный набор запросов — по одному на каждую сферу
+REQUESTS = [
+    ("Анна", "Не хватает финансов, хочу выйти на новый уровень дохода"),
+    ("Мария", "Хочу встретить свою судьбу и построить счастливые отношения"),
+    ("Дмитрий", "Хочу реализоваться и перестать бояться проявляться публично"),
+    ("Елена", "Постоянная усталость и выгорание, нет сил ни на что"),
+    ("Ольга", "Что блокирует мой бизнес? Всё время откладываю запуск"),
+]
+
+
+async def run_mode(mode: str) -> list:
+    """Прогоняет все запросы в одном режиме, возвращает строки таблицы"""
+    analyzer = MetaMethodAnalyzer(mode=mode)
+    rows = []
+
+    for index, (username, request_text) in enumerate(REQUESTS, 1):
+        started = time.perf_counter()
+        analysis, usage_info = await analyzer.analyze_async(request_text, username)
+        elapsed = time.perf_counter() - started
+
+        with open(os.path.join(OUTPUT_DIR, f'{mode}_{index}.md'), 'w', encoding='utf-8') as f:
+            f.write(analysis.text)
+
+        rows.append({
+            'mode': mode,
+            'seconds': elapsed,
+            'total_tokens': usage_info['total_tokens'],
+            'completion_tokens': usage_info['completion_tokens'],
+            'cost_usd': usage_info['cost_usd'],
+            'chars': len(analysis.text),
+        })
+        print(f"  {mode} #{index}: {elapsed:.1f}с, {usage_info['total_tokens']} токенов")
+
+    return rows
+
+
+def print_summary(rows: list):
+    """Средние значения на скан по каждому режиму"""
+    table = []
+    for mode in dict.fromkeys(row['mode'] for row in rows):
+        mode_rows = [row for row in rows if row['mode'] == mode]
+        count = len(mode_rows)
+        table.append([
+            mode,
+            count,
+            f"{sum(r['seconds'] for r in mode_rows) / count:.1f}с",
+            f"{sum(r['total_tokens'] for r in mode_rows) // count:,}",
+            f"{sum(r['completion_tokens'] for r in mode_rows) // count:,}",
+            f"${sum(r['cost_usd'] for r in mode_rows) / count:.4f}",
+            f"{sum(r['chars'] for r in mode_rows) // count:,}",
+        ])
+
+    headers = ["Режим", "Сканов", "Время/скан", "Токены/скан", "Completion/скан", "Стоимость/скан", "Символов"]
+    print("\n" + "="*60)
+    print("⚖️ СРАВНЕНИЕ РЕЖИМОВ АНАЛИЗА")
+    print("="*60)
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    print(f"\nТексты разборов сохранены в {OUTPUT_DIR}/")
+
+
+async def main(modes: list):
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    rows = []
+    for mode in modes:
+        print(f"▶️ Режим {mode}")
+        rows.extend(await run_mode(mode))
+
+    print_summary(rows)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(sys.argv[1:] or list(ANALYSIS_MODES)))
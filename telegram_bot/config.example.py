@@ -10,6 +10,58 @@ TELEGRAM_TOKEN = "1234567890:ABCdefGHIjklMNOpqrsTUVwxyz"
 OPENAI_API_KEY = "sk-..."
 OPENAI_MODEL = "gpt-4o"  # или "gpt-4o-mini"
 
+# Режим анализа:
+# "llm" — шаг 5 целиком пишет модель, "assembled" — сборка локально + короткий вызов модели,
+# "structured" — весь анализ одним вызовом в JSON
+ANALYSIS_MODE = "llm"
+
+# Пул соединений с OpenAI (один на процесс, см. openai_clients.py)
+OPENAI_MAX_CONNECTIONS = 20             # Одновременных соединений
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 10   # Сколько держать открытыми между запросами
+OPENAI_CONNECT_TIMEOUT = 10.0           # Секунд на установку соединения
+OPENAI_TIMEOUT = 180.0                  # Секунд на ответ модели
+
+# Обработка апдейтов Telegram (update_processor.py): разные пользователи — параллельно, один — по порядку
+MAX_CONCURRENT_UPDATES = 256    # Апдейтов в обработке одновременно
+USER_MAX_PENDING_UPDATES = 10   # Апдейтов одного пользователя в очереди, лишние отбрасываются
+TELEGRAM_CONNECTION_POOL_SIZE = 32  # Соединений с Bot API для параллельных обработчиков
+
+# Лимиты провайдера для планировщика запросов (llm_scheduler.py) — по тарифу аккаунта OpenAI
+LLM_RPM_LIMIT = 500     # Запросов в минуту
+LLM_TPM_LIMIT = 30000   # Токенов в минуту
+
+# Очередь сканов (analysis_queue.py): полосы vip → paid → free
+ANALYSIS_MAX_CONCURRENT = 10                                  # Сканов одновременно всего
+ANALYSIS_LANE_LIMITS = {"vip": 10, "paid": 8, "free": 3}      # Сканов одновременно в полосе
+ANALYSIS_STARVATION_SECONDS = 120                             # Дольше ждать — скан идёт вне приоритета
+ANALYSIS_SPECULATIVE_LIMIT = 2                                # Спекуляций одновременно (полоса ниже free)
+
+# Общий дедлайн одного скана, секунд (таймауты и повторы шагов — StepPolicy в metamethod_analyzer.py)
+ANALYSIS_SCAN_DEADLINE = 600
+
+# Шаги 1-4 по тексту запроса считаются заранее, пока бот ждёт имя или фото (speculative_scan.py)
+SPECULATION_ENABLED = True
+SPECULATION_TTL = 1800  # Секунд ждём имя/фото, потом спекуляция отменяется
+
+# Кэш склонений имён (declension_cache.py)
+NAME_DECLENSION_CACHE_SIZE = 5000  # Имён в памяти процесса
+NAME_DECLENSION_CACHE_TTL = 3600  # Секунд до перечитывания из БД (чтобы доходили правки)
+NAME_DECLENSION_FLUSH_DELAY = 5.0  # Секунд копим новые имена перед записью в БД
+
+# Имя из текста запроса (name_extraction.py): ниже этой уверенности бот спрашивает имя
+NAME_EXTRACTION_MIN_CONFIDENCE = 0.7
+
+# Фон PDF (pdf_generator_with_background.py): None — без потерь, число — JPEG этого качества
+# (файл в несколько раз меньше и быстрее уходит в Telegram)
+PDF_BACKGROUND_JPEG_QUALITY = None
+
+# Пул процессов рендера PDF (pdf_pool.py): 0 — рендер в потоке процесса бота
+PDF_POOL_SIZE = 2
+PDF_POOL_MAX_PENDING = 4  # PDF в работе и очереди пула; остальные сканы ждут места
+
+# Папка для копий отправленных PDF (архив); None — PDF рендерится в память и на диск не пишется
+PDF_ARCHIVE_DIR = None
+
 # PostgreSQL Database
 DB_HOST = "localhost"
 DB_NAME = "metamethod_bot"
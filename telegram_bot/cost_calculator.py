@@ -6,23 +6,26 @@
 # https://openai.com/api/pricing/
 GPT4O_PRICES = {
     'gpt-4o': {
-        'prompt': 0.0025,      # $2.50 за 1M токенов = $0.0025 за 1K
-        'completion': 0.010    # $10.00 за 1M токенов = $0.010 за 1K
+        'prompt': 0.0025,          # $2.50 за 1M токенов = $0.0025 за 1K
+        'cached_prompt': 0.00125,  # $1.25 за 1M закешированных токенов промпта
+        'completion': 0.010        # $10.00 за 1M токенов = $0.010 за 1K
     },
     'gpt-4o-mini': {
-        'prompt': 0.00015,     # $0.15 за 1M токенов
-        'completion': 0.0006   # $0.60 за 1M токенов
+        'prompt': 0.00015,         # $0.15 за 1M токенов
+        'cached_prompt': 0.000075, # $0.075 за 1M закешированных токенов промпта
+        'completion': 0.0006       # $0.60 за 1M токенов
     }
 }
 
-def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
     """
     Рассчитывает стоимость запроса в USD
     
     Args:
         model: название модели (gpt-4o, gpt-4o-mini)
-        prompt_tokens: количество токенов в промпте
+        prompt_tokens: количество токенов в промпте (включая закешированные)
         completion_tokens: количество токенов в ответе
+        cached_tokens: сколько из prompt_tokens пришло из кеша провайдера (дешевле)
         
     Returns:
         float: стоимость в долларах США
@@ -34,7 +37,9 @@ def calculate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> fl
     prices = GPT4O_PRICES[model]
     
     # Переводим токены в тысячи и умножаем на цену
-    prompt_cost = (prompt_tokens / 1000) * prices['prompt']
+    # Закешированная часть промпта оплачивается по своей цене
+    uncached_tokens = prompt_tokens - cached_tokens
+    prompt_cost = (uncached_tokens / 1000) * prices['prompt'] + (cached_tokens / 1000) * prices['cached_prompt']
     completion_cost = (completion_tokens / 1000) * prices['completion']
     
     total_cost = prompt_cost + completion_cost
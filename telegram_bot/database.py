@@ -4,8 +4,9 @@
 """
 
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, Json, execute_values
 import os
+import threading
 from datetime import datetime
 import base64
 from config import (
@@ -16,13 +17,21 @@ from config import (
     POSTGRES_PASSWORD
 )
 import logging
+from analysis_result import AnalysisResult
+from name_declension import CASES
 
 logger = logging.getLogger(__name__)
 
+# Колонки таблицы chakra_scores по номеру чакры (ChakraScore.index - 1)
+CHAKRA_COLUMNS = ('muladhara', 'svadhisthana', 'manipura', 'anahata', 'vishuddha', 'ajna', 'sahasrara')
+
 
 class Database:
     def __init__(self):
         self.connection = None
+        # Чекпоинты сканов пишутся из потоков (asyncio.to_thread) — запрос и его commit/rollback
+        # не должны перемешаться с запросом из цикла событий на том же соединении
+        self._lock = threading.RLock()
         self.connect()
 
     def connect(self):
@@ -42,19 +51,20 @@ class Database:
 
     def execute(self, query, params=None, fetch=False):
         """Выполнение SQL запроса"""
-        try:
-            with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(query, params)
-                if fetch:
-                    result = cursor.fetchall()
+        with self._lock:
+            try:
+                with self.connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(query, params)
+                    if fetch:
+                        result = cursor.fetchall()
+                        self.connection.commit()
+                        return result
                     self.connection.commit()
-                    return result
-                self.connection.commit()
-                return cursor.rowcount
-        except Exception as e:
-            self.connection.rollback()
-            logger.error(f"❌ Ошибка выполнения запроса: {e}")
-            raise
+                    return cursor.rowcount
+            except Exception as e:
+                self.connection.rollback()
+                logger.error(f"❌ Ошибка выполнения запроса: {e}")
+                raise
 
     def create_or_update_user(self, user_id, username=None, first_name=None, last_name=None):
         """Создать или обновить пользователя"""
@@ -71,25 +81,89 @@ class Database:
         logger.info(f"✅ Пользователь {user_id} ({first_name}) сохранён")
 
     def save_analysis(self, user_id, photo_path, request_text, analysis_result,
-                     pdf_path, processing_time, tokens_used, model_used, api_cost_usd=None):
-        """Сохранить анализ в БД"""
+                     pdf_path, processing_time, tokens_used, model_used, api_cost_usd=None,
+                     priority_lane=None, queue_wait_seconds=None, scan_id=None):
+        """
+        Сохранить анализ в БД
+        analysis_result — AnalysisResult (текст + analysis_structured) или просто текст разбора
+        priority_lane, queue_wait_seconds — полоса очереди сканов и сколько скан ждал места
+        scan_id — скан (analysis_scans), которому в той же транзакции записывается analysis_id
+        """
+        if isinstance(analysis_result, AnalysisResult):
+            analysis_text, analysis_structured = analysis_result.text, Json(analysis_result.to_dict())
+        else:
+            analysis_text, analysis_structured = analysis_result, None
+
         query = """
             INSERT INTO analyses
-            (user_id, photo_path, request_text, analysis_result, pdf_path,
-             processing_time_seconds, tokens_used, model_used, api_cost_usd)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            (user_id, photo_path, request_text, analysis_result, analysis_structured, pdf_path,
+             processing_time_seconds, tokens_used, model_used, api_cost_usd,
+             priority_lane, queue_wait_seconds)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """
-        result = self.execute(
-            query,
-            (user_id, photo_path, request_text, analysis_result, pdf_path,
-             processing_time, tokens_used, model_used, api_cost_usd),
-            fetch=True
-        )
+        params = (user_id, photo_path, request_text, analysis_text, analysis_structured, pdf_path,
+                  processing_time, tokens_used, model_used, api_cost_usd,
+                  priority_lane, queue_wait_seconds)
+        if scan_id is not None:
+            # Один запрос — одна транзакция: анализ и ссылка на него в скане появляются вместе
+            query = f"""
+                WITH inserted AS ({query}),
+                linked AS (
+                    UPDATE analysis_scans
+                    SET analysis_id = (SELECT id FROM inserted), updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                )
+                SELECT id FROM inserted
+            """
+            params += (scan_id,)
+        result = self.execute(query, params, fetch=True)
         analysis_id = result[0]['id']
         logger.info(f"✅ Анализ #{analysis_id} сохранён для пользователя {user_id}")
+
+        # Оценки чакр — для аналитики; их ошибка не должна мешать отдать разбор пользователю
+        if isinstance(analysis_result, AnalysisResult) and analysis_result.chakras:
+            try:
+                self.save_chakra_scores_batch([(analysis_id, analysis_result.chakras)])
+            except Exception:
+                pass  # save_chakra_scores_batch уже откатил транзакцию и записал ошибку в лог
+
         return analysis_id
 
+    def save_chakra_scores_batch(self, items):
+        """
+        Сохранить проценты чакр пачкой: items = [(analysis_id, [ChakraScore, ...]), ...]
+        Повторная запись для того же анализа перезаписывает значения
+        """
+        rows = []
+        for analysis_id, chakras in items:
+            percents = [None] * len(CHAKRA_COLUMNS)
+            for chakra in chakras:
+                if 1 <= chakra.index <= len(CHAKRA_COLUMNS):
+                    percents[chakra.index - 1] = max(0, min(100, chakra.percent))
+            rows.append((analysis_id, *percents))
+
+        if not rows:
+            return 0
+
+        columns = ', '.join(CHAKRA_COLUMNS)
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in CHAKRA_COLUMNS)
+        query = f"""
+            INSERT INTO chakra_scores (analysis_id, {columns})
+            VALUES %s
+            ON CONFLICT (analysis_id) DO UPDATE SET {updates}
+        """
+        with self._lock:
+            try:
+                with self.connection.cursor() as cursor:
+                    execute_values(cursor, query, rows)
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                logger.error(f"❌ Ошибка сохранения оценок чакр: {e}")
+                raise
+        return len(rows)
+
     def save_photo_base64(self, analysis_id, photo_path):
         """Сохранить фото в base64 для датасета"""
         try:
@@ -107,6 +181,234 @@ class Database:
         except Exception as e:
             logger.error(f"❌ Ошибка сохранения фото: {e}")
 
+    def save_scan_photo(self, scan_id, photo_bytes):
+        """Фото скана из памяти — в photos сразу при регистрации скана (analysis_id — позже)"""
+        try:
+            photo_base64 = base64.b64encode(photo_bytes).decode('utf-8')
+            photo_size_kb = len(photo_bytes) // 1024
+
+            query = """
+                INSERT INTO photos (scan_id, photo_base64, photo_size_kb)
+                VALUES (%s, %s, %s)
+            """
+            self.execute(query, (scan_id, photo_base64, photo_size_kb))
+            logger.info(f"✅ Фото скана #{scan_id} сохранено ({photo_size_kb} KB)")
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения фото: {e}")
+
+    def attach_scan_photo(self, scan_id, analysis_id):
+        """Привязать фото скана к готовому анализу"""
+        query = """
+            UPDATE photos SET analysis_id = %s WHERE scan_id = %s AND analysis_id IS NULL
+        """
+        self.execute(query, (analysis_id, scan_id))
+
+    def create_scan(self, user_id, chat_id, username, request_text, photo_path=None,
+                    analysis_mode=None, priority_lane=None):
+        """Зарегистрировать скан до первого вызова модели — id скана ключ его чекпоинтов"""
+        query = """
+            INSERT INTO analysis_scans
+            (user_id, chat_id, username, request_text, photo_path, analysis_mode, priority_lane)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """
+        result = self.execute(
+            query,
+            (user_id, chat_id, username, request_text, photo_path, analysis_mode, priority_lane),
+            fetch=True
+        )
+        scan_id = result[0]['id']
+        logger.info(f"✅ Скан #{scan_id} зарегистрирован для пользователя {user_id}")
+        return scan_id
+
+    def get_scan(self, scan_id):
+        """Запись analysis_scans"""
+        query = """
+            SELECT * FROM analysis_scans WHERE id = %s
+        """
+        result = self.execute(query, (scan_id,), fetch=True)
+        return result[0] if result else None
+
+    def save_scan_checkpoint(self, scan_id, step, output, prompt_tokens=0, completion_tokens=0,
+                             total_tokens=0, cached_tokens=0, duration_seconds=None):
+        """Сохранить ответ модели на шаге скана (повторная запись шага перезаписывает)"""
+        query = """
+            INSERT INTO scan_checkpoints
+            (scan_id, step, output, prompt_tokens, completion_tokens, total_tokens,
+             cached_tokens, duration_seconds)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (scan_id, step) DO UPDATE SET
+                output = EXCLUDED.output,
+                prompt_tokens = EXCLUDED.prompt_tokens,
+                completion_tokens = EXCLUDED.completion_tokens,
+                total_tokens = EXCLUDED.total_tokens,
+                cached_tokens = EXCLUDED.cached_tokens,
+                duration_seconds = EXCLUDED.duration_seconds,
+                created_at = CURRENT_TIMESTAMP
+        """
+        self.execute(query, (scan_id, step, output, prompt_tokens, completion_tokens,
+                             total_tokens, cached_tokens, duration_seconds))
+        self.execute("UPDATE analysis_scans SET updated_at = CURRENT_TIMESTAMP WHERE id = %s", (scan_id,))
+
+    def get_scan_checkpoints(self, scan_id):
+        """Готовые шаги скана: {шаг: строка scan_checkpoints}"""
+        query = """
+            SELECT step, output, prompt_tokens, completion_tokens, total_tokens,
+                   cached_tokens, duration_seconds
+            FROM scan_checkpoints
+            WHERE scan_id = %s
+        """
+        return {row['step']: row for row in self.execute(query, (scan_id,), fetch=True)}
+
+    def restart_scan(self, scan_id):
+        """Скан снова в работе (повтор после ошибки или продолжение после перезапуска)"""
+        query = """
+            UPDATE analysis_scans
+            SET status = 'running', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """
+        self.execute(query, (scan_id,))
+
+    def mark_scan_failed(self, scan_id, error):
+        """Скан упал — чекпоинты остаются до повтора"""
+        query = """
+            UPDATE analysis_scans
+            SET status = 'failed', last_error = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """
+        self.execute(query, (str(error)[:1000], scan_id))
+
+    def mark_scan_sending(self, scan_id, analysis_id):
+        """Анализ сохранён, PDF уходит пользователю — после перезапуска такой скан не отправляется повторно"""
+        query = """
+            UPDATE analysis_scans
+            SET status = 'sending', analysis_id = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """
+        self.execute(query, (analysis_id, scan_id))
+
+    def mark_scan_done(self, scan_id, analysis_id):
+        """PDF отправлен — скан завершён"""
+        query = """
+            UPDATE analysis_scans
+            SET status = 'done', analysis_id = %s, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """
+        self.execute(query, (analysis_id, scan_id))
+
+    def get_interrupted_scans(self, max_age_hours=24):
+        """
+        Сканы, которые шли, когда бот остановился, не старше max_age_hours:
+        running — анализ не доделан, sending — бот остановился во время отправки PDF
+        """
+        query = """
+            SELECT * FROM analysis_scans
+            WHERE status IN ('running', 'sending')
+              AND updated_at >= CURRENT_TIMESTAMP - %s * INTERVAL '1 hour'
+            ORDER BY created_at
+        """
+        return self.execute(query, (max_age_hours,), fetch=True)
+
+    def save_speculative_run(self, user_id, status, steps_completed, tokens_used, api_cost_usd,
+                             lifetime_seconds=None):
+        """Записать спекулятивный запуск шагов (speculative_scan.py) и стоимость его готовых шагов"""
+        query = """
+            INSERT INTO speculative_runs
+            (user_id, status, steps_completed, tokens_used, api_cost_usd, lifetime_seconds)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """
+        self.execute(query, (user_id, status, steps_completed, tokens_used, api_cost_usd, lifetime_seconds))
+
+    def get_speculative_cost_by_date(self, days=7):
+        """Спекуляции по дням и статусам: сколько пригодилось и сколько потрачено впустую"""
+        query = """
+            SELECT * FROM speculative_cost_by_date
+            WHERE date >= CURRENT_DATE - %s * INTERVAL '1 day'
+            ORDER BY date DESC, status
+        """
+        return self.execute(query, (days,), fetch=True)
+
+    def get_name_declension(self, name):
+        """Склонения имени из кэша name_declensions (name — нормализованное); None — нет записи"""
+        query = f"""
+            SELECT name, gender, {', '.join(CASES)}, source, updated_at
+            FROM name_declensions
+            WHERE name = %s
+        """
+        result = self.execute(query, (name,), fetch=True)
+        return result[0] if result else None
+
+    def save_name_declensions_batch(self, items):
+        """
+        Записать склонения пачкой: items = [(name, gender, declensions, source), ...]
+        Уже записанные имена не трогает — правку администратора перезаписывает только set_name_declension()
+        """
+        rows = [(name, gender, *(declensions[case] for case in CASES), source)
+                for name, gender, declensions, source in items]
+        if not rows:
+            return 0
+
+        query = f"""
+            INSERT INTO name_declensions (name, gender, {', '.join(CASES)}, source)
+            VALUES %s
+            ON CONFLICT (name) DO NOTHING
+        """
+        with self._lock:
+            try:
+                with self.connection.cursor() as cursor:
+                    execute_values(cursor, query, rows)
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                logger.error(f"❌ Ошибка сохранения склонений: {e}")
+                raise
+        return len(rows)
+
+    def set_name_declension(self, name, gender, declensions, source='admin'):
+        """Записать или исправить склонения имени (manage_name_declensions.py)"""
+        updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in (*CASES, 'gender', 'source'))
+        query = f"""
+            INSERT INTO name_declensions (name, gender, {', '.join(CASES)}, source)
+            VALUES (%s, %s, {', '.join(['%s'] * len(CASES))}, %s)
+            ON CONFLICT (name) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+        """
+        self.execute(query, (name, gender, *(declensions[case] for case in CASES), source))
+
+    def delete_name_declension(self, name):
+        """Удалить склонения имени из кэша — при следующем скане имя склонится заново"""
+        return self.execute("DELETE FROM name_declensions WHERE name = %s", (name,))
+
+    def get_name_declensions_list(self, source=None, limit=50):
+        """Последние записи кэша склонений, можно только одного источника (rules / model / admin...)"""
+        query = f"""
+            SELECT name, gender, {', '.join(CASES)}, source, updated_at
+            FROM name_declensions
+            WHERE %s IS NULL OR source = %s
+            ORDER BY updated_at DESC
+            LIMIT %s
+        """
+        return self.execute(query, (source, source, limit), fetch=True)
+
+    def add_name_declension_stats(self, counts):
+        """Прибавить к сегодняшним счётчикам источников склонений: counts = {источник: сколько}"""
+        for source, lookups in counts.items():
+            query = """
+                INSERT INTO name_declension_stats (date, source, lookups)
+                VALUES (CURRENT_DATE, %s, %s)
+                ON CONFLICT (date, source) DO UPDATE
+                SET lookups = name_declension_stats.lookups + EXCLUDED.lookups
+            """
+            self.execute(query, (source, lookups))
+
+    def get_name_declension_hit_rate_by_date(self, days=7):
+        """Доля попаданий в кэш склонений и сэкономленные запросы к модели по дням"""
+        query = """
+            SELECT * FROM name_declension_hit_rate_by_date
+            WHERE date >= CURRENT_DATE - %s * INTERVAL '1 day'
+            ORDER BY date DESC
+        """
+        return self.execute(query, (days,), fetch=True)
+
     def get_user_stats(self, user_id):
         """Получить статистику пользователя"""
         query = """
@@ -138,6 +440,71 @@ class Database:
         """
         return self.execute(query, fetch=True)
 
+    def get_chakra_scores_by_date(self, days=30):
+        """Средние проценты чакр по дням за последние N дней"""
+        query = """
+            SELECT * FROM chakra_scores_by_date
+            WHERE date >= CURRENT_DATE - %s * INTERVAL '1 day'
+            ORDER BY date DESC
+        """
+        return self.execute(query, (days,), fetch=True)
+
+    def get_chakra_scores_by_theme(self):
+        """Средние проценты чакр по темам запросов"""
+        query = """
+            SELECT * FROM chakra_scores_by_theme
+        """
+        return self.execute(query, fetch=True)
+
+    def get_queue_wait_by_lane(self, days=7):
+        """p50/p95 ожидания места в очереди сканов по полосам и дням"""
+        query = """
+            SELECT * FROM queue_wait_by_lane
+            WHERE date >= CURRENT_DATE - %s * INTERVAL '1 day'
+            ORDER BY date DESC, lane
+        """
+        return self.execute(query, (days,), fetch=True)
+
+    def get_analyses_without_chakra_scores(self, after_id=0, limit=500):
+        """Пачка анализов (по возрастанию id) без строки в chakra_scores — для бэкфилла"""
+        query = """
+            SELECT a.id, a.request_text, a.analysis_result, a.analysis_structured
+            FROM analyses a
+            LEFT JOIN chakra_scores c ON c.analysis_id = a.id
+            WHERE a.id > %s
+              AND c.analysis_id IS NULL
+              AND (a.analysis_result IS NOT NULL OR a.analysis_structured IS NOT NULL)
+            ORDER BY a.id
+            LIMIT %s
+        """
+        return self.execute(query, (after_id, limit), fetch=True)
+
+    def get_analysis_names(self, limit=10000):
+        """
+        Имена из последних анализов (для бенчмарка склонений): username из analysis_structured,
+        для старых записей — request_text и first_name пользователя
+        """
+        query = """
+            SELECT a.analysis_structured->>'username' as username, a.request_text, u.first_name
+            FROM analyses a
+            LEFT JOIN users u ON a.user_id = u.user_id
+            ORDER BY a.id DESC
+            LIMIT %s
+        """
+        return self.execute(query, (limit,), fetch=True)
+
+    def get_recent_analysis_rows(self, limit=100):
+        """Последние анализы для analysis_result_from_row() — корпус бенчмарков PDF"""
+        query = """
+            SELECT a.id, a.request_text, a.analysis_result, a.analysis_structured, u.first_name
+            FROM analyses a
+            LEFT JOIN users u ON a.user_id = u.user_id
+            WHERE a.analysis_result IS NOT NULL OR a.analysis_structured IS NOT NULL
+            ORDER BY a.id DESC
+            LIMIT %s
+        """
+        return self.execute(query, (limit,), fetch=True)
+
     def get_dataset_ready(self, limit=100):
         """Получить готовые данные для датасета"""
         query = """
@@ -177,12 +544,39 @@ class Database:
         """
         return self.execute(query, fetch=True)
 
-    def export_dataset_jsonl(self, output_file='dataset_export.jsonl', min_rating=4):
-        """Экспорт датасета в JSONL для fine-tuning"""
+    def get_analysis_result(self, analysis_id):
+        """AnalysisResult сохранённого анализа (для старых записей без analysis_structured — из текста)"""
+        query = """
+            SELECT a.request_text, a.analysis_result, a.analysis_structured, u.first_name
+            FROM analyses a
+            LEFT JOIN users u ON a.user_id = u.user_id
+            WHERE a.id = %s
+        """
+        result = self.execute(query, (analysis_id,), fetch=True)
+        if not result:
+            return None
+        return self.analysis_result_from_row(result[0])
+
+    @staticmethod
+    def analysis_result_from_row(row):
+        """Строка analyses → AnalysisResult"""
+        if row.get('analysis_structured'):
+            return AnalysisResult.from_dict(row['analysis_structured'])
+        return AnalysisResult.from_text(
+            row['analysis_result'] or '', row.get('first_name') or '', row['request_text']
+        )
+
+    def export_dataset_jsonl(self, output_file='dataset_export.jsonl', min_rating=4, include_structure=False):
+        """
+        Экспорт датасета в JSONL для fine-tuning
+        include_structure=True — добавить в каждую запись поле "analysis" с разделами,
+        программами и чакрами (для аналитики; для fine-tuning оставлять False)
+        """
         query = """
             SELECT
                 a.request_text,
                 a.analysis_result,
+                a.analysis_structured,
                 p.photo_base64
             FROM analyses a
             LEFT JOIN photos p ON a.id = p.analysis_id
@@ -195,6 +589,7 @@ class Database:
         import json
         with open(output_file, 'w', encoding='utf-8') as f:
             for row in results:
+                analysis = self.analysis_result_from_row(row)
                 data = {
                     "messages": [
                         {
@@ -211,10 +606,12 @@ class Database:
                         },
                         {
                             "role": "assistant",
-                            "content": row['analysis_result']
+                            "content": analysis.text
                         }
                     ]
                 }
+                if include_structure:
+                    data["analysis"] = analysis.to_dict()
                 f.write(json.dumps(data, ensure_ascii=False) + '\n')
 
         logger.info(f"✅ Датасет экспортирован: {len(results)} записей → {output_file}")
@@ -34,6 +34,7 @@ CREATE TABLE IF NOT EXISTS analyses (
 
     -- Результаты анализа
     analysis_result TEXT,
+    analysis_structured JSONB,  -- AnalysisResult.to_dict(): разделы, программы, чакры
     pdf_path VARCHAR(500),
 
     -- Метаданные
@@ -42,6 +43,10 @@ CREATE TABLE IF NOT EXISTS analyses (
     tokens_used INTEGER,
     model_used VARCHAR(50) DEFAULT 'gpt-4o',
 
+    -- Очередь сканов
+    priority_lane VARCHAR(20),  -- vip / paid / free
+    queue_wait_seconds REAL,
+
     -- Для датасета
     is_approved_for_dataset BOOLEAN DEFAULT FALSE,
     dataset_notes TEXT,
@@ -53,6 +58,7 @@ CREATE INDEX IF NOT EXISTS idx_analyses_user ON analyses(user_id);
 CREATE INDEX IF NOT EXISTS idx_analyses_created ON analyses(created_at);
 CREATE INDEX IF NOT EXISTS idx_analyses_approved ON analyses(is_approved_for_dataset);
 CREATE INDEX IF NOT EXISTS idx_analyses_rating ON analyses(quality_rating);
+CREATE INDEX IF NOT EXISTS idx_analyses_priority_lane ON analyses(priority_lane);
 
 -- Таблица для хранения фото в base64 (для датасета)
 CREATE TABLE IF NOT EXISTS photos (
@@ -125,6 +131,177 @@ WHERE a.is_approved_for_dataset = TRUE
   AND a.quality_rating >= 4
 ORDER BY a.created_at DESC;
 
+-- Ожидание в очереди по полосам и дням
+CREATE OR REPLACE VIEW queue_wait_by_lane AS
+SELECT
+    DATE(a.created_at) as date,
+    a.priority_lane as lane,
+    COUNT(*) as total_analyses,
+    ROUND(AVG(a.queue_wait_seconds)::NUMERIC, 1) as avg_wait_seconds,
+    ROUND(PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY a.queue_wait_seconds)::NUMERIC, 1) as p50_wait_seconds,
+    ROUND(PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY a.queue_wait_seconds)::NUMERIC, 1) as p95_wait_seconds,
+    ROUND(MAX(a.queue_wait_seconds)::NUMERIC, 1) as max_wait_seconds
+FROM analyses a
+WHERE a.priority_lane IS NOT NULL
+GROUP BY DATE(a.created_at), a.priority_lane
+ORDER BY date DESC, lane;
+
+-- Числовые оценки чакр (одна строка на анализ)
+CREATE TABLE IF NOT EXISTS chakra_scores (
+    analysis_id INTEGER PRIMARY KEY REFERENCES analyses(id) ON DELETE CASCADE,
+
+    -- Проценты наполненности 0-100 (NULL — чакра не найдена в разборе)
+    muladhara SMALLINT CHECK (muladhara BETWEEN 0 AND 100),        -- 1. Безопасность
+    svadhisthana SMALLINT CHECK (svadhisthana BETWEEN 0 AND 100),  -- 2. Чувства и желания
+    manipura SMALLINT CHECK (manipura BETWEEN 0 AND 100),          -- 3. Сила воли
+    anahata SMALLINT CHECK (anahata BETWEEN 0 AND 100),            -- 4. Сердце и любовь
+    vishuddha SMALLINT CHECK (vishuddha BETWEEN 0 AND 100),        -- 5. Самовыражение
+    ajna SMALLINT CHECK (ajna BETWEEN 0 AND 100),                  -- 6. Интуиция
+    sahasrara SMALLINT CHECK (sahasrara BETWEEN 0 AND 100),        -- 7. Связь с высшим
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Индексы
+CREATE INDEX IF NOT EXISTS idx_chakra_scores_created ON chakra_scores(created_at);
+
+-- Средние оценки чакр по дням (рядом с analytics_summary)
+CREATE OR REPLACE VIEW chakra_scores_by_date AS
+SELECT
+    DATE(a.created_at) as date,
+    COUNT(*) as total_analyses,
+    ROUND(AVG(c.muladhara), 1) as avg_muladhara,
+    ROUND(AVG(c.svadhisthana), 1) as avg_svadhisthana,
+    ROUND(AVG(c.manipura), 1) as avg_manipura,
+    ROUND(AVG(c.anahata), 1) as avg_anahata,
+    ROUND(AVG(c.vishuddha), 1) as avg_vishuddha,
+    ROUND(AVG(c.ajna), 1) as avg_ajna,
+    ROUND(AVG(c.sahasrara), 1) as avg_sahasrara
+FROM chakra_scores c
+JOIN analyses a ON a.id = c.analysis_id
+GROUP BY DATE(a.created_at)
+ORDER BY date DESC;
+
+-- Средние оценки чакр по темам запросов (request_themes)
+CREATE OR REPLACE VIEW chakra_scores_by_theme AS
+SELECT
+    t.theme,
+    COUNT(*) as total_analyses,
+    ROUND(AVG(c.muladhara), 1) as avg_muladhara,
+    ROUND(AVG(c.svadhisthana), 1) as avg_svadhisthana,
+    ROUND(AVG(c.manipura), 1) as avg_manipura,
+    ROUND(AVG(c.anahata), 1) as avg_anahata,
+    ROUND(AVG(c.vishuddha), 1) as avg_vishuddha,
+    ROUND(AVG(c.ajna), 1) as avg_ajna,
+    ROUND(AVG(c.sahasrara), 1) as avg_sahasrara
+FROM chakra_scores c
+JOIN request_themes t ON t.analysis_id = c.analysis_id
+GROUP BY t.theme
+ORDER BY total_analyses DESC;
+
+-- Сканы: вход и статус (running / sending / failed / done) — для продолжения после ошибки или перезапуска
+CREATE TABLE IF NOT EXISTS analysis_scans (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+    chat_id BIGINT NOT NULL,
+    username VARCHAR(255),
+    request_text TEXT NOT NULL,
+    photo_path VARCHAR(500),
+    analysis_mode VARCHAR(20),
+    priority_lane VARCHAR(20),
+    status VARCHAR(20) DEFAULT 'running',
+    attempts INTEGER DEFAULT 1,
+    last_error TEXT,
+    analysis_id INTEGER REFERENCES analyses(id) ON DELETE SET NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Чекпоинты: ответ модели на каждом готовом шаге скана
+CREATE TABLE IF NOT EXISTS scan_checkpoints (
+    scan_id INTEGER REFERENCES analysis_scans(id) ON DELETE CASCADE,
+    step VARCHAR(30) NOT NULL,
+    output TEXT NOT NULL,
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    total_tokens INTEGER DEFAULT 0,
+    cached_tokens INTEGER DEFAULT 0,
+    duration_seconds REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scan_id, step)
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_scans_user ON analysis_scans(user_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_scans_status ON analysis_scans(status, updated_at);
+
+-- Фото скана пишется при регистрации скана (analysis_id — когда анализ готов)
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS scan_id INTEGER REFERENCES analysis_scans(id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS idx_photos_scan ON photos(scan_id);
+
+-- Спекулятивные запуски шагов 1-4 до имени/фото: пригодился скану (adopted) или отменён
+CREATE TABLE IF NOT EXISTS speculative_runs (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL,
+    steps_completed SMALLINT DEFAULT 0,
+    tokens_used INTEGER DEFAULT 0,
+    api_cost_usd DECIMAL(10, 6) DEFAULT 0,
+    lifetime_seconds REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_speculative_runs_created ON speculative_runs(created_at);
+
+-- Спекуляции по дням и статусам
+CREATE OR REPLACE VIEW speculative_cost_by_date AS
+SELECT
+    DATE(created_at) as date,
+    status,
+    COUNT(*) as total_runs,
+    SUM(steps_completed) as steps_completed,
+    SUM(tokens_used) as total_tokens,
+    ROUND(SUM(api_cost_usd)::NUMERIC, 4) as total_cost_usd
+FROM speculative_runs
+GROUP BY DATE(created_at), status
+ORDER BY date DESC, status;
+
+-- Кэш склонений имён (declension_cache.py) и источники склонений по дням
+CREATE TABLE IF NOT EXISTS name_declensions (
+    name VARCHAR(100) PRIMARY KEY,
+    gender CHAR(1),
+    nominative VARCHAR(100) NOT NULL,
+    genitive VARCHAR(100) NOT NULL,
+    dative VARCHAR(100) NOT NULL,
+    accusative VARCHAR(100) NOT NULL,
+    instrumental VARCHAR(100) NOT NULL,
+    prepositional VARCHAR(100) NOT NULL,
+    source VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS name_declension_stats (
+    date DATE NOT NULL DEFAULT CURRENT_DATE,
+    source VARCHAR(20) NOT NULL,
+    lookups INTEGER DEFAULT 0,
+    PRIMARY KEY (date, source)
+);
+
+CREATE INDEX IF NOT EXISTS idx_name_declensions_source ON name_declensions(source, updated_at);
+
+-- Доля попаданий в кэш склонений и сэкономленные запросы к модели
+CREATE OR REPLACE VIEW name_declension_hit_rate_by_date AS
+SELECT
+    date,
+    SUM(lookups) as total_lookups,
+    SUM(lookups) FILTER (WHERE source IN ('memory', 'db')) as cache_hits,
+    ROUND(100.0 * SUM(lookups) FILTER (WHERE source IN ('memory', 'db')) / NULLIF(SUM(lookups), 0), 1) as hit_rate_percent,
+    SUM(lookups) FILTER (WHERE source IN ('memory', 'db', 'dictionary', 'rules')) as saved_api_calls,
+    SUM(lookups) FILTER (WHERE source IN ('model', 'fallback')) as api_calls
+FROM name_declension_stats
+GROUP BY date
+ORDER BY date DESC;
+
 -- Функция для автоопределения темы запроса
 CREATE OR REPLACE FUNCTION detect_request_theme(request TEXT)
 RETURNS VARCHAR(100) AS $$
@@ -181,10 +358,17 @@ COMMENT ON TABLE analyses IS 'История всех анализов для п
 COMMENT ON TABLE photos IS 'Фотографии в base64 для fine-tuning';
 COMMENT ON TABLE request_themes IS 'Категории запросов для аналитики';
 COMMENT ON TABLE feedback IS 'Отзывы пользователей о качестве анализа';
+COMMENT ON TABLE chakra_scores IS 'Проценты 7 чакр каждого анализа (из AnalysisResult.chakras)';
+COMMENT ON TABLE analysis_scans IS 'Сканы в работе и завершённые: вход скана и его статус';
+COMMENT ON TABLE scan_checkpoints IS 'Готовые шаги скана — при повторе не вызываются заново';
+COMMENT ON TABLE speculative_runs IS 'Спекулятивные запуски шагов 1-4 до имени/фото и их стоимость';
+COMMENT ON TABLE name_declensions IS 'Кэш склонений имён: всё, что бот уже склонял, и правки администратора';
+COMMENT ON TABLE name_declension_stats IS 'Сколько склонений по дням пришло из кэша, локального движка и модели';
 
 COMMENT ON COLUMN analyses.is_approved_for_dataset IS 'Одобрено для включения в датасет для fine-tuning';
 COMMENT ON COLUMN analyses.quality_rating IS 'Оценка качества анализа (1-5) от оператора';
 COMMENT ON COLUMN analyses.tokens_used IS 'Количество токенов использованных в запросе';
+COMMENT ON COLUMN photos.scan_id IS 'Скан, с которым пришло фото; analysis_id заполняется, когда анализ готов';
 
 -- Вставка тестовых данных (опционально)
 -- INSERT INTO users (user_id, username, first_name) VALUES
@@ -0,0 +1,217 @@
+"""
+Кэш склонений имён: LRU в памяти процесса перед таблицей name_declensions
+
+Одни и те же имена приходят каждый день. Склонения каждого имени, которое бот
+уже склонял (словарём, правилами или моделью), лежат в name_declensions, а самые
+частые — ещё и в LRU процесса. Порядок в name_helper.get_name_declensions*():
+LRU → таблица → локальный движок (name_declension.py) → модель.
+
+Запись после промаха отложенная: новые имена и счётчики источников копятся
+в памяти и пишутся пачкой через NAME_DECLENSION_FLUSH_DELAY секунд, не задерживая
+скан. В боте (aget() / aflush()) запросы к PostgreSQL идут через asyncio.to_thread —
+event loop не ждёт таблицу ни при промахе LRU, ни при записи. Запись в LRU живёт NAME_DECLENSION_CACHE_TTL секунд, поэтому правка
+через manage_name_declensions.py доходит до работающего бота без перезапуска.
+
+Счётчики источников по дням (name_declension_stats) дают долю попаданий и
+сэкономленные запросы к модели в show_cost_stats.py. Таблицы — миграция 008.
+"""
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+
+import config
+from database import get_db
+from name_declension import CASES, normalize_name
+
+logger = logging.getLogger(__name__)
+
+NAME_DECLENSION_CACHE_SIZE = getattr(config, 'NAME_DECLENSION_CACHE_SIZE', 5000)
+NAME_DECLENSION_CACHE_TTL = getattr(config, 'NAME_DECLENSION_CACHE_TTL', 3600)  # секунд до перечитывания из БД
+NAME_DECLENSION_FLUSH_DELAY = getattr(config, 'NAME_DECLENSION_FLUSH_DELAY', 5.0)  # секунд копим запись в БД
+
+# memory / db — попадание в кэш; dictionary / rules — склонено локально; model / fallback — запрос к модели
+CACHE_SOURCES = ('memory', 'db')
+LOCAL_SOURCES = ('dictionary', 'rules')
+
+
+class DeclensionCache:
+    def __init__(self, db=None, size: int = NAME_DECLENSION_CACHE_SIZE, ttl: float = NAME_DECLENSION_CACHE_TTL):
+        self.db = db  # None — только LRU (нет PostgreSQL: скрипты, бенчмарк)
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # имя → (склонения, monotonic истечения); конец — недавние
+        self._pending = {}             # имя → (род, склонения, источник) — ещё не в name_declensions
+        self._counts = Counter()       # источник → склонений, ещё не в name_declension_stats
+        self.totals = Counter()        # источник → склонений за жизнь процесса
+        self._flush_handle = None
+        self._flush_task = None
+
+    def get(self, name: str):
+        """(склонения, 'memory' / 'db') или (None, None) — имени нет ни в LRU, ни в таблице"""
+        key = normalize_name(name)
+        hit = self._memory(key)
+        if hit:
+            return hit
+        return self._from_row(key, self._load(key))
+
+    async def aget(self, name: str):
+        """То же, что get(), для бота: чтение таблицы — в потоке, event loop не ждёт PostgreSQL"""
+        key = normalize_name(name)
+        hit = self._memory(key)
+        if hit:
+            return hit
+        if key in self._pending or self.db is None:
+            return self._from_row(key, self._load(key))
+        return self._from_row(key, await asyncio.to_thread(self._load, key))
+
+    def _memory(self, key: str):
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            return dict(entry[0]), 'memory'
+        return None
+
+    def _from_row(self, key: str, row):
+        if row is None:
+            self._entries.pop(key, None)
+            return None, None
+        declensions = {case: row[case] for case in CASES}
+        self._remember(key, declensions)
+        return dict(declensions), 'db'
+
+    def _load(self, key: str):
+        if key in self._pending:
+            return self._pending[key][1]
+        if self.db is None:
+            return None
+        try:
+            return self.db.get_name_declension(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш склонений недоступен: {e}")
+            return None
+
+    def _remember(self, key: str, declensions: dict):
+        self._entries[key] = (declensions, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def put(self, name: str, declensions: dict, source: str, gender: str = None):
+        """Склонения после промаха: сразу в LRU, в таблицу — при следующем flush()"""
+        key = normalize_name(name)
+        declensions = {case: declensions[case] for case in CASES}
+        self._remember(key, declensions)
+        self._pending[key] = (gender, declensions, source)
+
+    def count(self, source: str):
+        """Учитывает, откуда пришли склонения для скана"""
+        self._counts[source] += 1
+        self.totals[source] += 1
+
+    def hit_rate(self) -> float:
+        """Доля попаданий в кэш за жизнь процесса, 0..1"""
+        total = sum(self.totals.values())
+        return sum(self.totals[source] for source in CACHE_SOURCES) / total if total else 0.0
+
+    def saved_api_calls(self) -> int:
+        """Склонений без запроса к модели за жизнь процесса"""
+        return sum(self.totals[source] for source in CACHE_SOURCES + LOCAL_SOURCES)
+
+    def schedule_flush(self):
+        """Запись в БД через NAME_DECLENSION_FLUSH_DELAY секунд (в потоке из event loop бота), вне loop — сразу"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        if self._flush_handle is None and self._flush_task is None:
+            self._flush_handle = loop.call_later(NAME_DECLENSION_FLUSH_DELAY, self._start_flush)
+
+    def _start_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.get_running_loop().create_task(self.aflush())
+        self._flush_task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        self._flush_task = None
+        if task.cancelled() or task.exception() is not None or task.result() is False:
+            return  # Ошибка БД — накопленное подождёт следующего скана
+        if self._pending or self._counts:
+            # Пока шла запись, накопились новые склонения — следующая пачка
+            self.schedule_flush()
+
+    def flush(self):
+        """Пишет накопленные склонения и счётчики синхронно (скрипты, вне event loop)"""
+        pending, counts = self._take()
+        if pending or counts:
+            self._finish(pending, counts, self._write(pending, counts))
+
+    async def aflush(self):
+        """
+        Пишет накопленные склонения и счётчики в потоке; при остановке бота дожидается идущей записи.
+        False — ошибка БД, накопленное осталось в памяти
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        running = self._flush_task
+        if running is not None and running is not asyncio.current_task():
+            await asyncio.shield(running)
+        pending, counts = self._take()
+        if not (pending or counts):
+            return True
+        written = await asyncio.to_thread(self._write, pending, counts)
+        self._finish(pending, counts, written)
+        return written
+
+    def _take(self):
+        """Забирает накопленное; без PostgreSQL — просто сбрасывает"""
+        pending, counts = self._pending, self._counts
+        self._pending, self._counts = {}, Counter()
+        if self.db is None:
+            return {}, Counter()
+        return pending, counts
+
+    def _write(self, pending: dict, counts: Counter) -> bool:
+        """Запись в name_declensions и name_declension_stats; False — ошибка БД"""
+        try:
+            if pending:
+                self.db.save_name_declensions_batch(
+                    [(key, gender, declensions, source) for key, (gender, declensions, source) in pending.items()]
+                )
+            if counts:
+                self.db.add_name_declension_stats(dict(counts))
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось записать кэш склонений: {e}")
+            return False
+        return True
+
+    def _finish(self, pending: dict, counts: Counter, written: bool):
+        """После записи: при ошибке БД накопленное возвращается до следующего раза"""
+        if not written:
+            pending.update(self._pending)
+            counts.update(self._counts)
+            self._pending, self._counts = pending, counts
+            return
+        if pending:
+            logger.info(
+                f"💾 Склонения записаны в кэш: {', '.join(pending)} "
+                f"(попаданий {self.hit_rate():.0%}, без модели {self.saved_api_calls()})"
+            )
+
+_cache = None
+
+
+def get_declension_cache() -> DeclensionCache:
+    """Кэш склонений процесса; без PostgreSQL — только LRU"""
+    global _cache
+    if _cache is None:
+        try:
+            db = get_db()
+        except Exception as e:
+            logger.warning(f"⚠️ Кэш склонений без PostgreSQL (только память): {e}")
+            db = None
+        _cache = DeclensionCache(db)
+    return _cache
@@ -0,0 +1,212 @@
+"""
+Общий планировщик запросов к модели
+
+Каждый шаг анализа и склонение имени проходят через LLMScheduler, прежде чем
+уйти в API. Планировщик держит два token bucket'а — запросы в минуту (RPM) и
+токены в минуту (TPM) — и не отправляет запрос, пока в обоих не хватает бюджета.
+Токены запроса оцениваются заранее (estimate_tokens), после ответа оценка
+сверяется с реальным usage (settle).
+
+Ожидающие запросы стоят в честной очереди: по очереди на пользователя,
+пользователи обслуживаются по кругу — пять шагов одного скана не занимают
+весь бюджет, пока другие ждут. Позиция в очереди сообщается через on_position.
+
+Лимиты — в config.py (LLM_RPM_LIMIT, LLM_TPM_LIMIT).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+LLM_RPM_LIMIT = getattr(config, 'LLM_RPM_LIMIT', 500)
+LLM_TPM_LIMIT = getattr(config, 'LLM_TPM_LIMIT', 30000)
+
+# Кириллица в токенизаторе gpt-4o — примерно 3 символа на токен
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(params: dict) -> int:
+    """
+    Оценка токенов запроса до отправки: промпт по длине сообщений + max_tokens ответа
+    (провайдер тоже резервирует max_tokens при подсчёте TPM)
+    """
+    prompt_chars = 0
+    for message in params.get('messages', []):
+        content = message.get('content', '')
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+        prompt_chars += len(content)
+    return prompt_chars // CHARS_PER_TOKEN + params.get('max_tokens', 0)
+
+
+class TokenBucket:
+    """Ведро на capacity единиц, пополняется на capacity в минуту"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.available = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Сколько секунд ждать, пока в ведре будет amount (0 — уже есть)"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.available -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.available = min(self.capacity, self.available + amount)
+
+
+class _Waiter:
+    __slots__ = ('tokens', 'future', 'on_position', 'position')
+
+    def __init__(self, tokens: int, future, on_position):
+        self.tokens = tokens
+        self.future = future
+        self.on_position = on_position
+        self.position = None
+
+
+class LLMScheduler:
+    def __init__(self, rpm: int = LLM_RPM_LIMIT, tpm: int = LLM_TPM_LIMIT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = threading.Lock()       # вёдра общие для async и sync путей
+        self._queues = OrderedDict()        # ключ пользователя → deque[_Waiter], порядок = очередь по кругу
+        self._dispatcher = None
+        self._loop = None
+        self._callbacks = set()             # задачи on_position, чтобы их не собрал GC
+
+    def _wait_time(self, tokens: int) -> float:
+        with self._lock:
+            return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _try_take(self, tokens: int) -> bool:
+        with self._lock:
+            if self.requests.wait_time(1) or self.tokens.wait_time(tokens):
+                return False
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            return True
+
+    def settle(self, reserved: int, used: int):
+        """Сверяет оценку с реальным usage: лишнее возвращает в TPM, недостачу списывает"""
+        with self._lock:
+            if used < reserved:
+                self.tokens.give_back(reserved - used)
+            else:
+                self.tokens.take(used - reserved)
+
+    async def acquire(self, key, tokens: int, on_position=None):
+        """
+        Ждёт своей очереди и бюджета RPM/TPM под запрос на tokens токенов.
+        key — пользователь (очереди честные по ключу), on_position — async-функция (позиция_в_очереди)
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Новый event loop (например, повторный asyncio.run в скрипте) — старая очередь ему не принадлежит
+            self._loop, self._queues, self._dispatcher = loop, OrderedDict(), None
+
+        if not self._queues and self._try_take(tokens):
+            return
+
+        waiter = _Waiter(tokens, loop.create_future(), on_position)
+        self._queues.setdefault(key, deque()).append(waiter)
+        if self._dispatcher is None:
+            self._dispatcher = loop.create_task(self._dispatch())
+        self._notify_positions()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            queue = self._queues.get(key)
+            if queue and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._queues[key]
+            raise
+
+    def acquire_sync(self, tokens: int):
+        """Для синхронного пути (CLI, скрипты): ждёт бюджета без очереди"""
+        while not self._try_take(tokens):
+            time.sleep(self._wait_time(tokens))
+
+    def queue_length(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def _dispatch(self):
+        """Выдаёт бюджет ожидающим по кругу: по одному запросу от каждого пользователя"""
+        try:
+            while self._queues:
+                key, queue = next(iter(self._queues.items()))
+                waiter = queue[0]
+
+                if waiter.future.done():
+                    # Отменён, пока стоял в очереди
+                    queue.popleft()
+                elif self._try_take(waiter.tokens):
+                    queue.popleft()
+                    waiter.future.set_result(None)
+                else:
+                    await asyncio.sleep(self._wait_time(waiter.tokens))
+                    continue
+
+                # Пользователь уходит в конец круга
+                del self._queues[key]
+                if queue:
+                    self._queues[key] = queue
+                self._notify_positions()
+        finally:
+            self._dispatcher = None
+
+    def _notify_positions(self):
+        """Пересчитывает позиции (порядок выдачи по кругу) и сообщает тем, у кого она изменилась"""
+        queues = [list(queue) for queue in self._queues.values()]
+        position = 0
+        for round_index in range(max(map(len, queues), default=0)):
+            for queue in queues:
+                if round_index >= len(queue):
+                    continue
+                waiter = queue[round_index]
+                position += 1
+                if waiter.on_position and waiter.position != position:
+                    waiter.position = position
+                    task = asyncio.ensure_future(self._report(waiter.on_position, position))
+                    self._callbacks.add(task)
+                    task.add_done_callback(self._callbacks.discard)
+
+    @staticmethod
+    async def _report(on_position, position: int):
+        try:
+            await on_position(position)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка обработчика позиции в очереди: {e}")
+
+
+_scheduler = None
+
+
+def get_scheduler() -> LLMScheduler:
+    """Планировщик процесса — один на все сканы и склонения"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+        logger.info(f"🚦 Планировщик LLM: {LLM_RPM_LIMIT} запросов/мин, {LLM_TPM_LIMIT} токенов/мин")
+    return _scheduler
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Правка кэша склонений имён (таблица name_declensions, миграция 008)
+
+Запуск:
+  python manage_name_declensions.py show Имя
+  python manage_name_declensions.py list [источник] [сколько]   — источник: dictionary / rules / model / admin
+  python manage_name_declensions.py set Имя Родительный Дательный Винительный Творительный Предложный [f|m]
+  python manage_name_declensions.py delete Имя                  — при следующем скане имя склонится заново
+  python manage_name_declensions.py stats [дней]
+
+Исправленная запись получает source = admin и больше не перезаписывается ботом.
+Работающий бот увидит правку, когда истечёт запись в его LRU (NAME_DECLENSION_CACHE_TTL).
+"""
+
+import sys
+
+from tabulate import tabulate
+
+from database import get_db
+from name_declension import CASES, get_declension_engine, normalize_name
+
+USAGE = __doc__.split('Запуск:')[1].split('\n\n')[0]
+
+
+def _row(entry) -> list:
+    return [entry['name'], entry['gender'] or '—', *(entry[case] for case in CASES[1:]),
+            entry['source'], entry['updated_at'].strftime('%d.%m.%Y %H:%M')]
+
+
+HEADERS = ["Имя", "Род", "Род. п.", "Дат. п.", "Вин. п.", "Твор. п.", "Предл. п.", "Источник", "Обновлено"]
+
+
+def show(db, name: str):
+    entry = db.get_name_declension(normalize_name(name))
+    if not entry:
+        print(f"«{normalize_name(name)}» нет в кэше склонений")
+        return
+    print(tabulate([_row(entry)], headers=HEADERS, tablefmt="grid"))
+
+
+def list_entries(db, source: str = None, limit: int = 50):
+    rows = db.get_name_declensions_list(source=source, limit=limit)
+    print(tabulate([_row(entry) for entry in rows], headers=HEADERS, tablefmt="grid"))
+    print(f"Показано: {len(rows)}")
+
+
+def set_entry(db, name: str, forms: list, gender: str = None):
+    key = normalize_name(name)
+    declensions = dict(zip(CASES, [key, *forms]))
+    gender = gender or get_declension_engine().gender(key)
+    db.set_name_declension(key, gender, declensions, source='admin')
+    print(f"✅ «{key}» исправлено")
+    show(db, key)
+
+
+def delete(db, name: str):
+    key = normalize_name(name)
+    if db.delete_name_declension(key):
+        print(f"🗑 «{key}» удалено из кэша склонений")
+    else:
+        print(f"«{key}» нет в кэше склонений")
+
+
+def stats(db, days: int = 7):
+    rows = db.get_name_declension_hit_rate_by_date(days)
+    table = [[
+        row['date'].strftime('%d.%m.%Y'),
+        row['total_lookups'],
+        row['cache_hits'] or 0,
+        f"{row['hit_rate_percent'] or 0}%",
+        row['saved_api_calls'] or 0,
+        row['api_calls'] or 0,
+    ] for row in rows]
+    headers = ["Дата", "Склонений", "Из кэша", "Попаданий", "Без модели", "Запросов к модели"]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+
+
+def main(args: list):
+    db = get_db()
+    command = args[0] if args else None
+
+    if command == 'show' and len(args) == 2:
+        show(db, args[1])
+    elif command == 'list' and len(args) <= 3:
+        list_entries(db, args[1] if len(args) > 1 else None, int(args[2]) if len(args) > 2 else 50)
+    elif command == 'set' and len(args) in (7, 8):
+        set_entry(db, args[1], args[2:7], args[7] if len(args) == 8 else None)
+    elif command == 'delete' and len(args) == 2:
+        delete(db, args[1])
+    elif command == 'stats' and len(args) <= 2:
+        stats(db, int(args[1]) if len(args) > 1 else 7)
+    else:
+        print(f"Запуск:{USAGE}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -2,437 +2,752 @@
 Multi-step анализ по Мета-Методу - УЛУЧШЕННАЯ ВЕРСИЯ
 Глубина 7-10 минут как у Natalie Zemskova
 С конкретными поколениями, процентами чакр, расшифровкой и феминизацией
-"""
-
-from openai import OpenAI
-from cost_calculator import calculate_cost
-from config import OPENAI_API_KEY, OPENAI_MODEL
-
-
-class MetaMethodAnalyzer:
-    def __init__(self):
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
-        self.model = OPENAI_MODEL
-
-    def analyze(self, request_text: str, username: str) -> tuple:
-        """
-        Выполняет полный анализ через 5 шагов
-        Возвращает (полный_текст_анализа, usage_info)
-        где usage_info = {'total_tokens': int, 'prompt_tokens': int, 'completion_tokens': int, 'cost_usd': float}
-        """
-        total_tokens = 0
-        prompt_tokens = 0
-        completion_tokens = 0
-
-        # Шаг 1: Глубинный анализ запроса
-        step1_result, usage1 = self._step1_deep_analysis(request_text, username)
-        total_tokens += usage1.total_tokens
-        prompt_tokens += usage1.prompt_tokens
-        completion_tokens += usage1.completion_tokens
-
-        # Шаг 2: Родовые и кармические паттерны
-        step2_result, usage2 = self._step2_ancestral_patterns(request_text, step1_result)
-        total_tokens += usage2.total_tokens
-        prompt_tokens += usage2.prompt_tokens
-        completion_tokens += usage2.completion_tokens
-
-        # Шаг 3: Энергетика чакр и блоки
-        step3_result, usage3 = self._step3_chakra_analysis(request_text, step1_result)
-        total_tokens += usage3.total_tokens
-        prompt_tokens += usage3.prompt_tokens
-        completion_tokens += usage3.completion_tokens
-
-        # Шаг 4: Трансформационные фразы
-        step4_result, usage4 = self._step4_transformation_phrases(request_text, step1_result, step2_result)
-        total_tokens += usage4.total_tokens
-        prompt_tokens += usage4.prompt_tokens
-        completion_tokens += usage4.completion_tokens
-
-        # Шаг 5: Финальная компоновка
-        final_result, usage5 = self._step5_final_composition(
-            username, request_text, step1_result, step2_result, step3_result, step4_result
-        )
-        total_tokens += usage5.total_tokens
-        prompt_tokens += usage5.prompt_tokens
-        completion_tokens += usage5.completion_tokens
-
-        # Рассчитываем стоимость
-        cost_usd = calculate_cost(self.model, prompt_tokens, completion_tokens)
-
-        usage_info = {
-            'total_tokens': total_tokens,
-            'prompt_tokens': prompt_tokens,
-            'completion_tokens': completion_tokens,
-            'cost_usd': cost_usd
-        }
 
-        return final_result, usage_info
+Два пути выполнения:
+- analyze() — синхронный, для CLI и скриптов
+- analyze_async() — асинхронный, для бота (не блокирует event loop)
 
+Режимы финальной компоновки (mode):
+- 'llm' — шаг 5 целиком пишет модель
+- 'assembled' — разделы собираются локально из шагов 1-4 (analysis_assembler.py),
+  модель пишет только прозу контракта и "Следующий шаг"
+- 'structured' — без 5 шагов: один вызов возвращает JSON со всеми частями,
+  текст разбора собирает analysis_assembler.render_structured_analysis()
 
-    def _step1_deep_analysis(self, request_text: str, username: str) -> tuple:
-        """Шаг 1: Глубинный анализ запроса и выявление ключевых программ"""
+Каждый вызов модели проходит через общий планировщик (llm_scheduler.py):
+бюджеты RPM/TPM и честная очередь между пользователями.
 
-        prompt = f"""Ты — эксперт Мета-Метода Natalie Zemskova. Анализируй глубоко, как на реальной консультации.
+Надёжность шагов (StepPolicy, настраивается на каждый шаг): таймаут шага, повторы
+с экспоненциальной задержкой и джиттером на временных ошибках, хеджирование —
+дубль запроса, если шаг идёт дольше своего скользящего p90 (побеждает первый ответ),
+и общий дедлайн скана (ANALYSIS_SCAN_DEADLINE).
 
-Запрос: "{request_text}"
+Чекпоинты (checkpoint): ответ модели каждого шага сохраняется сразу после шага
+(scan_checkpoint.py — в БД), повтор скана берёт готовые шаги оттуда и вызывает модель
+только для недостающих.
 
-Определи:
-1. ТЕМУ (финансы/отношения/здоровье/реализация)
-2. ГЛАВНЫЕ ПРОГРАММЫ (МИНИМУМ 3, а лучше 4-5 штук в кавычках как прямая речь с феминизацией)
-3. УРОКИ ДУШИ (МИНИМУМ 3 урока, каждый — конкретный и практический, НЕ абстрактный)
-4. ЧТО МЕНЯТЬ (минимум 3 пункта с конкретикой)
-
-ВАЖНО ПРО ФЕМИНИЗАЦИЮ:
-Все программы пиши в формате "я не достоин/достойна", "я не могу/не могу", т.к. пользователи могут быть любого пола.
-
-СТИЛЬ ПИСЬМА:
-- Пиши от первого лица, как будто это мысли человека
-- Программы — это внутренний голос с самокритикой
-- Конкретно, без "возможно" и "может быть"
-- Как на живой консультации, 7-10 минут глубины
-
-Примеры ХОРОШИХ программ с феминизацией:
-- «Я не могу/не могу жить без её любви»
-- «Без признания других я ничего не стою/не стою»
-- «Деньги даются только через страдание»
-- «Я не достоин/достойна большего»
-- «Моя ценность зависит от оценки других»
-
-Примеры ХОРОШИХ уроков (конкретные, не абстрактные):
-- Научиться ставить личные границы и говорить "нет" без чувства вины
-- Отделить свою ценность от мнения окружающих
-- Разрешить себе получать удовольствие без отработки страданием
-
-Примеры ПЛОХИХ уроков (слишком общие):
-- Практика принятия себя
-- Работа с самооценкой
-- Гармонизация энергии
-
-ФОРМАТ:
-ТЕМА: [одно слово]
-
-ПРОГРАММЫ:
-- «...»
-- «...»
-- «...»
-[минимум 3, лучше 4-5]
-
-УРОКИ ДУШИ:
-1. [конкретное действие]
-2. [конкретное действие]
-3. [конкретное действие]
-
-ЧТО МЕНЯТЬ:
-- [конкретика с примером]
-- [конкретика с примером]
-- [конкретика с примером]
+Результат анализа — AnalysisResult (analysis_result.py): текст разбора вместе с
+разделами, программами и чакрами, разобранными один раз после финального шага.
 """
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=800  # Увеличили для 3+ программ и уроков
-        )
-
-        return response.choices[0].message.content, response.usage
-
-    def _step2_ancestral_patterns(self, request_text: str, step1_result: str) -> tuple:
-        """Шаг 2: Родовые влияния и кармические паттерны"""
-
-        prompt = f"""Ты — эксперт Мета-Метода Natalie Zemskova. Пиши с глубиной 7-10 минут консультации.
-
-Запрос: "{request_text}"
-Анализ: {step1_result}
-
-Определи ПЯТЬ частей:
-
-1. КОНТРАКТ (одно предложение - прямая цитата в кавычках с феминизацией если нужно)
-   Пример: «без её любви я не могу/не могу быть счастливой/счастливым»
-
-2. РАСШИФРОВКА КОНТРАКТА (5-7 предложений):
-   - ГДЕ ЭТО ПРОЯВЛЯЛОСЬ в жизни человека (конкретные примеры поведения)
-   - КАК ЭТО ВЛИЯЛО В ПРОШЛОМ (какие решения принимались из-за этого)
-   - КАК ЭТО БУДЕТ ВЛИЯТЬ В БУДУЩЕМ, если не менять (к чему приведёт)
-
-   Примеры:
-   - "Это проявляется в том, что ты постоянно ищешь подтверждения своей ценности через других. В прошлом это приводило к тому, что ты выбирал/выбирала партнёров, которые тебя обесценивали. В будущем, если не изменить эту программу, ты будешь притягивать тех, кто не видит твою истинную ценность."
-   - "Где это проявлялось: ты жертвовала собой ради семьи, забывая о своих потребностях. Как влияло в прошлом: ты выгорела эмоционально, накопила обиду. Как будет влиять в будущем: без изменений программы продолжится истощение, болезни от подавленных чувств."
-
-3. СЛОИ - КОНКРЕТНЫЕ ПОКОЛЕНИЯ (3-4 предложения):
-   ВАЖНО: Указывай КОНКРЕТНОЕ поколение и КОНКРЕТНУЮ линию!
-   НЕ пиши просто "род" или "предки" — называй точно!
-
-   Используй фразы:
-   - "Программа идёт от бабушки по маминой линии"
-   - "Эта программа от прабабушки по папиной линии"
-   - "По роду, по папиной линии, через дедушку"
-   - "От мамы, а у неё от её бабушки"
-   - "Корни уходят к прабабушкам по обеим линиям"
-   - "Программа нищеты по маминой линии от прабабушки"
-   - "Программа женского бесправия по женской линии от бабушки"
-
-   Примеры ХОРОШИЕ:
-   - "Программа тянется от бабушки по маминой линии — там опыт подавления чувств. Она молчала о своих желаниях всю жизнь. Это передалось маме, а от неё — тебе."
-   - "Идёт от прабабушки по папиной линии. В её время женщины не имели права голоса. Бабушка переняла это, папа вырос с этим паттерном."
-
-   Примеры ПЛОХИЕ (слишком общие):
-   - "Программа идёт из рода" ❌
-   - "Передалось от предков" ❌
-   - "Родовая программа" ❌
-
-4. РОДОВЫЕ ДЕТАЛИ - конкретный сценарий (2-3 предложения с ЦИТАТОЙ)
-   ОБЯЗАТЕЛЬНО отличается от пункта 3!
-   Примеры:
-   - "По маминой линии есть сценарий: «жертва ради детей». Женщины жили ради детей, забывая себя. Это усиливает твоё выгорание сейчас."
-   - "В роду по папиной линии женщины считали: «я должна/должен отдавать всё семье». Личные желания подавлялись. Ты повторяешь этот паттерн."
-
-5. ПРОШЛЫЕ ЖИЗНИ (2-3 предложения или "Опыт не прослеживается напрямую")
-   Если есть, опиши конкретный опыт с кармическими последствиями.
-
-ФОРМАТ ОТВЕТА:
-КОНТРАКТ: «...»
-
-РАСШИФРОВКА:
-[5-7 предложений: где проявлялось, как влияло в прошлом, как будет влиять в будущем]
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+import openai
+from openai.types import CompletionUsage
+import config
+from analysis_assembler import StructuredAnalysisError, assemble_analysis, parse_structured_analysis
+from analysis_result import AnalysisResult
+from cost_calculator import calculate_cost
+from llm_scheduler import get_scheduler, estimate_tokens
+from openai_clients import get_openai_client, get_async_openai_client
+from metamethod_prompts import (
+    STEP1_PROGRAMS_PROMPT,
+    STEP2_ANCESTRAL_PROMPT,
+    STEP3_CHAKRAS_PROMPT,
+    STEP4_PHRASES_PROMPT,
+    STEP5_COMPOSITION_PROMPT,
+    STEP5_PROSE_PROMPT,
+    STRUCTURED_ANALYSIS_PROMPT,
+)
+from config import OPENAI_MODEL
+
+logger = logging.getLogger(__name__)
+
+# Граф шагов пайплайна: шаг → шаги, результаты которых ему нужны.
+# Шаг запускается, как только готовы все его зависимости:
+# род и чакры идут параллельно, фразы не ждут чакр.
+PIPELINE_STEPS = {
+    'programs': (),                                               # Шаг 1: программы
+    'ancestral': ('programs',),                                   # Шаг 2: род
+    'chakras': ('programs',),                                     # Шаг 3: чакры
+    'phrases': ('programs', 'ancestral'),                         # Шаг 4: фразы
+    'composition': ('programs', 'ancestral', 'chakras', 'phrases'),  # Шаг 5: компоновка
+}
+FINAL_STEP = 'composition'
+
+# Режим 'structured' — граф из одного шага
+STRUCTURED_PIPELINE_STEPS = {
+    'structured': (),
+}
+
+ANALYSIS_MODES = ('llm', 'assembled', 'structured')
+DEFAULT_ANALYSIS_MODE = getattr(config, 'ANALYSIS_MODE', 'llm')
+
+# Названия этапов для пользователя (как в сообщении "программы → род → чакры → фразы → компоновка")
+STEP_TITLES = {
+    'programs': 'программы',
+    'ancestral': 'род',
+    'chakras': 'чакры',
+    'phrases': 'фразы',
+    'composition': 'компоновка',
+    'structured': 'единый анализ',
+}
+
+# Последние длительности каждого этапа — для p50/p95 в логах
+STAGE_LATENCY_WINDOW = 200
+_stage_latencies = {step: deque(maxlen=STAGE_LATENCY_WINDOW) for step in STEP_TITLES}
+
+# Длительности отдельных успешных запросов шага (без ожидания в планировщике, повторов
+# и пауз backoff) — по ним порог хеджирования
+_attempt_latencies = {step: deque(maxlen=STAGE_LATENCY_WINDOW) for step in STEP_TITLES}
+
+
+@dataclass(frozen=True, slots=True)
+class StepPolicy:
+    """
+    Правила выполнения одного шага:
+    timeout — секунд на один запрос к модели;
+    retries — сколько раз повторить после временной ошибки или таймаута;
+    backoff_base / backoff_max — задержка перед повтором: base * 2^попытка, не больше max, ±50% джиттер;
+    hedge — слать дубль, если запрос идёт дольше p90 шага (нужно hedge_min_samples замеров)
+    """
+    timeout: float = 90.0
+    retries: int = 2
+    backoff_base: float = 1.0
+    backoff_max: float = 10.0
+    hedge: bool = True
+    hedge_min_samples: int = 20
+
+
+# Компоновка идёт стримом — дубль не хеджируем, только повторяем; ей же нужен самый длинный таймаут
+DEFAULT_STEP_POLICIES = {
+    'programs': StepPolicy(timeout=90),
+    'ancestral': StepPolicy(timeout=90),
+    'chakras': StepPolicy(timeout=90),
+    'phrases': StepPolicy(timeout=90),
+    'composition': StepPolicy(timeout=180, retries=1, hedge=False),
+    'structured': StepPolicy(timeout=240, retries=1),
+}
+
+# Общий дедлайн скана, секунд (включая ожидание в планировщике)
+ANALYSIS_SCAN_DEADLINE = getattr(config, 'ANALYSIS_SCAN_DEADLINE', 600)
+
+# Ошибки, после которых шаг имеет смысл повторить
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    StructuredAnalysisError,  # 'structured': JSON битый или не по схеме — повторный ответ обычно целый
+)
+
+
+class AnalysisDeadlineError(Exception):
+    """Скан не уложился в общий дедлайн"""
+
+
+def cached_prompt_tokens(usage) -> int:
+    """Сколько токенов промпта провайдер взял из кеша (prompt_tokens_details.cached_tokens)"""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if not details:
+        return 0
+    if isinstance(details, dict):
+        # Старые версии SDK отдают неизвестные поля словарём
+        return details.get('cached_tokens') or 0
+    return getattr(details, 'cached_tokens', 0) or 0
+
+
+def _percentile(values: list, percent: int) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    index = max(0, int(round(percent / 100 * len(values))) - 1)
+    return values[index]
+
+
+def stage_latency_percentiles() -> dict:
+    """
+    Перцентили длительности этапов за последние STAGE_LATENCY_WINDOW сканов
+    Возвращает {шаг: {'count': int, 'p50': float, 'p95': float}}
+    """
+    report = {}
+    for step, durations in _stage_latencies.items():
+        if durations:
+            values = sorted(durations)
+            report[step] = {
+                'count': len(values),
+                'p50': round(_percentile(values, 50), 2),
+                'p95': round(_percentile(values, 95), 2),
+            }
+    return report
 
-СЛОИ (КОНКРЕТНЫЕ ПОКОЛЕНИЯ):
-[3-4 предложения с указанием КОНКРЕТНОГО поколения и линии: бабушка/прабабушка по маминой/папиной линии]
 
-РОДОВЫЕ_ДЕТАЛИ:
-[2-3 предложения - КОНКРЕТИКА с цитатой сценария]
+class MetaMethodAnalyzer:
+    def __init__(self, client=None, async_client=None, mode: str = None, scheduler=None,
+                 step_policies: dict = None, scan_deadline: float = None):
+        """
+        step_policies: {шаг: StepPolicy} — поверх DEFAULT_STEP_POLICIES
+        scan_deadline: общий дедлайн скана в секундах (по умолчанию ANALYSIS_SCAN_DEADLINE)
+        """
+        # По умолчанию — общие клиенты процесса (openai_clients.py) с keep-alive пулом.
+        # Повторы делает сам анализатор (StepPolicy), поэтому у async клиента свои отключены
+        self.client = client or get_openai_client()
+        self.async_client = async_client or get_async_openai_client(max_retries=0)
+        self.scheduler = scheduler or get_scheduler()
+        self.step_policies = {**DEFAULT_STEP_POLICIES, **(step_policies or {})}
+        self.scan_deadline = scan_deadline or ANALYSIS_SCAN_DEADLINE
+        self.model = OPENAI_MODEL
+        self.mode = mode or DEFAULT_ANALYSIS_MODE
+        if self.mode not in ANALYSIS_MODES:
+            raise ValueError(f"Неизвестный режим анализа: {self.mode}")
 
-ПРОШЛЫЕ ЖИЗНИ:
-[2-3 предложения или "Опыт не прослеживается напрямую"]
-"""
+        self.steps = STRUCTURED_PIPELINE_STEPS if self.mode == 'structured' else PIPELINE_STEPS
+        self.final_step = list(self.steps)[-1]
+        # Шаги, которым нужен только текст запроса (имя использует лишь финальный) —
+        # их можно запустить заранее, пока бот ждёт имя или фото
+        self.speculative_steps = tuple(step for step in self.steps if step != self.final_step)
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1000  # Увеличили для расшифровки и конкретных поколений
+    def analyze(self, request_text: str, username: str, checkpoint=None) -> tuple:
+        """
+        Выполняет полный анализ через 5 шагов (синхронно, для CLI)
+        Шаги идут по очереди в порядке графа (PIPELINE_STEPS или STRUCTURED_PIPELINE_STEPS).
+        checkpoint — хранилище готовых шагов (ScanCheckpoint): load() → {шаг: (ответ, usage, секунды)},
+        save(шаг, ответ, usage, секунды); шаги из него не вызываются повторно
+        Возвращает (AnalysisResult, usage_info)
+        где usage_info = {'total_tokens': int, 'prompt_tokens': int, 'completion_tokens': int,
+                          'cached_prompt_tokens': int, 'cost_usd': float,
+                          'step_timings': {шаг: секунды}, 'step_cached_tokens': {шаг: токены}, 'mode': str,
+                          'resumed_steps': [шаги, взятые из чекпоинта]}
+        Токены и стоимость — за весь скан, включая шаги из чекпоинта
+        """
+        results, usages, timings = {}, {}, {}
+        restored = self._restore_checkpoint(checkpoint, request_text, username, results, usages, timings)
+
+        for step in self.steps:
+            if step in results:
+                continue
+            started = time.perf_counter()
+            text, usages[step] = self._complete(self._build_step(step, request_text, username, results))
+            results[step] = self._finish_step(step, text, request_text, username, results)
+            timings[step] = time.perf_counter() - started
+            self._save_checkpoint(checkpoint, step, text, usages[step], timings[step])
+
+        return results[self.final_step], self._build_usage_info(usages, timings, restored)
+
+    async def analyze_async(self, request_text: str, username: str,
+                            on_composition_delta=None, on_progress=None, user_id=None,
+                            checkpoint=None, steps: tuple = None) -> tuple:
+        """
+        Выполняет полный анализ на асинхронном клиенте по графу PIPELINE_STEPS.
+        Каждый шаг стартует, как только готовы его зависимости, поэтому
+        шаги 2 и 3 идут параллельно, а шаг 4 не ждёт шаг 3.
+        Бот при этом продолжает обслуживать других пользователей.
+
+        on_composition_delta: async-функция (текст_на_данный_момент) — если передана,
+        финальная компоновка идёт стримом и функция вызывается на каждый фрагмент.
+        on_progress: async-функция (событие) — получает список этапов и события их начала и конца:
+            {'type': 'pipeline_started', 'steps': [str], 'titles': [str]}
+            {'type': 'stage_restored', 'step': str, 'title': str} — шаг взят из чекпоинта
+            {'type': 'queued', 'step': str, 'title': str, 'position': int} — шаг ждёт в очереди планировщика
+            {'type': 'stage_started', 'step': str, 'title': str}
+            {'type': 'stage_finished', 'step': str, 'title': str, 'duration': float,
+             'prompt_tokens': int, 'completion_tokens': int, 'total_tokens': int, 'cached_tokens': int}
+        user_id: ключ честной очереди планировщика (по умолчанию username)
+        checkpoint: хранилище готовых шагов — см. analyze()
+        steps: выполнить только эти шаги (например, speculative_steps); их зависимости должны
+        входить в steps или быть в чекпоинте. Если финальный шаг не выполнялся, вместо AnalysisResult — None
+        Возвращает то же, что и analyze()
+        Если скан не уложился в scan_deadline — AnalysisDeadlineError
+        """
+        queue_key = user_id if user_id is not None else username
+        deadline = asyncio.get_running_loop().time() + self.scan_deadline
+        results, usages, timings = {}, {}, {}
+        # Чекпоинт — синхронный psycopg2: чтение и запись идут в потоке, цикл событий не ждёт БД
+        restored = await asyncio.to_thread(
+            self._restore_checkpoint, checkpoint, request_text, username, results, usages, timings
         )
-
+        pending = {
+            step: depends_on for step, depends_on in self.steps.items()
+            if step not in results and (steps is None or step in steps)
+        }
+        running = {}
+
+        await self._emit({
+            'type': 'pipeline_started',
+            'steps': list(self.steps),
+            'titles': [STEP_TITLES[step] for step in self.steps],
+        }, on_progress)
+        for step in restored:
+            await self._emit({'type': 'stage_restored', 'step': step, 'title': STEP_TITLES[step]}, on_progress)
+
+        async def run_step(step: str, params: dict) -> tuple:
+            async def on_position(position: int):
+                await self._emit(
+                    {'type': 'queued', 'step': step, 'title': STEP_TITLES[step], 'position': position},
+                    on_progress
+                )
+
+            started = None
+
+            async def on_started():
+                nonlocal started
+                started = time.perf_counter()
+                await self._emit({'type': 'stage_started', 'step': step, 'title': STEP_TITLES[step]}, on_progress)
+
+            stream = step == self.final_step and on_composition_delta and self.mode == 'llm'
+            text, usage = await self._call_with_policy(
+                step, params, queue_key, deadline,
+                on_position=on_position,
+                on_started=on_started,
+                on_delta=on_composition_delta if stream else None,
+            )
+            result = self._finish_step(step, text, request_text, username, results)
+            duration = time.perf_counter() - started
+            await asyncio.to_thread(self._save_checkpoint, checkpoint, step, text, usage, duration)
+
+            await self._emit({
+                'type': 'stage_finished',
+                'step': step,
+                'title': STEP_TITLES[step],
+                'duration': duration,
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens,
+                'total_tokens': usage.total_tokens,
+                'cached_tokens': cached_prompt_tokens(usage),
+            }, on_progress)
+
+            return result, usage, duration
+
+        try:
+            while pending or running:
+                # Запускаем все шаги, у которых готовы зависимости
+                for step, depends_on in list(pending.items()):
+                    if all(dep in results for dep in depends_on):
+                        del pending[step]
+                        params = self._build_step(step, request_text, username, results)
+                        running[asyncio.create_task(run_step(step, params))] = step
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    step = running.pop(task)
+                    results[step], usages[step], timings[step] = task.result()
+        finally:
+            # Если какой-то шаг упал — не оставляем висеть остальные запросы
+            for task in running:
+                task.cancel()
+
+        return results.get(self.final_step), self._build_usage_info(usages, timings, restored)
+
+    def _restore_checkpoint(self, checkpoint, request_text: str, username: str,
+                            results: dict, usages: dict, timings: dict) -> list:
+        """
+        Заполняет results/usages/timings готовыми шагами из чекпоинта (в порядке графа:
+        шаг берётся, только если восстановлены все его зависимости). Возвращает список этих шагов
+        """
+        if checkpoint is None:
+            return []
+        try:
+            saved = checkpoint.load()
+        except Exception as e:
+            # Без чекпоинта скан просто пройдёт все шаги заново
+            logger.warning(f"⚠️ Не удалось прочитать чекпоинт скана: {e}")
+            return []
+
+        restored = []
+        for step, depends_on in self.steps.items():
+            if step in saved and all(dep in results for dep in depends_on):
+                text, usages[step], timings[step] = saved[step]
+                results[step] = self._finish_step(step, text, request_text, username, results)
+                restored.append(step)
+
+        if restored:
+            logger.info(f"♻️ Из чекпоинта взяты шаги: {', '.join(STEP_TITLES[step] for step in restored)}")
+        return restored
+
+    @staticmethod
+    def _save_checkpoint(checkpoint, step: str, text: str, usage, duration: float):
+        """Сохраняет ответ шага; ошибка записи не роняет анализ — шаг лишь не попадёт в чекпоинт"""
+        if checkpoint is None:
+            return
+        try:
+            checkpoint.save(step, text, usage, duration)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить чекпоинт шага {step}: {e}")
+
+    async def _call_with_policy(self, step: str, params: dict, queue_key, deadline: float,
+                                on_position=None, on_started=None, on_delta=None) -> tuple:
+        """
+        Вызов модели для шага по его StepPolicy: повторы с backoff на временных ошибках,
+        хеджирование медленного запроса и общий дедлайн скана. Возвращает (текст, usage)
+        on_started() вызывается один раз — когда первый запрос шага получил бюджет планировщика
+        """
+        policy = self.step_policies[step]
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(policy.retries + 1):
+            try:
+                text, usage = await self._hedged_attempt(step, params, policy, queue_key, deadline,
+                                                         on_position, on_started, on_delta)
+                if step == 'structured':
+                    parse_structured_analysis(text)  # Не по схеме — повтор, а не ошибка скана в _finish_step
+                return text, usage
+            except RETRYABLE_ERRORS as e:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise AnalysisDeadlineError(f"Скан не уложился в {self.scan_deadline:.0f}с (шаг {step})") from e
+                if attempt == policy.retries:
+                    raise
+
+                delay = min(policy.backoff_max, policy.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.5)
+                if delay >= remaining:
+                    raise AnalysisDeadlineError(f"Скан не уложился в {self.scan_deadline:.0f}с (шаг {step})") from e
+                logger.warning(
+                    f"🔁 Шаг «{STEP_TITLES[step]}»: {type(e).__name__}, "
+                    f"повтор {attempt + 1}/{policy.retries} через {delay:.1f}с"
+                )
+                await asyncio.sleep(delay)
+            finally:
+                on_started = None  # stage_started — только для первой попытки
+
+    async def _hedged_attempt(self, step: str, params: dict, policy: StepPolicy, queue_key, deadline: float,
+                              on_position=None, on_started=None, on_delta=None) -> tuple:
+        """
+        Одна попытка шага. Если запрос идёт дольше p90 шага, параллельно уходит дубль;
+        побеждает первый успешный ответ, второй запрос отменяется
+        """
+        loop = asyncio.get_running_loop()
+        first_started = asyncio.Event()
+
+        async def single(on_position=None):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise AnalysisDeadlineError(f"Скан не уложился в {self.scan_deadline:.0f}с (шаг {step})")
+
+            reserved = estimate_tokens(params)
+            try:
+                await asyncio.wait_for(self.scheduler.acquire(queue_key, reserved, on_position), remaining)
+            except asyncio.TimeoutError:
+                raise AnalysisDeadlineError(
+                    f"Скан не уложился в {self.scan_deadline:.0f}с (шаг {step} ждал в очереди)"
+                ) from None
+
+            # Бюджет взят: сверяем его с usage и тогда, когда запрос отменён (проигравший дубль)
+            # или упал, — иначе зарезервированные токены навсегда пропадают из TPM
+            used = 0
+            try:
+                if not first_started.is_set():
+                    first_started.set()
+                    if on_started:
+                        await on_started()
+
+                started = loop.time()
+                timeout = min(policy.timeout, deadline - started)
+                call = self._astream(params, on_delta) if on_delta else self._acomplete(params)
+                text, usage = await asyncio.wait_for(call, timeout)
+                used = usage.total_tokens
+                _attempt_latencies[step].append(loop.time() - started)
+                return text, usage
+            finally:
+                self.scheduler.settle(reserved, used)
+
+        hedge_after = self._hedge_delay(step, policy) if not on_delta else None
+        if hedge_after is None:
+            return await single(on_position)
+
+        primary = asyncio.ensure_future(single(on_position))
+        tasks = {primary}
+        waiting_start = asyncio.ensure_future(first_started.wait())
+        try:
+            # Порог — по длительности самого запроса: отсчёт с момента, когда запрос получил бюджет
+            await asyncio.wait({primary, waiting_start}, return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                logger.info(f"🪞 Шаг «{STEP_TITLES[step]}» дольше p90 ({hedge_after:.1f}с) — отправляю дубль")
+                tasks.add(asyncio.ensure_future(single()))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            waiting_start.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def _hedge_delay(self, step: str, policy: StepPolicy):
+        """Через сколько секунд слать дубль: скользящий p90 одного запроса шага (None — не хеджировать)"""
+        durations = _attempt_latencies.get(step)
+        if not policy.hedge or not durations or len(durations) < policy.hedge_min_samples:
+            return None
+        return _percentile(sorted(durations), 90)
+
+    async def _emit(self, event: dict, on_progress=None):
+        """
+        Рассылает событие этапа: в статистику латентности, в лог и подписчику.
+        Ошибка подписчика (например, Telegram не дал отредактировать сообщение) не роняет анализ.
+        """
+        if event['type'] == 'stage_finished':
+            _stage_latencies[event['step']].append(event['duration'])
+            p95 = stage_latency_percentiles()[event['step']]['p95']
+            logger.info(
+                f"⏱ Этап «{event['title']}»: {event['duration']:.2f}с, "
+                f"{event['total_tokens']} токенов (p95 этапа: {p95:.2f}с)"
+            )
+
+        if on_progress:
+            try:
+                await on_progress(event)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка обработчика прогресса: {e}")
+
+    def _build_step(self, step: str, request_text: str, username: str, results: dict) -> dict:
+        """Параметры запроса к модели для шага графа из результатов его зависимостей"""
+        if step == 'programs':
+            return self._step1_deep_analysis(request_text, username)
+        if step == 'ancestral':
+            return self._step2_ancestral_patterns(request_text, results['programs'])
+        if step == 'chakras':
+            return self._step3_chakra_analysis(request_text, results['programs'])
+        if step == 'phrases':
+            return self._step4_transformation_phrases(request_text, results['programs'], results['ancestral'])
+        if step == 'composition' and self.mode == 'assembled':
+            return self._step5_prose(
+                username, request_text, results['programs'], results['ancestral'], results['chakras']
+            )
+        if step == 'composition':
+            return self._step5_final_composition(
+                username, request_text,
+                results['programs'], results['ancestral'], results['chakras'], results['phrases']
+            )
+        if step == 'structured':
+            return self._structured_analysis(request_text, username)
+        raise ValueError(f"Неизвестный шаг пайплайна: {step}")
+
+    def _finish_step(self, step: str, text: str, request_text: str, username: str, results: dict):
+        """
+        Результат шага из ответа модели: текст для промежуточных шагов,
+        AnalysisResult для финального (в режиме 'assembled' разбор здесь же собирается локально)
+        """
+        if step == 'structured':
+            return AnalysisResult.from_structured(parse_structured_analysis(text), username, request_text)
+        if step == FINAL_STEP and self.mode == 'assembled':
+            text = assemble_analysis(
+                username, request_text,
+                results['programs'], results['ancestral'], results['chakras'], results['phrases'],
+                prose=text
+            )
+        if step == self.final_step:
+            return AnalysisResult.from_text(text, username, request_text)
+        return text
+
+    def _complete(self, params: dict) -> tuple:
+        """Синхронный вызов модели (с ожиданием бюджета планировщика). Возвращает (текст, usage)"""
+        reserved = estimate_tokens(params)
+        self.scheduler.acquire_sync(reserved)
+        used = 0  # Нет ответа (ошибка API, таймаут) — резерв возвращается в TPM целиком
+        try:
+            response = self.client.chat.completions.create(model=self.model, **params)
+            used = response.usage.total_tokens
+        finally:
+            self.scheduler.settle(reserved, used)
         return response.choices[0].message.content, response.usage
 
-    def _step3_chakra_analysis(self, request_text: str, step1_result: str) -> tuple:
-        """Шаг 3: Анализ энергетики по чакрам С ПРОЦЕНТАМИ"""
-
-        prompt = f"""Ты — эксперт Мета-Метода Natalie Zemskova. Опиши чакры с ПРОЦЕНТАМИ.
-
-Запрос: "{request_text}"
-Анализ: {step1_result}
-
-ВАЖНО: Для КАЖДОЙ чакры укажи ПРОЦЕНТ работы в отношении этого запроса!
-
-ПРОЦЕНТ РАБОТЫ ЧАКРЫ:
-- 90-100% = чакра работает отлично, зелёная зона 🟢
-- 65-89% = есть проблемы, оранжевая зона 🟠
-- Менее 65% = серьёзная блокировка, красная зона 🔴
-
-Опиши каждую чакру:
-1. ПРОЦЕНТ (например: "40%", "75%", "95%")
-2. КОРОТКОЕ ОПИСАНИЕ состояния (5-10 слов)
-3. ПЕРСОНАЛЬНЫЙ КОММЕНТАРИЙ по запросу человека (как конкретно это проявляется в его ситуации)
-
-Используй яркие глаголы:
-- ослаблена, сжата, перегружена, перекрыта, заблокирована
-- чувства блокируются, боль застряла, слова не выходят
-- энергия утекает, центр закрыт, пропускает на X%
-
-ХОРОШИЙ пример (с процентом и персональным комментарием):
-"🔴 Муладхара - 40%. Ослаблена, ощущение нестабильности. В твоём запросе это проявляется как страх финансовой нестабильности."
-"🟠 Свадхистхана - 70%. Сжата — чувства блокируются. Ты подавляешь свои желания ради других."
-"💚 Анахата - 85%. Перегружена — там застряла боль от непринятия. Ты отдаёшь больше, чем получаешь."
-
-ФОРМАТ (для каждой чакры: эмодзи + название + процент + описание + персональный комментарий):
-🔴 Муладхара (1-я чакра, безопасность) - [процент]%. [Состояние]. [Персональный комментарий по запросу].
-🟠 Свадхистхана (2-я чакра, чувства и желания) - [процент]%. [Состояние]. [Персональный комментарий].
-🟡 Манипура (3-я чакра, сила воли) - [процент]%. [Состояние]. [Персональный комментарий].
-💚 Анахата (4-я чакра, сердце и любовь) - [процент]%. [Состояние]. [Персональный комментарий].
-💙 Вишудха (5-я чакра, самовыражение) - [процент]%. [Состояние]. [Персональный комментарий].
-💜 Аджна (6-я чакра, интуиция) - [процент]%. [Состояние]. [Персональный комментарий].
-🤍 Сахасрара (7-я чакра, связь с высшим) - [процент]%. [Состояние]. [Персональный комментарий].
-
-Каждая чакра = 2-3 предложения МАКСИМУМ.
-"""
+    async def _acomplete(self, params: dict) -> tuple:
+        """Асинхронный вызов модели. Возвращает (текст, usage)"""
+        response = await self.async_client.chat.completions.create(model=self.model, **params)
+        return response.choices[0].message.content, response.usage
 
-        response = self.client.chat.completions.create(
+    async def _astream(self, params: dict, on_delta) -> tuple:
+        """
+        Асинхронный вызов модели в режиме стрима.
+        on_delta(текст_на_данный_момент) вызывается на каждый пришедший фрагмент.
+        Возвращает (текст, usage) — как _acomplete()
+        """
+        stream = await self.async_client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=800  # Увеличили для персональных комментариев
+            stream=True,
+            # Без этого в стриме не приходит usage и стоимость не посчитать
+            extra_body={"stream_options": {"include_usage": True}},
+            **params
         )
 
-        return response.choices[0].message.content, response.usage
-
-    def _step4_transformation_phrases(self, request_text: str, step1_result: str, step2_result: str) -> tuple:
-        """Шаг 4: Генерация трансформационных фраз"""
+        text = ''
+        usage = None
+        chunks_count = 0
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                text += chunk.choices[0].delta.content
+                chunks_count += 1
+                await on_delta(text)
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+
+        if usage is None:
+            # Провайдер не прислал usage — считаем примерно: один фрагмент ≈ один токен
+            logger.warning("⚠️ Стрим завершился без usage, токены посчитаны приблизительно")
+            usage = CompletionUsage(prompt_tokens=0, completion_tokens=chunks_count, total_tokens=chunks_count)
+        elif isinstance(usage, dict):
+            usage = CompletionUsage(**usage)
+
+        return text, usage
+
+    def _build_usage_info(self, usages: dict, timings: dict, resumed_steps: list = ()) -> dict:
+        """Суммирует usage всех шагов, рассчитывает стоимость и логирует время шагов"""
+        prompt_tokens = sum(usage.prompt_tokens for usage in usages.values())
+        completion_tokens = sum(usage.completion_tokens for usage in usages.values())
+        step_cached_tokens = {step: cached_prompt_tokens(usage) for step, usage in usages.items()}
+        cached_tokens = sum(step_cached_tokens.values())
+        step_timings = {step: round(seconds, 2) for step, seconds in timings.items()}
+
+        logger.info(f"⏱ Время шагов анализа: {step_timings}")
+        logger.info(f"💾 Из кеша промпта: {cached_tokens} из {prompt_tokens} токенов {step_cached_tokens}")
+
+        return {
+            'total_tokens': sum(usage.total_tokens for usage in usages.values()),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_prompt_tokens': cached_tokens,
+            'cost_usd': calculate_cost(self.model, prompt_tokens, completion_tokens, cached_tokens),
+            'step_timings': step_timings,
+            'step_cached_tokens': step_cached_tokens,
+            'mode': self.mode,
+            'resumed_steps': list(resumed_steps)
+        }
 
-        prompt = f"""Ты — эксперт Мета-Метода Natalie Zemskova. Создай трансформационные фразы с феминизацией.
+    def _step1_deep_analysis(self, request_text: str, username: str) -> dict:
+        """Шаг 1: Глубинный анализ запроса и выявление ключевых программ — параметры запроса к модели"""
 
-Запрос: "{request_text}"
-Программы: {step1_result}
-Родовое: {step2_result}
+        user_message = f'Запрос: "{request_text}"'
 
-ВАЖНО ПРО ФЕМИНИЗАЦИЮ:
-Все фразы должны быть в формате "я не достоин/достойна", "я разрешаю себе/себе", чтобы подходили для любого пола.
+        return {
+            "messages": [
+                {"role": "system", "content": STEP1_PROGRAMS_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 800  # Увеличили для 3+ программ и уроков
+        }
 
-ВАРИАНТ 1 (для сложных запросов) - ПОЛНАЯ ФОРМУЛА:
-"Я признаю и даю место всем опытам в этой жизни, в моём роду и в моих прошлых жизнях, где [конкретная проблема из запроса].
+    def _step2_ancestral_patterns(self, request_text: str, step1_result: str) -> dict:
+        """Шаг 2: Родовые влияния и кармические паттерны — параметры запроса к модели"""
 
-И даже если так было, и даже если всё это с нами происходило, я прямо сейчас себя и нас за всё прощаю. Я люблю нас всех так, как Бог нас любит. Я отдаю все долги с этим связанные и восстанавливаю все энерго-информационные балансы. Я разрешаю убрать всё то, чем я сам/сама держусь за эту программу. Я разрешаю убрать всё то, что меня держит в этой программе. Открываюсь новому, перерождаюсь и даю место новому."
+        user_message = f'''Запрос: "{request_text}"
+Анализ: {step1_result}'''
 
-Дополнительно 5-7 коротких фраз с феминизацией где нужно:
-- Я разрешаю себе/себе быть достойным/достойной...
-- Я выбираю...
-- Я достоин/достойна...
-- Моя [энергия/сила]...
-- Мне безопасно...
-- Я признаю, что...
+        return {
+            "messages": [
+                {"role": "system", "content": STEP2_ANCESTRAL_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 1000  # Увеличили для расшифровки и конкретных поколений
+        }
 
-ВАРИАНТ 2 (для более простых запросов) - ТОЛЬКО КОРОТКИЕ ФРАЗЫ (5-7 штук):
-• Я выбираю отпустить контроль и открыться жизни.
-• Я выбираю [конкретное действие под запрос].
-• Я разрешаю себе/себе быть достойным/достойной [чего-то конкретного].
-• Я выбираю доверять Богу и процессу жизни.
-• Я выбираю быть опорой сам/сама себе.
-• Мне безопасно [конкретное действие].
-• Я признаю свою ценность вне зависимости от [что-то из запроса].
+    def _step3_chakra_analysis(self, request_text: str, step1_result: str) -> dict:
+        """Шаг 3: Анализ энергетики по чакрам С ПРОЦЕНТАМИ — параметры запроса к модели"""
 
-РЕШИ: если запрос про глубокую травму/родовое — дай ВАРИАНТ 1
-Если запрос более лёгкий — дай ВАРИАНТ 2
+        user_message = f'''Запрос: "{request_text}"
+Анализ: {step1_result}'''
 
-Укажи в начале: "ФОРМАТ: полный" или "ФОРМАТ: короткий"
-"""
+        return {
+            "messages": [
+                {"role": "system", "content": STEP3_CHAKRAS_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 800  # Увеличили для персональных комментариев
+        }
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.8,
-            max_tokens=700  # Увеличили для 5-7 фраз
-        )
+    def _step4_transformation_phrases(self, request_text: str, step1_result: str, step2_result: str) -> dict:
+        """Шаг 4: Генерация трансформационных фраз — параметры запроса к модели"""
 
-        return response.choices[0].message.content, response.usage
+        user_message = f'''Запрос: "{request_text}"
+Программы: {step1_result}
+Родовое: {step2_result}'''
+
+        return {
+            "messages": [
+                {"role": "system", "content": STEP4_PHRASES_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": 0.8,
+            "max_tokens": 700  # Увеличили для 5-7 фраз
+        }
 
     def _step5_final_composition(self, username: str, request_text: str,
-                                 step1: str, step2: str, step3: str, step4: str) -> tuple:
-        """Шаг 5: Финальная компоновка всех частей в красивый формат"""
+                                 step1: str, step2: str, step3: str, step4: str) -> dict:
+        """Шаг 5: Финальная компоновка всех частей в красивый формат — параметры запроса к модели"""
 
-        prompt = f"""Ты — Мастер Мета-Метода Natalie Zemskova. Собери ФИНАЛЬНЫЙ разбор.
-
-Имя: {username}
+        user_message = f'''Имя: {username}
 Запрос: "{request_text}"
 
 ЧАСТИ:
 1. Программы: {step1}
 2. Родовое: {step2}
 3. Чакры: {step3}
-4. Фразы: {step4}
-
-ФИНАЛЬНЫЙ ФОРМАТ:
-
-## Сканер подсознания по Мета-Методу
-
-**Что такое "Сканер подсознания"?**
-Это глубинный анализ запроса через призму Мета-Метода. Я смотрю на программы подсознания, родовые влияния, энергетику чакр и даю конкретные практики для трансформации.
-
-✨ **Сканер подсознания по Мета-Методу для {username}**
-
-**Запрос:**
-[точная цитата запроса]
-
-**1. Контракты и подключки**
-
-Контракт: [возьми КОНТРАКТ из части 2 — одно предложение с цитатой в кавычках]
-
-• Как эта программа проявлялась в прошлом
-[из РАСШИФРОВКИ части 2: как влияло в прошлом, какие решения принимались, 2-3 предложения. Пример: "{username} постоянно ставил(а) потребности других выше своих..."]
-
-• Как это влияет сейчас
-[из РАСШИФРОВКИ части 2: где это проявляется в жизни человека, конкретные примеры поведения, 2-3 предложения. Пример: "{username} продолжает испытывать хроническую усталость... {username} притягивает людей, которые не ценят..."]
-
-• Как это может повлиять в будущем
-[из РАСШИФРОВКИ части 2: к чему приведёт, если не изменить программу, 1-2 предложения. Пример: "Если не изменить программу, {username} может продолжать чувствовать себя недооценённой..."]
-
-**2. Слои программ. Откуда идёт программа**
-
-• Эта жизнь
-[Короткая информация о формировании программы в этой жизни из части 2, 1-2 предложения, или "Основной источник — родовой уровень"]
-
-• Родовой слой
-[возьми СЛОИ (КОНКРЕТНЫЕ ПОКОЛЕНИЯ) из части 2 — с указанием поколения: бабушка/прабабушка по маминой/папиной линии, 2-3 предложения]
-
-• Конкретные родовые сценарии
-[возьми РОДОВЫЕ_ДЕТАЛИ из части 2 — конкретный сценарий с цитатой, 2-3 предложения]
-
-• Прошлые жизни
-[возьми ПРОШЛЫЕ ЖИЗНИ из части 2, или напиши "Опыт не прослеживается напрямую", 1-2 предложения]
-
-**3. Энергоцентры (Чакры) и поток энергии**
-
-Важно понимать, где энергия застревает на уровне 7 чакр в отношении запроса.
-
-[вставь ВСЕ 7 чакр из части 3 ТОЧНО как там написано, с процентами и персональными комментариями]
-
-**4. Главные программы, мешающие движению**
-[возьми ПРОГРАММЫ из части 1 — минимум 3 программы, список с тире в кавычках, с феминизацией]
-
-**5. Главные уроки души**
-[возьми УРОКИ ДУШИ из части 1 — минимум 3 конкретных урока с нумерацией]
-
-**6. Что важно изменить. Рекомендации**
-[возьми ЧТО МЕНЯТЬ из части 1 — список с тире, минимум 3 пункта, КОНКРЕТНО с примерами]
-
-**7. Трансформационные фразы**
-
-[возьми указание формата из части 4: "ФОРМАТ: полный" или "ФОРМАТ: короткий"]
-
-[вставь ВСЁ из части 4 — если там полная формула, вставь её целиком; если короткие фразы, вставь все 5-7 фраз]
-
-**8. Следующий шаг**
-
-[Напиши 2-3 конкретных практических совета как у Natalie, привязанных к конкретным пунктам анализа]
+4. Фразы: {step4}'''
+
+        return {
+            "messages": [
+                {"role": "system", "content": STEP5_COMPOSITION_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 3000  # Увеличили для более длинного и глубокого текста
+        }
 
-Примеры ХОРОШИХ рекомендаций (конкретные и привязанные):
-- "Для проработки Муладхары (пункт 3): начни каждый день делать практику 'Заземление' — 10 минут стоять босиком на земле."
-- "Для смены программы 'Я не достоин/достойна' (пункт 4): каждый вечер записывай 3 своих достижения за день, даже самых маленьких."
-- "Начать практику 'маленьких радостей': каждый день находи одну вещь для собственного удовольствия, не связанную с долженствованием."
+    def _step5_prose(self, username: str, request_text: str, step1: str, step2: str, step3: str) -> dict:
+        """Шаг 5 (режим 'assembled'): только проза для локальной сборки — параметры запроса к модели"""
 
-Примеры ПЛОХИХ рекомендаций (слишком общие):
-- "Практикуй принятие себя" ❌
-- "Работай с самооценкой" ❌
-- "Следующий шаг — двигаться дальше" ❌
+        user_message = f'''Имя: {username}
+Запрос: "{request_text}"
 
-ПРАВИЛА СТИЛЯ:
-- Используй тире (—) для пояснений
-- НЕ добавляй лишних вводных слов
-- НЕ пиши "важно отметить", "необходимо понимать" (кроме раздела про чакры)
-- Пиши как живой человек, а не как учебник
-- Все разделы должны быть наполнены контентом из анализа
-- Общая длина: 3000-3500 символов (глубина 7-10 минут чтения)
-- ОБРАЩЕНИЕ: Пиши о человеке в 3-м лице, используя имя "{username}" с правильными падежами. НЕ используй "ты/тебе/тебя" - только "{username} испытывает", "у {username} есть", "{username}" и т.д.
+ЧАСТИ:
+1. Программы: {step1}
+2. Родовое: {step2}
+3. Чакры: {step3}'''
+
+        return {
+            "messages": [
+                {"role": "system", "content": STEP5_PROSE_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "temperature": 0.7,
+            "max_tokens": 700  # Только проза контракта и советы, остальное собирается локально
+        }
 
-ВАЖНО: Только 8 пунктов (не 10!). НЕ добавляй раздел 9, 10, 11. НЕ добавляй "Вдохновляющее послание".
-"""
+    def _structured_analysis(self, request_text: str, username: str) -> dict:
+        """Режим 'structured': весь анализ одним вызовом в JSON — параметры запроса к модели"""
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=3000  # Увеличили для более длинного и глубокого текста
-        )
+        user_message = f'''Имя: {username}
+Запрос: "{request_text}"'''
 
-        return response.choices[0].message.content, response.usage
+        return {
+            "messages": [
+                {"role": "system", "content": STRUCTURED_ANALYSIS_PROMPT},
+                {"role": "user", "content": user_message}
+            ],
+            "response_format": {"type": "json_object"},
+            "temperature": 0.7,
+            "max_tokens": 3500  # Все части анализа в одном ответе
+        }
 
 
 # Функция для использования в боте
-async def analyze_with_metamethod(request_text: str, username: str) -> tuple:
+async def analyze_with_metamethod(request_text: str, username: str,
+                                  on_composition_delta=None, on_progress=None, mode: str = None,
+                                  user_id=None, checkpoint=None) -> tuple:
     """
     Главная функция для вызова из бота
-    Возвращает (результат_анализа, usage_info)
-    где usage_info = {"total_tokens": int, "prompt_tokens": int, "completion_tokens": int, "cost_usd": float}
+    on_composition_delta, on_progress — см. MetaMethodAnalyzer.analyze_async()
+    mode — режим анализа ('llm' / 'assembled' / 'structured'), по умолчанию config.ANALYSIS_MODE
+    user_id — пользователь Telegram, ключ честной очереди планировщика
+    checkpoint — ScanCheckpoint скана: готовые шаги не вызываются повторно
+    Возвращает (AnalysisResult, usage_info)
+    где usage_info = {"total_tokens": int, "prompt_tokens": int, "completion_tokens": int,
+                      "cached_prompt_tokens": int, "cost_usd": float,
+                      "step_timings": {шаг: секунды}, "step_cached_tokens": {шаг: токены}, "mode": str,
+                      "resumed_steps": [шаги из чекпоинта]}
     """
-    analyzer = MetaMethodAnalyzer()
-    result, usage_info = analyzer.analyze(request_text, username)
+    analyzer = MetaMethodAnalyzer(mode=mode)
+    result, usage_info = await analyzer.analyze_async(
+        request_text, username, on_composition_delta, on_progress, user_id=user_id, checkpoint=checkpoint
+    )
     return result, usage_info
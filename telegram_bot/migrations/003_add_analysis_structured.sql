@@ -0,0 +1,18 @@
+-- ============================================
+-- Миграция 003: Структурированный результат анализа
+-- Дата: 2026-10-18
+-- Описание: Рядом с текстом разбора храним AnalysisResult (analysis_result.py) —
+--           разделы, программы и чакры, разобранные анализатором один раз
+-- ============================================
+
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS analysis_structured JSONB;
+
+-- Комментарии
+COMMENT ON COLUMN analyses.analysis_structured IS 'AnalysisResult.to_dict(): {username, request_text, text, sections, programs, chakras}';
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 003 успешно применена!';
+    RAISE NOTICE 'Колонка analyses.analysis_structured добавлена';
+END $$;
@@ -0,0 +1,72 @@
+-- ============================================
+-- Миграция 004: Числовые оценки чакр
+-- Дата: 2026-10-18
+-- Описание: Проценты 7 чакр из разбора — отдельной строкой на анализ,
+--           чтобы считать средние по темам и датам без regex по analysis_result.
+--           Старые анализы заполняются скриптом backfill_chakra_scores.py
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS chakra_scores (
+    analysis_id INTEGER PRIMARY KEY REFERENCES analyses(id) ON DELETE CASCADE,
+
+    -- Проценты наполненности 0-100 (NULL — чакра не найдена в разборе)
+    muladhara SMALLINT CHECK (muladhara BETWEEN 0 AND 100),        -- 1. Безопасность
+    svadhisthana SMALLINT CHECK (svadhisthana BETWEEN 0 AND 100),  -- 2. Чувства и желания
+    manipura SMALLINT CHECK (manipura BETWEEN 0 AND 100),          -- 3. Сила воли
+    anahata SMALLINT CHECK (anahata BETWEEN 0 AND 100),            -- 4. Сердце и любовь
+    vishuddha SMALLINT CHECK (vishuddha BETWEEN 0 AND 100),        -- 5. Самовыражение
+    ajna SMALLINT CHECK (ajna BETWEEN 0 AND 100),                  -- 6. Интуиция
+    sahasrara SMALLINT CHECK (sahasrara BETWEEN 0 AND 100),        -- 7. Связь с высшим
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Индексы
+CREATE INDEX IF NOT EXISTS idx_chakra_scores_created ON chakra_scores(created_at);
+
+-- Комментарии
+COMMENT ON TABLE chakra_scores IS 'Проценты 7 чакр каждого анализа (из AnalysisResult.chakras)';
+COMMENT ON COLUMN chakra_scores.analysis_id IS 'analyses.id — одна строка на анализ';
+
+-- Средние оценки чакр по дням (рядом с analytics_summary)
+CREATE OR REPLACE VIEW chakra_scores_by_date AS
+SELECT
+    DATE(a.created_at) as date,
+    COUNT(*) as total_analyses,
+    ROUND(AVG(c.muladhara), 1) as avg_muladhara,
+    ROUND(AVG(c.svadhisthana), 1) as avg_svadhisthana,
+    ROUND(AVG(c.manipura), 1) as avg_manipura,
+    ROUND(AVG(c.anahata), 1) as avg_anahata,
+    ROUND(AVG(c.vishuddha), 1) as avg_vishuddha,
+    ROUND(AVG(c.ajna), 1) as avg_ajna,
+    ROUND(AVG(c.sahasrara), 1) as avg_sahasrara
+FROM chakra_scores c
+JOIN analyses a ON a.id = c.analysis_id
+GROUP BY DATE(a.created_at)
+ORDER BY date DESC;
+
+-- Средние оценки чакр по темам запросов (request_themes)
+CREATE OR REPLACE VIEW chakra_scores_by_theme AS
+SELECT
+    t.theme,
+    COUNT(*) as total_analyses,
+    ROUND(AVG(c.muladhara), 1) as avg_muladhara,
+    ROUND(AVG(c.svadhisthana), 1) as avg_svadhisthana,
+    ROUND(AVG(c.manipura), 1) as avg_manipura,
+    ROUND(AVG(c.anahata), 1) as avg_anahata,
+    ROUND(AVG(c.vishuddha), 1) as avg_vishuddha,
+    ROUND(AVG(c.ajna), 1) as avg_ajna,
+    ROUND(AVG(c.sahasrara), 1) as avg_sahasrara
+FROM chakra_scores c
+JOIN request_themes t ON t.analysis_id = c.analysis_id
+GROUP BY t.theme
+ORDER BY total_analyses DESC;
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 004 успешно применена!';
+    RAISE NOTICE 'Таблица chakra_scores создана';
+    RAISE NOTICE 'Представления chakra_scores_by_date и chakra_scores_by_theme добавлены';
+    RAISE NOTICE 'Для старых анализов: python backfill_chakra_scores.py';
+END $$;
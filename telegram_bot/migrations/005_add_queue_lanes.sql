@@ -0,0 +1,39 @@
+-- ============================================
+-- Миграция 005: Полосы очереди сканов
+-- Дата: 2026-10-18
+-- Описание: Для каждого анализа сохраняем полосу очереди (vip/paid/free)
+--           и сколько скан ждал места — чтобы видеть p95 ожидания платных
+--           пользователей во время бесплатных акций
+-- ============================================
+
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS priority_lane VARCHAR(20);
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS queue_wait_seconds REAL;
+
+CREATE INDEX IF NOT EXISTS idx_analyses_priority_lane ON analyses(priority_lane);
+
+-- Комментарии
+COMMENT ON COLUMN analyses.priority_lane IS 'Полоса очереди сканов: vip / paid / free (analysis_queue.py)';
+COMMENT ON COLUMN analyses.queue_wait_seconds IS 'Сколько секунд скан ждал места в очереди';
+
+-- Ожидание в очереди по полосам и дням
+CREATE OR REPLACE VIEW queue_wait_by_lane AS
+SELECT
+    DATE(a.created_at) as date,
+    a.priority_lane as lane,
+    COUNT(*) as total_analyses,
+    ROUND(AVG(a.queue_wait_seconds)::NUMERIC, 1) as avg_wait_seconds,
+    ROUND(PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY a.queue_wait_seconds)::NUMERIC, 1) as p50_wait_seconds,
+    ROUND(PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY a.queue_wait_seconds)::NUMERIC, 1) as p95_wait_seconds,
+    ROUND(MAX(a.queue_wait_seconds)::NUMERIC, 1) as max_wait_seconds
+FROM analyses a
+WHERE a.priority_lane IS NOT NULL
+GROUP BY DATE(a.created_at), a.priority_lane
+ORDER BY date DESC, lane;
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 005 успешно применена!';
+    RAISE NOTICE 'Колонки analyses.priority_lane и analyses.queue_wait_seconds добавлены';
+    RAISE NOTICE 'Представление queue_wait_by_lane добавлено';
+END $$;
@@ -0,0 +1,63 @@
+-- ============================================
+-- Миграция 006: Чекпоинты сканов
+-- Дата: 2026-10-18
+-- Описание: Скан (запрос → анализ → PDF) получает id до первого вызова модели,
+--           результат каждого шага пишется в scan_checkpoints сразу после шага.
+--           Повтор или перезапуск бота продолжает скан с последнего готового
+--           шага — оплачиваются только недостающие шаги
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS analysis_scans (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+    chat_id BIGINT NOT NULL,                 -- Куда отправить PDF при продолжении после перезапуска
+
+    -- Вход скана
+    username VARCHAR(255),
+    request_text TEXT NOT NULL,
+    photo_path VARCHAR(500),
+    analysis_mode VARCHAR(20),
+    priority_lane VARCHAR(20),
+
+    -- running — идёт (или бот упал посреди скана), failed — ошибка, ждёт повтора, done — PDF отправлен
+    status VARCHAR(20) DEFAULT 'running',
+    attempts INTEGER DEFAULT 1,
+    last_error TEXT,
+    analysis_id INTEGER REFERENCES analyses(id) ON DELETE SET NULL,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Результат шага пайплайна (сырой ответ модели) — одна строка на шаг скана
+CREATE TABLE IF NOT EXISTS scan_checkpoints (
+    scan_id INTEGER REFERENCES analysis_scans(id) ON DELETE CASCADE,
+    step VARCHAR(30) NOT NULL,
+    output TEXT NOT NULL,
+
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    total_tokens INTEGER DEFAULT 0,
+    cached_tokens INTEGER DEFAULT 0,
+    duration_seconds REAL,
+
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (scan_id, step)
+);
+
+-- Индексы
+CREATE INDEX IF NOT EXISTS idx_analysis_scans_user ON analysis_scans(user_id);
+CREATE INDEX IF NOT EXISTS idx_analysis_scans_status ON analysis_scans(status, updated_at);
+
+-- Комментарии
+COMMENT ON TABLE analysis_scans IS 'Сканы в работе и завершённые: вход скана и его статус';
+COMMENT ON TABLE scan_checkpoints IS 'Готовые шаги скана — при повторе не вызываются заново';
+COMMENT ON COLUMN analysis_scans.status IS 'running / failed / done';
+COMMENT ON COLUMN scan_checkpoints.output IS 'Ответ модели на шаге (до локальной сборки и замены местоимений)';
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 006 успешно применена!';
+    RAISE NOTICE 'Таблицы analysis_scans и scan_checkpoints добавлены';
+END $$;
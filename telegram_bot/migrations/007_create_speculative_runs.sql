@@ -0,0 +1,46 @@
+-- ============================================
+-- Миграция 007: Спекулятивные запуски шагов анализа
+-- Дата: 2026-10-18
+-- Описание: Шаги 1-4 запускаются, как только известен текст запроса, пока бот
+--           ждёт имя или фото (speculative_scan.py). Каждый запуск и стоимость его
+--           готовых шагов пишется отдельно от analyses: adopted — пригодился скану,
+--           changed / abandoned / expired — отменён, деньги потрачены впустую
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS speculative_runs (
+    id SERIAL PRIMARY KEY,
+    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL,            -- adopted / changed / abandoned / expired
+    steps_completed SMALLINT DEFAULT 0,     -- Сколько шагов успело завершиться
+    tokens_used INTEGER DEFAULT 0,
+    api_cost_usd DECIMAL(10, 6) DEFAULT 0,
+    lifetime_seconds REAL,                  -- От запуска до использования или отмены
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Индексы
+CREATE INDEX IF NOT EXISTS idx_speculative_runs_created ON speculative_runs(created_at);
+
+-- Комментарии
+COMMENT ON TABLE speculative_runs IS 'Спекулятивные запуски шагов 1-4 до имени/фото и их стоимость';
+COMMENT ON COLUMN speculative_runs.api_cost_usd IS 'Стоимость завершённых шагов; у adopted она же входит в analyses.api_cost_usd';
+
+-- Спекуляции по дням и статусам: сколько пригодилось и сколько потрачено впустую
+CREATE OR REPLACE VIEW speculative_cost_by_date AS
+SELECT
+    DATE(created_at) as date,
+    status,
+    COUNT(*) as total_runs,
+    SUM(steps_completed) as steps_completed,
+    SUM(tokens_used) as total_tokens,
+    ROUND(SUM(api_cost_usd)::NUMERIC, 4) as total_cost_usd
+FROM speculative_runs
+GROUP BY DATE(created_at), status
+ORDER BY date DESC, status;
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 007 успешно применена!';
+    RAISE NOTICE 'Таблица speculative_runs и представление speculative_cost_by_date добавлены';
+END $$;
@@ -0,0 +1,62 @@
+-- ============================================
+-- Миграция 008: Кэш склонений имён
+-- Дата: 2026-10-18
+-- Описание: Склонения каждого встреченного имени хранятся в name_declensions
+--           (ключ — нормализованное имя), перед таблицей в процессе бота стоит
+--           LRU (declension_cache.py). Запись после промаха — отложенная, пачкой.
+--           Неверные склонения правятся через manage_name_declensions.py.
+--           Счётчики источников по дням — для доли попаданий и сэкономленных
+--           запросов к модели в show_cost_stats.py
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS name_declensions (
+    name VARCHAR(100) PRIMARY KEY,          -- Нормализованное имя: 'Анна', 'Анна-Мария'
+    gender CHAR(1),                         -- f / m / NULL (не понять по окончанию)
+
+    nominative VARCHAR(100) NOT NULL,
+    genitive VARCHAR(100) NOT NULL,
+    dative VARCHAR(100) NOT NULL,
+    accusative VARCHAR(100) NOT NULL,
+    instrumental VARCHAR(100) NOT NULL,
+    prepositional VARCHAR(100) NOT NULL,
+
+    source VARCHAR(20) NOT NULL,            -- dictionary / rules / model / admin
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Откуда пришли склонения: по дню и источнику
+CREATE TABLE IF NOT EXISTS name_declension_stats (
+    date DATE NOT NULL DEFAULT CURRENT_DATE,
+    source VARCHAR(20) NOT NULL,            -- memory / db / dictionary / rules / model / fallback
+    lookups INTEGER DEFAULT 0,
+    PRIMARY KEY (date, source)
+);
+
+-- Индексы
+CREATE INDEX IF NOT EXISTS idx_name_declensions_source ON name_declensions(source, updated_at);
+
+-- Комментарии
+COMMENT ON TABLE name_declensions IS 'Кэш склонений имён: всё, что бот уже склонял, и правки администратора';
+COMMENT ON COLUMN name_declensions.source IS 'Кто склонил: dictionary / rules (локально), model (GPT), admin (исправлено вручную)';
+COMMENT ON TABLE name_declension_stats IS 'Сколько склонений по дням пришло из кэша, локального движка и модели';
+
+-- Доля попаданий в кэш и сэкономленные запросы к модели по дням
+CREATE OR REPLACE VIEW name_declension_hit_rate_by_date AS
+SELECT
+    date,
+    SUM(lookups) as total_lookups,
+    SUM(lookups) FILTER (WHERE source IN ('memory', 'db')) as cache_hits,
+    ROUND(100.0 * SUM(lookups) FILTER (WHERE source IN ('memory', 'db')) / NULLIF(SUM(lookups), 0), 1) as hit_rate_percent,
+    SUM(lookups) FILTER (WHERE source IN ('memory', 'db', 'dictionary', 'rules')) as saved_api_calls,
+    SUM(lookups) FILTER (WHERE source IN ('model', 'fallback')) as api_calls
+FROM name_declension_stats
+GROUP BY date
+ORDER BY date DESC;
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 008 успешно применена!';
+    RAISE NOTICE 'Таблицы name_declensions, name_declension_stats и представление name_declension_hit_rate_by_date добавлены';
+END $$;
@@ -0,0 +1,22 @@
+-- ============================================
+-- Миграция 009: Фото скана хранится в БД с момента регистрации скана
+-- Дата: 2026-10-18
+-- Описание: Фото больше не сохраняется в user_photos/ — бот скачивает его в
+--           память и пишет в photos сразу при регистрации скана (scan_id).
+--           Когда анализ готов, фото привязывается к analyses (analysis_id).
+--           Скан, продолжаемый после перезапуска бота, находит фото в БД
+-- ============================================
+
+ALTER TABLE photos ADD COLUMN IF NOT EXISTS scan_id INTEGER REFERENCES analysis_scans(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_photos_scan ON photos(scan_id);
+
+-- Комментарии
+COMMENT ON COLUMN photos.scan_id IS 'Скан, с которым пришло фото; analysis_id заполняется, когда анализ готов';
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 009 успешно применена!';
+    RAISE NOTICE 'Колонка photos.scan_id добавлена';
+END $$;
@@ -0,0 +1,18 @@
+-- ============================================
+-- Миграция 010: Статус скана sending
+-- Дата: 2026-10-18
+-- Описание: Перед отправкой PDF скан переходит в sending (analysis_id уже
+--           записан). Если бот остановился между отправкой PDF и отметкой done,
+--           после перезапуска такой скан закрывается без повторной отправки —
+--           пользователь не получает один и тот же PDF дважды
+-- ============================================
+
+-- Колонка status — VARCHAR без CHECK, новое значение схемы не меняет
+COMMENT ON COLUMN analysis_scans.status IS 'running / sending (PDF отправляется) / failed / done';
+
+-- Завершение
+DO $$
+BEGIN
+    RAISE NOTICE '✅ Миграция 010 успешно применена!';
+    RAISE NOTICE 'Статус analysis_scans.status = sending описан';
+END $$;
@@ -0,0 +1,155 @@
+"""
+Склонение русских имён без модели
+
+Порядок:
+1. Словарь: name_declensions.json (частые имена и уменьшительные формы с шестью
+   падежами и родом, включая нерегулярные — Лев, Павел, Пётр, Илья, Любовь)
+2. Правила по регулярным окончаниям: -а / -я / -ия / -ий / -ей, -ай / согласный
+3. Всё остальное (-ь, -о, -е, -и, латиница...) — None: такие имена склоняет
+   модель (name_helper.get_name_declensions), а её ответ остаётся в кэше
+   склонений (declension_cache.py)
+
+Формат склонений как у модели: {'nominative', 'genitive', 'dative',
+'accusative', 'instrumental', 'prepositional'}.
+"""
+
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+CASES = ('nominative', 'genitive', 'dative', 'accusative', 'instrumental', 'prepositional')
+
+NAME_DECLENSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'name_declensions.json')
+
+NAME_RE = re.compile(r'[А-ЯЁа-яё]{2,}')
+VOWELS = 'аеёиоуыэюя'
+HUSHING = 'жшчщ'   # после них -и в родительном и безударное -ей/-ем в творительном
+VELAR = 'гкх'      # после них -и в родительном
+
+# На согласный, но часто женские и несклоняемые (Гульшат, Жаннет) — решает словарь или модель
+FEMININE_CONSONANT_RE = re.compile(r'^(гуль|гюль|айгуль)|(ет|эт|етт)$')
+
+
+def normalize_name(name: str) -> str:
+    """'анна' / 'АННА' / ' Анна ' → 'Анна' (части двойного имени — каждая с заглавной)"""
+    return '-'.join(part[:1].upper() + part[1:].lower() for part in name.strip().split('-'))
+
+
+def _forms(*values) -> dict:
+    return dict(zip(CASES, values))
+
+
+def decline_by_rules(name: str) -> dict:
+    """
+    Склонения по регулярному окончанию (name уже нормализовано).
+    None — окончание не регулярное: -ь (Игорь / Любовь), гласные кроме -а/-я, не кириллица,
+    согласный в именах, похожих на женские (Гульшат, Жаннет)
+    """
+    if not NAME_RE.fullmatch(name):
+        return None
+
+    lower = name.lower()
+    last, prev = lower[-1], lower[-2]
+    stem = name[:-1]
+
+    if lower.endswith('ия'):
+        # Мария, Юлия: Марии, Марии, Марию, Марией, Марии
+        return _forms(name, stem + 'и', stem + 'и', stem + 'ю', stem + 'ей', stem + 'и')
+    if last == 'я':
+        # Таня, Наталья, Майя
+        return _forms(name, stem + 'и', stem + 'е', stem + 'ю', stem + 'ей', stem + 'е')
+    if last == 'а':
+        # Анна, Ольга, Наташа, Никита
+        genitive = stem + ('и' if prev in HUSHING + VELAR else 'ы')
+        instrumental = stem + ('ей' if prev in HUSHING + 'ц' else 'ой')
+        return _forms(name, genitive, stem + 'е', stem + 'у', instrumental, stem + 'е')
+    if lower.endswith('ий'):
+        # Дмитрий: Дмитрия, Дмитрию, Дмитрия, Дмитрием, Дмитрии
+        return _forms(name, stem + 'я', stem + 'ю', stem + 'я', stem + 'ем', stem + 'и')
+    if last == 'й' and prev in VOWELS:
+        # Андрей, Николай
+        return _forms(name, stem + 'я', stem + 'ю', stem + 'я', stem + 'ем', stem + 'е')
+    if last not in VOWELS and last not in 'йьъ' and not FEMININE_CONSONANT_RE.search(lower):
+        # Мужское на согласный: Иван, Денис, Януш
+        instrumental = name + ('ем' if last in HUSHING + 'ц' else 'ом')
+        return _forms(name, name + 'а', name + 'у', name + 'а', instrumental, name + 'е')
+    return None
+
+
+def guess_gender(name: str) -> str:
+    """'f' / 'm' по окончанию (для имён не из словаря); None — не понять (Саша, Женя решает словарь)"""
+    lower = name.lower()
+    if lower[-1:] in ('а', 'я'):
+        return 'f'
+    if lower[-1:] and lower[-1] not in VOWELS and lower[-1] != 'ь':
+        return 'm'
+    return None
+
+
+def valid_declensions(name: str, declensions) -> bool:
+    """Ответ модели похож на склонения этого имени — только такие запоминаем"""
+    if not isinstance(declensions, dict):
+        return False
+    for case in CASES:
+        value = declensions.get(case)
+        if not isinstance(value, str) or not value.strip():
+            return False
+        if value.strip()[:1].lower() != name[:1].lower() or abs(len(value.strip()) - len(name)) > 4:
+            return False
+    return True
+
+
+class NameDeclensionEngine:
+    def __init__(self, path: str = NAME_DECLENSIONS_PATH):
+        self.dictionary = self._load(path)
+
+    @staticmethod
+    def _load(path: str) -> dict:
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать словарь склонений {path}: {e}")
+            return {}
+
+    def lookup(self, name: str) -> dict:
+        """Запись словаря (с родом); None — имени нет"""
+        return self.dictionary.get(normalize_name(name))
+
+    def decline(self, name: str) -> dict:
+        """Склонения без модели; None — имя неизвестно и окончание не регулярное"""
+        key = normalize_name(name)
+        entry = self.dictionary.get(key)
+        if entry:
+            return {case: entry[case] for case in CASES}
+
+        if '-' in key:
+            # Двойное имя: склоняется каждая часть (Анна-Мария → Анны-Марии)
+            parts = [self.decline(part) for part in key.split('-')]
+            if all(parts):
+                return {case: '-'.join(part[case] for part in parts) for case in CASES}
+            return None
+
+        return decline_by_rules(key)
+
+    def gender(self, name: str) -> str:
+        """Род из словаря, иначе по окончанию"""
+        entry = self.lookup(name)
+        return entry.get('gender') if entry else guess_gender(normalize_name(name))
+
+
+_engine = None
+
+
+def get_declension_engine() -> NameDeclensionEngine:
+    """Движок склонений процесса (словарь загружается один раз)"""
+    global _engine
+    if _engine is None:
+        _engine = NameDeclensionEngine()
+        logger.info(f"📚 Словарь склонений: {len(_engine.dictionary)} имён")
+    return _engine
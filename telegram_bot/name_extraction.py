@@ -0,0 +1,175 @@
+"""
+Имя пользователя из текста запроса: газетир имён и один проход по токенам
+
+Газетир — имена из name_declensions.json (полные и уменьшительные формы),
+в памяти — frozenset имён в нижнем регистре (ё → е). Текст один раз
+режется на слова и знаки (TOKEN_RE), затем каждый кандидат оценивается по
+соседним токенам. Возвращается кандидат с наибольшей уверенностью:
+
+  0.98  «меня зовут Анна», «зовут меня Анна», «моё имя Анна»
+  0.95  «я Анна», «я — Анна», «Я, Анна, ...»
+  0.9   подпись в конце: «...\\nАнна», «...? Анна», «С уважением, Анна», «Ваша Таня»
+  0.85  первое слово перед запятой или точкой: «Анна, 35 лет»; имя отдельным
+        предложением: «Добрый день! Катя. Хочу любви»; имя перед возрастом: «Ирина 42 года»
+
+Известное имя где-то посреди текста — не кандидат: чаще это кто-то другой
+(«Дмитрий меня не слышит», «Наталья Викторовна на работе»), и лучше спросить имя,
+чем подписать PDF чужим.
+
+Слово не из газетира — только после «меня зовут» (0.85), «я» перед запятой /
+«и» / тире (0.7) и «с уважением» (0.7) — так редкие имена не теряются, а
+«Здравствуйте,» в начале больше не принимается за имя. Не имя пользователя:
+после «муж», «дочь», «мама», предлогов и в обращении («Здравствуйте, Наталья»).
+Имена, совпадающие с обычными словами (Вера, Любовь, Роман, Света), — только
+с явным контекстом, не по одной заглавной букве.
+"""
+
+import re
+
+import config
+from name_declension import get_declension_engine, normalize_name
+
+NAME_EXTRACTION_MIN_CONFIDENCE = getattr(config, 'NAME_EXTRACTION_MIN_CONFIDENCE', 0.7)
+
+TOKEN_RE = re.compile(r'[А-ЯЁа-яё]+(?:-[А-ЯЁа-яё]+)*|\n|[.,!?;:()—–-]')
+
+DASHES = {'-', '—', '–', ':'}
+NAME_END = {',', '.', '!', '\n', '-', '—', '–', ')', 'и'}  # после «я Имя» — иначе «Я Хочу...»
+
+AGE_WORDS = {'лет', 'год', 'года'}  # «Ирина 42 года» — цифры в токены не попадают
+SIGNATURE_WORDS = {'уважением', 'ваша', 'ваш', 'искренне', 'подпись'}
+GREETINGS = {'здравствуйте', 'здравствуй', 'привет', 'добрый', 'доброе', 'дорогая', 'дорогой',
+             'уважаемая', 'уважаемый', 'спасибо', 'благодарю'}
+# После этих слов имя — чужое: «мой муж Дмитрий», «для Ани», «с Олегом»
+THIRD_PERSON = {
+    'муж', 'жена', 'сын', 'дочь', 'дочка', 'мама', 'папа', 'мать', 'отец', 'брат', 'сестра', 'бабушка',
+    'дедушка', 'внук', 'внучка', 'подруга', 'друг', 'парень', 'девушка', 'свекровь', 'тёща', 'теща',
+    'начальник', 'начальница', 'коллега', 'ребёнок', 'ребенок', 'бывший', 'бывшая', 'любимый', 'любимая',
+    'партнёр', 'партнер', 'мужчина', 'женщина', 'зовут', 'звали',
+    'для', 'с', 'со', 'у', 'к', 'о', 'об', 'про', 'от', 'за', 'на', 'в', 'без', 'и',
+}
+# Имена, совпадающие с обычными словами: только с явным контекстом
+AMBIGUOUS = {
+    'вера', 'любовь', 'надежда', 'лилия', 'роза', 'слава', 'злата', 'лев', 'тема', 'поля', 'рая', 'света',
+    'тома', 'лука', 'мила', 'мая', 'тина', 'роман', 'ника', 'ян', 'ия', 'лана', 'марк', 'макс',
+}
+
+
+def _key(word: str) -> str:
+    return word.lower().replace('ё', 'е')
+
+
+class NameGazetteer:
+    """Известные имена: поиск слова — одна проверка в словаре"""
+
+    def __init__(self, names):
+        self.names = frozenset(_key(name) for name in names)
+
+    def __contains__(self, word: str) -> bool:
+        key = _key(word)
+        if key in self.names:
+            return True
+        # Двойное имя — если известны все части (Анна-Мария)
+        return '-' in key and all(part in self.names for part in key.split('-'))
+
+    def __len__(self):
+        return len(self.names)
+
+
+_gazetteer = None
+
+
+def get_gazetteer() -> NameGazetteer:
+    """Газетир процесса — из словаря склонений"""
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = NameGazetteer(get_declension_engine().dictionary)
+    return _gazetteer
+
+
+def _words_before(tokens: list, i: int, skip=DASHES) -> tuple:
+    """Два слова перед токеном i в нижнем регистре (тире и двоеточия пропускаются)"""
+    found = []
+    j = i - 1
+    while j >= 0 and len(found) < 2:
+        if tokens[j] not in skip:
+            found.append(tokens[j].lower())
+        j -= 1
+    found += [None] * (2 - len(found))
+    return found[0], found[1]
+
+
+def _score(tokens: list, i: int, known: bool, last_word: int) -> float:
+    """Уверенность, что tokens[i] — имя автора запроса (0 — нет)"""
+    token = tokens[i]
+    capitalized = token[0].isupper()
+    ambiguous = _key(token) in AMBIGUOUS
+    prev, prev2 = _words_before(tokens, i)
+    next_token = tokens[i + 1].lower() if i + 1 < len(tokens) else None
+
+    # «меня зовут Анна», «зовут меня Анна», «моё имя Анна»
+    if (prev2, prev) in (('меня', 'зовут'), ('зовут', 'меня'), ('мое', 'имя'), ('моё', 'имя')):
+        if known:
+            return 0.98
+        return 0.85 if capitalized else 0.0
+
+    # «я Анна», «я — Анна», «Я, Анна,»
+    prev_no_comma, _ = _words_before(tokens, i, skip=DASHES | {','})
+    if prev_no_comma == 'я':
+        if known and (not ambiguous or next_token in NAME_END or next_token is None):
+            return 0.95
+        return 0.7 if capitalized and (next_token in NAME_END or next_token is None) else 0.0
+
+    if not capitalized or prev in THIRD_PERSON or prev_no_comma in GREETINGS:
+        return 0.0
+
+    # Подпись: последнее слово текста после перевода строки или «с уважением» / «ваша»
+    if i == last_word:
+        if prev_no_comma in SIGNATURE_WORDS:
+            return 0.9 if known else 0.7
+        if known and not ambiguous and (i == 0 or tokens[i - 1] in ('\n', '.', '!', '?')):
+            return 0.9
+
+    if not known or ambiguous:
+        return 0.0
+
+    # «Анна, 35 лет...» — первое слово перед запятой или точкой
+    if prev is None and next_token in (',', '.', '!', '\n'):
+        return 0.85
+    # «Добрый день! Катя. Хочу...» — имя отдельным предложением; «Ирина 42 года»
+    if i and tokens[i - 1] in ('\n', '.', '!', '?') and next_token in ('.', '\n'):
+        return 0.85
+    if next_token in AGE_WORDS:
+        return 0.85
+    return 0.0
+
+
+def find_name(text: str, gazetteer: NameGazetteer = None) -> tuple:
+    """
+    (имя, уверенность) — самый вероятный кандидат в имя автора текста;
+    (None, 0.0) — кандидатов нет
+    """
+    if not text:
+        return None, 0.0
+    gazetteer = gazetteer or get_gazetteer()
+
+    tokens = TOKEN_RE.findall(text)
+    words = [i for i, token in enumerate(tokens) if token[0].isalpha()]
+    if not words:
+        return None, 0.0
+
+    best, best_score = None, 0.0
+    for i in words:
+        token = tokens[i]
+        if len(token) < 2:
+            continue
+        score = _score(tokens, i, token in gazetteer, words[-1])
+        if score > best_score:
+            best, best_score = token, score
+    return (normalize_name(best), best_score) if best else (None, 0.0)
+
+
+def extract_name(text: str, min_confidence: float = NAME_EXTRACTION_MIN_CONFIDENCE) -> str:
+    """Имя автора текста или None, если уверенность ниже min_confidence"""
+    name, confidence = find_name(text)
+    return name if confidence >= min_confidence else None
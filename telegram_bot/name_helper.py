@@ -1,41 +1,34 @@
 """
 Вспомогательные функции для работы с именами пользователей
+
+Склонения имени — get_name_declensions() / get_name_declensions_async(): сначала
+кэш склонений (declension_cache.py: LRU + таблица name_declensions), затем локальный
+движок (name_declension.py: словарь + правила), модель — только для неизвестных
+имён, и её ответ остаётся в кэше.
 """
 
-import re
-from openai import OpenAI
-from config import OPENAI_API_KEY
+import json
+import logging
+from llm_scheduler import get_scheduler, estimate_tokens
+from declension_cache import get_declension_cache
+from name_declension import get_declension_engine, normalize_name, valid_declensions
+from name_extraction import extract_name
+from openai_clients import get_openai_client, get_async_openai_client
+from pronoun_rewriter import get_pronoun_rewriter
+
+logger = logging.getLogger(__name__)
 
 
 def extract_name_from_request(request_text: str) -> str:
     """
-    Пытается извлечь имя из текста запроса
-    Ищет паттерны типа "Меня зовут...", "Я - ...", имя в начале и т.д.
+    Пытается извлечь имя из текста запроса: «меня зовут...», «я — ...», подпись,
+    имя в начале и т.д. Имена сверяются с газетиром, см. name_extraction.py
     """
-    # Паттерны для поиска имени
-    patterns = [
-        r'[Мм]еня зовут\s+([А-ЯЁ][а-яё]+)',
-        r'[Яя]\s+[-—]\s+([А-ЯЁ][а-яё]+)',
-        r'[Яя]\s+([А-ЯЁ][а-яё]+)\s+и',  # "Я Мария и хочу..."
-        r'[Яя]\s+([А-ЯЁ][а-яё]+)[\.,]',
-        r'^([А-ЯЁ][а-яё]+)[\.,]',  # Имя в начале с запятой/точкой
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, request_text)
-        if match:
-            return match.group(1)
-
-    return None
-
+    return extract_name(request_text)
 
-def get_name_declensions_gpt(name: str) -> dict:
-    """
-    Получает склонения имени через GPT для правильной грамматики
-    Возвращает словарь с падежами
-    """
-    client = OpenAI(api_key=OPENAI_API_KEY)
 
+def _declension_params(name: str) -> dict:
+    """Параметры запроса к модели для склонения имени"""
     prompt = f"""Просклоняй русское имя "{name}" по падежам.
 Верни ТОЛЬКО JSON в таком формате (без комментариев, без markdown):
 {{
@@ -49,70 +42,169 @@ def get_name_declensions_gpt(name: str) -> dict:
 
 Если имя мужское, склоняй соответственно (Даниил → Даниила, Даниилу и т.д.)"""
 
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.3,
+        "max_tokens": 150
+    }
+
+
+def _parse_declensions(result_text: str) -> dict:
+    """JSON со склонениями из ответа модели"""
+    # Убираем markdown если есть
+    result_text = result_text.strip().replace('```json', '').replace('```', '').strip()
+    return json.loads(result_text)
+
+
+def _fallback_declensions(name: str) -> dict:
+    """Fallback - имя как есть во всех падежах"""
+    return {
+        "nominative": name,
+        "genitive": name,
+        "dative": name,
+        "accusative": name,
+        "instrumental": name,
+        "prepositional": name
+    }
+
+
+def _request_declensions(name: str) -> dict:
+    """Склонения от модели (синхронно, через планировщик); исключение — если не вышло"""
+    params = _declension_params(name)
+    scheduler = get_scheduler()
+
+    reserved = estimate_tokens(params)
+    scheduler.acquire_sync(reserved)
+    used = 0  # Нет ответа (ошибка API, таймаут) — резерв возвращается в TPM целиком
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=150
-        )
+        response = get_openai_client().chat.completions.create(**params)
+        used = response.usage.total_tokens
+    finally:
+        scheduler.settle(reserved, used)
 
-        result_text = response.choices[0].message.content.strip()
+    return _parse_declensions(response.choices[0].message.content)
 
-        # Убираем markdown если есть
-        result_text = result_text.replace('```json', '').replace('```', '').strip()
 
-        import json
-        declensions = json.loads(result_text)
+async def _arequest_declensions(name: str, user_id=None) -> dict:
+    """Склонения от модели (async); запрос встаёт в очередь планировщика под ключом user_id"""
+    params = _declension_params(name)
+    scheduler = get_scheduler()
+
+    reserved = estimate_tokens(params)
+    await scheduler.acquire(user_id if user_id is not None else name, reserved)
+    used = 0  # Нет ответа (ошибка API, отмена задачи склонения) — резерв возвращается в TPM целиком
+    try:
+        response = await get_async_openai_client().chat.completions.create(**params)
+        used = response.usage.total_tokens
+    finally:
+        scheduler.settle(reserved, used)
+
+    return _parse_declensions(response.choices[0].message.content)
 
-        return declensions
 
+def get_name_declensions_gpt(name: str) -> dict:
+    """
+    Получает склонения имени через GPT для правильной грамматики
+    Возвращает словарь с падежами
+    """
+    try:
+        return _request_declensions(name)
     except Exception as e:
-        # Fallback - возвращаем имя как есть во всех падежах
-        print(f"Ошибка склонения имени: {e}")
-        return {
-            "nominative": name,
-            "genitive": name,
-            "dative": name,
-            "accusative": name,
-            "instrumental": name,
-            "prepositional": name
-        }
+        logger.warning(f"⚠️ Ошибка склонения имени «{name}», беру запасные формы: {e}")
+        return _fallback_declensions(name)
 
 
-def replace_pronouns_with_name(text: str, declensions: dict) -> str:
+async def get_name_declensions_gpt_async(name: str, user_id=None) -> dict:
     """
-    Заменяет личные местоимения (ты, тебе, тебя) на имя в правильном падеже.
-    НЕ заменяет притяжательные местоимения (твой, твоя и т.д.) - это звучит неестественно.
+    То же, что get_name_declensions_gpt(), но не блокирует event loop бота.
+    Запрос встаёт в общую очередь планировщика под ключом user_id (как шаги анализа)
     """
-    if not declensions:
-        return text
+    try:
+        return await _arequest_declensions(name, user_id)
+    except Exception as e:
+        logger.warning(f"⚠️ Ошибка склонения имени «{name}», беру запасные формы: {e}")
+        return _fallback_declensions(name)
+
 
-    # Маппинг ТОЛЬКО личных местоимений на падежи
-    # Притяжательные (твой, твоя и т.д.) НЕ заменяем
-    replacements = [
-        # Родительный падеж (кого? - у тебя, для тебя, без тебя)
-        (r'\b([Уу]|[Дд]ля|[Бб]ез|[Оо]т|[Ии]з-за|[Кк]роме)\s+тебя\b', lambda m: f'{m.group(1)} {declensions["genitive"]}'),
+def _cached_or_local(name: str):
+    """(склонения, источник) без модели: кэш склонений, затем словарь и правила; (None, None) — нужна модель"""
+    declensions, source = get_declension_cache().get(name)
+    if declensions:
+        return declensions, source
+    return _local_declensions(name)
 
-        # Дательный падеж (кому? - тебе, Тебе)
-        (r'\b[Тт]ебе\b', f'{declensions["dative"]}'),
 
-        # Винительный падеж (кого? - тебя, на тебя, про тебя)
-        (r'\b([Нн]а|[Пп]ро|[Зз]а|[Вв])\s+тебя\b', lambda m: f'{m.group(1)} {declensions["accusative"]}'),
+async def _acached_or_local(name: str):
+    """То же, что _cached_or_local(), для бота: таблица name_declensions читается в потоке"""
+    declensions, source = await get_declension_cache().aget(name)
+    if declensions:
+        return declensions, source
+    return _local_declensions(name)
 
-        # Творительный падеж (кем? - с тобой, за тобой, перед тобой)
-        (r'\b([Сс]|[Сс]о|[Зз]а|[Пп]еред|[Нн]ад|[Пп]од)\s+тобой\b', lambda m: f'{m.group(1)} {declensions["instrumental"]}'),
-        (r'\b[Тт]обою\b', f'{declensions["instrumental"]}'),
 
-        # Именительный падеж (кто? - ты, Ты)
-        (r'\b[Тт]ы\b', f'{declensions["nominative"]}'),
-    ]
+def _local_declensions(name: str):
+    """Словарь и правила; склонённое имя — в кэш склонений"""
+    cache = get_declension_cache()
+    engine = get_declension_engine()
+    declensions = engine.decline(name)
+    if declensions:
+        source = 'dictionary' if engine.lookup(name) else 'rules'
+        cache.put(name, declensions, source, engine.gender(name))
+        return declensions, source
+    return None, None
 
-    result = text
-    for pattern, replacement in replacements:
-        if callable(replacement):
-            result = re.sub(pattern, replacement, result, flags=re.IGNORECASE)
-        else:
-            result = re.sub(pattern, replacement, result)
 
-    return result
+def _remember_model_declensions(name: str, declensions: dict):
+    """Ответ модели — в кэш склонений, если он похож на склонения этого имени"""
+    if not valid_declensions(normalize_name(name), declensions):
+        logger.warning(f"⚠️ Склонения для «{name}» не похожи на правду, в кэш не пишу: {declensions}")
+        return
+    get_declension_cache().put(name, declensions, 'model', get_declension_engine().gender(name))
+
+
+def get_name_declensions(name: str) -> dict:
+    """
+    Склонения имени: кэш склонений → локально (словарь → правила), модель — только
+    для неизвестного имени. Ответ модели остаётся в кэше, следующий раз без запроса
+    """
+    cache = get_declension_cache()
+    declensions, source = _cached_or_local(name)
+    if not declensions:
+        try:
+            declensions, source = _request_declensions(name), 'model'
+            _remember_model_declensions(name, declensions)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка склонения имени «{name}», беру запасные формы: {e}")
+            declensions, source = _fallback_declensions(name), 'fallback'
+
+    cache.count(source)
+    cache.schedule_flush()
+    return declensions
+
+
+async def get_name_declensions_async(name: str, user_id=None) -> dict:
+    """То же, что get_name_declensions(), для бота: к модели — через очередь планировщика"""
+    cache = get_declension_cache()
+    declensions, source = await _acached_or_local(name)
+    if not declensions:
+        try:
+            declensions, source = await _arequest_declensions(name, user_id), 'model'
+            _remember_model_declensions(name, declensions)
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка склонения имени «{name}», беру запасные формы: {e}")
+            declensions, source = _fallback_declensions(name), 'fallback'
+
+    cache.count(source)
+    cache.schedule_flush()
+    return declensions
+
+
+def replace_pronouns_with_name(text: str, declensions: dict) -> str:
+    """
+    Заменяет обращение на «ты» (ты, тебе, у тебя, о тебе, с тобой, твоя энергия...)
+    на имя в правильном падеже — за один проход, см. pronoun_rewriter.py
+    """
+    if not declensions:
+        return text
+    return get_pronoun_rewriter(declensions).rewrite(text)
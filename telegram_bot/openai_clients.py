@@ -0,0 +1,99 @@
+"""
+Общие клиенты OpenAI на весь процесс
+
+Анализатор, склонение имени и бот берут клиентов отсюда, а не создают свои:
+один пул HTTP-соединений с keep-alive на процесс, поэтому TLS-рукопожатие
+и установка соединения не повторяются на каждый скан и каждый шаг.
+
+Размер пула и таймауты — в config.py (OPENAI_MAX_CONNECTIONS, OPENAI_TIMEOUT и т.д.),
+по умолчанию значения ниже.
+"""
+
+import logging
+import threading
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+import config
+from config import OPENAI_API_KEY
+
+logger = logging.getLogger(__name__)
+
+OPENAI_MAX_CONNECTIONS = getattr(config, 'OPENAI_MAX_CONNECTIONS', 20)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = getattr(config, 'OPENAI_MAX_KEEPALIVE_CONNECTIONS', 10)
+OPENAI_KEEPALIVE_EXPIRY = getattr(config, 'OPENAI_KEEPALIVE_EXPIRY', 120.0)  # секунд простоя до закрытия
+OPENAI_CONNECT_TIMEOUT = getattr(config, 'OPENAI_CONNECT_TIMEOUT', 10.0)
+OPENAI_TIMEOUT = getattr(config, 'OPENAI_TIMEOUT', 180.0)  # чтение ответа: компоновка бывает долгой
+OPENAI_BASE_URL = getattr(config, 'OPENAI_BASE_URL', None)  # None — api.openai.com
+
+_lock = threading.Lock()
+_sync_client = None
+_async_client = None
+_async_variants = {}  # max_retries → копия _async_client с тем же пулом соединений
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+
+
+def get_openai_client() -> OpenAI:
+    """Синхронный клиент (CLI, скрипты, склонение имени)"""
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            _sync_client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL,
+                timeout=_timeout(),
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+            logger.info(f"🔌 OpenAI клиент создан (пул до {OPENAI_MAX_CONNECTIONS} соединений)")
+        return _sync_client
+
+
+def get_async_openai_client(max_retries: int = None) -> AsyncOpenAI:
+    """
+    Асинхронный клиент для бота. Соединения пула привязаны к event loop,
+    в котором были открыты, — в другом loop (новый asyncio.run) сначала aclose_openai_clients()
+
+    max_retries — свои повторы SDK (по умолчанию SDK делает 2). Анализатор повторяет шаги сам
+    и берёт клиента с max_retries=0; копия делит с основным клиентом тот же пул соединений
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                base_url=OPENAI_BASE_URL,
+                timeout=_timeout(),
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            )
+            logger.info(f"🔌 AsyncOpenAI клиент создан (пул до {OPENAI_MAX_CONNECTIONS} соединений)")
+        if max_retries is None:
+            return _async_client
+        if max_retries not in _async_variants:
+            _async_variants[max_retries] = _async_client.with_options(max_retries=max_retries)
+        return _async_variants[max_retries]
+
+
+async def aclose_openai_clients():
+    """Закрывает пулы соединений (при остановке бота); следующий get_* создаст клиентов заново"""
+    global _sync_client, _async_client
+    with _lock:
+        sync_client, async_client = _sync_client, _async_client
+        _sync_client = _async_client = None
+        _async_variants.clear()
+
+    if sync_client is not None:
+        sync_client.close()
+    if async_client is not None:
+        await async_client.close()
@@ -15,7 +15,7 @@ from reportlab.platypus import (
 from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import re
+from analysis_result import AnalysisResult, CHAKRA_LINE_RE, TITLE_RE, parse_sections
 
 
 def replace_emoji_for_pdf(text):
@@ -43,22 +43,26 @@ def replace_emoji_for_pdf(text):
     return text
 
 
+# Шрифты с кириллицей: системные macOS, затем Linux
+FONT_PATHS = (
+    ('/System/Library/Fonts/Supplemental/DejaVuSans.ttf', '/System/Library/Fonts/Supplemental/DejaVuSans-Bold.ttf'),
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+)
+
+
 def register_fonts():
-    """Регистрация шрифтов с кириллицей"""
-    try:
-        # Пробуем использовать системные шрифты macOS
-        pdfmetrics.registerFont(TTFont('DejaVuSans', '/System/Library/Fonts/Supplemental/DejaVuSans.ttf'))
-        pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/System/Library/Fonts/Supplemental/DejaVuSans-Bold.ttf'))
+    """Регистрация шрифтов с кириллицей (уже зарегистрированные TTF повторно не разбираются)"""
+    if 'DejaVuSans' in pdfmetrics.getRegisteredFontNames():
         return True
-    except:
+    for regular_path, bold_path in FONT_PATHS:
         try:
-            # Альтернативный вариант для Linux
-            pdfmetrics.registerFont(TTFont('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'))
+            pdfmetrics.registerFont(TTFont('DejaVuSans', regular_path))
+            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', bold_path))
             return True
         except:
-            # Если не получилось, используем стандартные шрифты
-            return False
+            continue
+    # Если не получилось, используем стандартные шрифты
+    return False
 
 
 def create_custom_styles(has_custom_fonts=False):
@@ -136,50 +140,257 @@ def create_custom_styles(has_custom_fonts=False):
 
 
 def parse_analysis_sections(text):
-    """Парсинг текста анализа на секции"""
-    sections = {}
-
-    # Паттерны для поиска секций (поддержка обоих форматов: точка и скобка)
-    # Обновлено для v2.1: 8 секций вместо 10
-    patterns = {
-        'title': r'Сканер подсознания.*?для\s+(\w+)',
-        'request': r'\*\*Запрос:\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'contracts': r'\*\*1[\.\)]\s*Контракты и подключки\*\*\s*\n(.*?)(?=\n\*\*2|$)',
-        'layers': r'\*\*2[\.\)]\s*Слои программ.*?\*\*\s*\n(.*?)(?=\n\*\*3|$)',
-        'energy': r'\*\*3[\.\)]\s*Энергоцентры.*?\*\*\s*\n(.*?)(?=\n\*\*4|$)',
-        'programs': r'\*\*4[\.\)]\s*Главные программы.*?\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'lessons': r'\*\*5[\.\)]\s*Главные уроки души\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'changes': r'\*\*6[\.\)]\s*Что важно изменить.*?\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'phrases': r'\*\*7[\.\)]\s*Трансформационные фразы\*\*\s*\n(.*?)(?=\n\*\*|\n💫|$)',
-        'recommendation': r'\*\*8[\.\)]\s*Следующий шаг\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        # Legacy patterns for old format compatibility (10 sections)
-        'energy_old': r'\*\*3[\.\)]\s*Поток энергии по центрам\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'family': r'\*\*6[\.\)]\s*(?:Родовые влияния|Конкретные родовые сценарии)\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'past_lives': r'\*\*7[\.\)]\s*Связи из прошлых жизней\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'changes_old': r'\*\*8[\.\)]\s*Что важно изменить\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'phrases_old': r'\*\*9[\.\)]\s*Трансформационные фразы\*\*\s*\n(.*?)(?=\n\*\*|\n💫|$)',
-        'recommendation_old': r'\*\*10[\.\)]\s*(?:Рекомендация: следующий шаг|Следующий шаг)\*\*\s*\n(.*?)(?=\n\*\*|$)',
-        'archetype': r'\*\*11[\.\)]\s*Архетипический анализ.*?\*\*\s*🕊?\s*\n(.*?)(?=\n💫|\n\*\*|$)',
-        'message': r'💫\s*\*\*Вдохновляющее послание\*\*\s*\n(.*?)$',
-    }
+    """Парсинг текста анализа на секции (один проход, см. analysis_result.parse_sections)"""
+    sections = parse_sections(text)
 
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
-        if match:
-            if key == 'title':
-                sections[key] = match.group(1)
-            else:
-                sections[key] = match.group(1).strip()
+    title = TITLE_RE.search(text)
+    if title:
+        sections['title'] = title.group(1)
 
     return sections
 
 
-def create_analysis_pdf(analysis_text, username, request_text):
+class PdfRenderer:
+    """
+    Рендер PDF отчёта. Шрифты и стили готовятся один раз на процесс
+    (get_pdf_renderer), render() только собирает story и строит документ
+    """
+
+    def __init__(self):
+        self.has_fonts = register_fonts()
+        self.styles = create_custom_styles(self.has_fonts)
+
+    def build_story(self, analysis, username, request_text):
+        """Элементы документа из AnalysisResult"""
+        styles = self.styles
+
+        # Контейнер для элементов
+        story = []
+
+        # Разделы уже разобраны анализатором; заменяем в них эмодзи на текстовые символы для PDF
+        sections = {key: replace_emoji_for_pdf(content) for key, content in analysis.sections.items()}
+
+        # Заголовок
+        title = Paragraph(
+            f"Сканер подсознания по Мета-Методу<br/>для {username}",
+            styles['CustomTitle']
+        )
+        story.append(title)
+        story.append(Spacer(1, 0.5*cm))
+
+        # Дата
+        date_text = Paragraph(
+            f"<i>Дата анализа: {datetime.now().strftime('%d.%m.%Y')}</i>",
+            styles['CustomBody']
+        )
+        story.append(date_text)
+        story.append(Spacer(1, 0.8*cm))
+
+        # Запрос
+        request_header = Paragraph("Запрос:", styles['CustomHeading'])
+        story.append(request_header)
+        request_para = Paragraph(
+            f"<i>{request_text}</i>",
+            styles['RequestStyle']
+        )
+        story.append(request_para)
+        story.append(Spacer(1, 0.5*cm))
+
+        # Основные секции
+        # v2.1: 8 секций вместо 10
+        section_titles = {
+            'contracts': '1. Контракты и подключки',
+            'layers': '2. Слои программ. Откуда идёт программа',
+            'energy': '3. Энергоцентры (Чакры) и поток энергии',
+            'programs': '4. Главные программы, мешающие движению',
+            'lessons': '5. Главные уроки души',
+            'changes': '6. Что важно изменить. Рекомендации',
+            'phrases': '7. Трансформационные фразы',
+            'recommendation': '8. Следующий шаг',
+            # Legacy для старого формата
+            'family': '6. Родовые влияния',
+            'past_lives': '7. Связи из прошлых жизней',
+            'archetype': '11. Архетипический анализ 🕊',
+            'message': '💫 Вдохновляющее послание',
+        }
+
+        for key, title in section_titles.items():
+            if key in sections and sections[key]:
+                # Заголовок секции
+                section_title = Paragraph(title, styles['CustomHeading'])
+                story.append(section_title)
+
+                # Контент секции
+                content = sections[key]
+
+                # Особая обработка для трансформационных фраз
+                if key == 'phrases':
+                    # Разбиваем на отдельные фразы
+                    phrases = content.split('\n')
+                    for phrase in phrases:
+                        if phrase.strip():
+                            phrase_para = Paragraph(phrase.strip(), styles['TransformPhrase'])
+                            story.append(phrase_para)
+
+                # Чакры уже разобраны анализатором: строка на чакру, кружок в цвет её процента
+                elif key == 'energy' and analysis.chakras:
+                    story.extend(self._chakra_paragraphs(analysis))
+
+                # Программы — из analysis.programs, без повторного разбора раздела
+                elif key == 'programs' and analysis.programs:
+                    items = [f"• «{replace_emoji_for_pdf(program)}»" for program in analysis.programs]
+                    story.append(Paragraph('<br/>'.join(items), styles['CustomBody']))
+
+                # Чакры не разобрались (старый формат) — каждая с новой строки
+                elif key == 'energy':
+                    # Разбиваем по эмодзи чакр или по строкам
+                    lines = content.split('\n')
+                    current_para = []
+
+                    for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
+
+                        # Если строка начинается с номера чакры [1]-[7] или маркера
+                        is_chakra_line = (
+                            line.startswith('[1]') or line.startswith('[2]') or
+                            line.startswith('[3]') or line.startswith('[4]') or
+                            line.startswith('[5]') or line.startswith('[6]') or
+                            line.startswith('[7]') or line.startswith('Чакра') or
+                            line.startswith('-') or line.startswith('•')
+                        )
+
+                        if is_chakra_line:
+                            # Если накопились предыдущие строки, создаем параграф
+                            if current_para:
+                                para = Paragraph('<br/>'.join(current_para), styles['CustomBody'])
+                                story.append(para)
+                                current_para = []
+                            # Добавляем текущую строку
+                            current_para.append(line)
+                        else:
+                            # Продолжение предыдущей строки
+                            if current_para:
+                                current_para[-1] += ' ' + line
+                            else:
+                                current_para.append(line)
+
+                    # Добавляем оставшееся
+                    if current_para:
+                        para = Paragraph('<br/>'.join(current_para), styles['CustomBody'])
+                        story.append(para)
+
+                # Особая обработка для списков программ, изменений
+                elif key in ['programs', 'changes']:
+                    # Разбиваем по строкам с маркерами
+                    lines = content.split('\n')
+                    items = []
+
+                    for line in lines:
+                        line = line.strip()
+                        if not line:
+                            continue
+
+                        # Если строка начинается с маркера или кавычки
+                        if line.startswith(('-', '•', '"', '–', '—')):
+                            items.append(line)
+                        elif items:
+                            # Продолжение предыдущего пункта
+                            items[-1] += ' ' + line
+                        else:
+                            items.append(line)
+
+                    if items:
+                        para = Paragraph('<br/>'.join(items), styles['CustomBody'])
+                        story.append(para)
+
+                else:
+                    # Обычный текст - разбиваем по двойным переносам
+                    paragraphs = content.split('\n\n')
+                    for para_text in paragraphs:
+                        para_text = para_text.strip()
+                        if para_text:
+                            # Заменяем одинарные переносы на пробелы внутри параграфа
+                            para_text = para_text.replace('\n', ' ')
+                            para = Paragraph(para_text, styles['CustomBody'])
+                            story.append(para)
+
+                story.append(Spacer(1, 0.3*cm))
+
+        # Футер
+        story.append(Spacer(1, 1*cm))
+        footer_line = Paragraph(
+            "<i>━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━</i>",
+            styles['CustomBody']
+        )
+        story.append(footer_line)
+
+        footer_text = Paragraph(
+            "<i>Работай с трансформационными фразами каждый день.<br/>"
+            "Проговаривай их вслух или про себя, чувствуя каждое слово.<br/>"
+            "Изменения придут через действие и осознанность. 🙏</i>",
+            styles['CustomBody']
+        )
+        story.append(footer_text)
+
+        return story
+
+    def _chakra_paragraphs(self, analysis):
+        """Вступление раздела чакр (текст до первой строки чакры) и абзац на каждую ChakraScore"""
+        story = []
+        energy = analysis.sections['energy']
+        first = CHAKRA_LINE_RE.search(energy)
+        intro = energy[:first.start()].strip() if first else ''
+        if intro:
+            story.append(Paragraph(replace_emoji_for_pdf(intro).replace('\n', ' '), self.styles['CustomBody']))
+        for chakra in analysis.chakras:
+            description = '. '.join(part for part in (chakra.state, chakra.comment) if part)
+            story.append(Paragraph(
+                f'<font color="{chakra.color}">●</font> <b>{chakra.name}</b> — {chakra.percent}%. '
+                f'{replace_emoji_for_pdf(description)}',
+                self.styles['CustomBody']
+            ))
+        return story
+
+    def render(self, analysis, username, request_text, output_path):
+        """Строит PDF в output_path; analysis — AnalysisResult или текст анализа"""
+        if not isinstance(analysis, AnalysisResult):
+            analysis = AnalysisResult.from_text(analysis, username, request_text)
+
+        # Создание документа
+        doc = SimpleDocTemplate(
+            output_path,
+            pagesize=A4,
+            rightMargin=2*cm,
+            leftMargin=2*cm,
+            topMargin=2*cm,
+            bottomMargin=2*cm
+        )
+
+        # Генерация PDF
+        doc.build(self.build_story(analysis, username, request_text))
+
+        return output_path
+
+
+_renderer = None
+
+
+def get_pdf_renderer():
+    """PdfRenderer процесса (шрифты и стили готовятся при первом вызове)"""
+    global _renderer
+    if _renderer is None:
+        _renderer = PdfRenderer()
+    return _renderer
+
+
+def create_analysis_pdf(analysis, username, request_text):
     """
     Создание PDF документа с результатами анализа
 
     Args:
-        analysis_text: Текст анализа от GPT
+        analysis: AnalysisResult (или текст анализа от GPT — тогда он разбирается здесь)
         username: Имя пользователя
         request_text: Запрос пользователя
 
@@ -193,190 +404,7 @@ def create_analysis_pdf(analysis_text, username, request_text):
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     pdf_filename = f'generated_pdfs/scanner_{username}_{timestamp}.pdf'
 
-    # Регистрация шрифтов
-    has_custom_fonts = register_fonts()
-
-    # Создание документа
-    doc = SimpleDocTemplate(
-        pdf_filename,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=2*cm,
-        bottomMargin=2*cm
-    )
-
-    # Получение стилей
-    styles = create_custom_styles(has_custom_fonts)
-
-    # Контейнер для элементов
-    story = []
-
-    # Заменяем эмодзи на текстовые символы для PDF
-    analysis_text_clean = replace_emoji_for_pdf(analysis_text)
-
-    # Парсим анализ
-    sections = parse_analysis_sections(analysis_text_clean)
-
-    # Заголовок
-    title = Paragraph(
-        f"Сканер подсознания по Мета-Методу<br/>для {username}",
-        styles['CustomTitle']
-    )
-    story.append(title)
-    story.append(Spacer(1, 0.5*cm))
-
-    # Дата
-    date_text = Paragraph(
-        f"<i>Дата анализа: {datetime.now().strftime('%d.%m.%Y')}</i>",
-        styles['CustomBody']
-    )
-    story.append(date_text)
-    story.append(Spacer(1, 0.8*cm))
-
-    # Запрос
-    request_header = Paragraph("Запрос:", styles['CustomHeading'])
-    story.append(request_header)
-    request_para = Paragraph(
-        f"<i>{request_text}</i>",
-        styles['RequestStyle']
-    )
-    story.append(request_para)
-    story.append(Spacer(1, 0.5*cm))
-
-    # Основные секции
-    # v2.1: 8 секций вместо 10
-    section_titles = {
-        'contracts': '1. Контракты и подключки',
-        'layers': '2. Слои программ. Откуда идёт программа',
-        'energy': '3. Энергоцентры (Чакры) и поток энергии',
-        'programs': '4. Главные программы, мешающие движению',
-        'lessons': '5. Главные уроки души',
-        'changes': '6. Что важно изменить. Рекомендации',
-        'phrases': '7. Трансформационные фразы',
-        'recommendation': '8. Следующий шаг',
-        # Legacy для старого формата
-        'family': '6. Родовые влияния',
-        'past_lives': '7. Связи из прошлых жизней',
-        'archetype': '11. Архетипический анализ 🕊',
-        'message': '💫 Вдохновляющее послание',
-    }
-
-    for key, title in section_titles.items():
-        if key in sections and sections[key]:
-            # Заголовок секции
-            section_title = Paragraph(title, styles['CustomHeading'])
-            story.append(section_title)
-
-            # Контент секции
-            content = sections[key]
-
-            # Особая обработка для трансформационных фраз
-            if key == 'phrases':
-                # Разбиваем на отдельные фразы
-                phrases = content.split('\n')
-                for phrase in phrases:
-                    if phrase.strip():
-                        phrase_para = Paragraph(phrase.strip(), styles['TransformPhrase'])
-                        story.append(phrase_para)
-
-            # Особая обработка для чакр (каждая с новой строки)
-            elif key == 'energy':
-                # Разбиваем по эмодзи чакр или по строкам
-                lines = content.split('\n')
-                current_para = []
-
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-
-                    # Если строка начинается с номера чакры [1]-[7] или маркера
-                    is_chakra_line = (
-                        line.startswith('[1]') or line.startswith('[2]') or
-                        line.startswith('[3]') or line.startswith('[4]') or
-                        line.startswith('[5]') or line.startswith('[6]') or
-                        line.startswith('[7]') or line.startswith('Чакра') or
-                        line.startswith('-') or line.startswith('•')
-                    )
-
-                    if is_chakra_line:
-                        # Если накопились предыдущие строки, создаем параграф
-                        if current_para:
-                            para = Paragraph('<br/>'.join(current_para), styles['CustomBody'])
-                            story.append(para)
-                            current_para = []
-                        # Добавляем текущую строку
-                        current_para.append(line)
-                    else:
-                        # Продолжение предыдущей строки
-                        if current_para:
-                            current_para[-1] += ' ' + line
-                        else:
-                            current_para.append(line)
-
-                # Добавляем оставшееся
-                if current_para:
-                    para = Paragraph('<br/>'.join(current_para), styles['CustomBody'])
-                    story.append(para)
-
-            # Особая обработка для списков программ, изменений
-            elif key in ['programs', 'changes']:
-                # Разбиваем по строкам с маркерами
-                lines = content.split('\n')
-                items = []
-
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-
-                    # Если строка начинается с маркера или кавычки
-                    if line.startswith(('-', '•', '"', '–', '—')):
-                        items.append(line)
-                    elif items:
-                        # Продолжение предыдущего пункта
-                        items[-1] += ' ' + line
-                    else:
-                        items.append(line)
-
-                if items:
-                    para = Paragraph('<br/>'.join(items), styles['CustomBody'])
-                    story.append(para)
-
-            else:
-                # Обычный текст - разбиваем по двойным переносам
-                paragraphs = content.split('\n\n')
-                for para_text in paragraphs:
-                    para_text = para_text.strip()
-                    if para_text:
-                        # Заменяем одинарные переносы на пробелы внутри параграфа
-                        para_text = para_text.replace('\n', ' ')
-                        para = Paragraph(para_text, styles['CustomBody'])
-                        story.append(para)
-
-            story.append(Spacer(1, 0.3*cm))
-
-    # Футер
-    story.append(Spacer(1, 1*cm))
-    footer_line = Paragraph(
-        "<i>━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━</i>",
-        styles['CustomBody']
-    )
-    story.append(footer_line)
-
-    footer_text = Paragraph(
-        "<i>Работай с трансформационными фразами каждый день.<br/>"
-        "Проговаривай их вслух или про себя, чувствуя каждое слово.<br/>"
-        "Изменения придут через действие и осознанность. 🙏</i>",
-        styles['CustomBody']
-    )
-    story.append(footer_text)
-
-    # Генерация PDF
-    doc.build(story)
-
-    return pdf_filename
+    return get_pdf_renderer().render(analysis, username, request_text, pdf_filename)
 
 
 # Тестовая функция
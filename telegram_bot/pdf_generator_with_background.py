@@ -2,78 +2,112 @@
 Модуль для генерации красивых PDF отчетов с фоновым изображением
 """
 
+import io
 import os
 from datetime import datetime
+from PIL import Image
+from reportlab import rl_config
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.lib.enums import TA_LEFT, TA_CENTER
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Image as RLImage, PageTemplate, Frame, BaseDocTemplate
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, PageTemplate, Frame, BaseDocTemplate
 from reportlab.platypus.doctemplate import NextPageTemplate
 from reportlab.lib import colors
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import re
+import threading
+import config
+from analysis_result import AnalysisResult
+from pdf_layout import SectionLayout
 
+# Качество JPEG для фона (меньше файл, сжатие с потерями); None — фон без потерь
+PDF_BACKGROUND_JPEG_QUALITY = getattr(config, 'PDF_BACKGROUND_JPEG_QUALITY', None)
 
-def replace_emoji_for_pdf(text):
-    """Замена эмодзи на текстовые символы и цветные кружки для PDF"""
+# Потоки изображений в PDF — двоичные: ASCII85 (по умолчанию в ReportLab) делает фон
+# на четверть больше и кодируется на чистом Python дольше, чем сжимается сам фон
+rl_config.useA85 = 0
 
-    # Сначала заменяем эмодзи чакр на цветные HTML кружки
-    chakra_emoji_map = {
-        '🔴': '<font color="#FF4444">●</font>',  # Красный круг для 1-й чакры
-        '🟠': '<font color="#FF8800">●</font>',  # Оранжевый круг для 2-й чакры
-        '🟡': '<font color="#FFD700">●</font>',  # Желтый круг для 3-й чакры
-        '💚': '<font color="#00C851">●</font>',  # Зеленый круг для 4-й чакры
-        '💙': '<font color="#0099FF">●</font>',  # Голубой круг для 5-й чакры
-        '💜': '<font color="#AA66CC">●</font>',  # Фиолетовый круг для 6-й чакры
-        '🤍': '<font color="#FFFFFF">●</font>',  # Белый круг для 7-й чакры (с обводкой)
-    }
 
-    for emoji, replacement in chakra_emoji_map.items():
-        text = text.replace(emoji, replacement)
-
-    # Затем заменяем остальные эмодзи на текстовые символы
-    other_emoji_map = {
-        '✨': '*',
-        '🔮': '~',
-        '🌿': '~',
-        '💫': '*',
-        '🕊': '~',
-        '🌸': '~',
-        '🔹': '•',
-    }
-
-    for emoji, replacement in other_emoji_map.items():
-        text = text.replace(emoji, replacement)
-
-    return text
+# Шрифты с кириллицей (Linux сервер)
+FONT_FILES = (
+    ('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'),
+    ('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+)
 
 
 def register_fonts():
-    """Регистрация шрифтов с кириллицей"""
+    """Регистрация шрифтов с кириллицей (уже зарегистрированные TTF повторно не разбираются)"""
+    if FONT_FILES[0][0] in pdfmetrics.getRegisteredFontNames():
+        return True
     try:
-        # Для Linux сервера
-        pdfmetrics.registerFont(TTFont('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
-        pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'))
+        for font_name, font_path in FONT_FILES:
+            pdfmetrics.registerFont(TTFont(font_name, font_path))
         return True
     except:
         return False
 
 
+class BackgroundImage:
+    """
+    Фон, разобранный один раз на процесс (get_background_image): ImageReader над
+    RGB без альфа-канала или, с PDF_BACKGROUND_JPEG_QUALITY, над JPEG в памяти
+    (JPEG уходит в PDF как есть, DCTDecode, без пересжатия на каждый документ)
+    """
+
+    def __init__(self, path, jpeg_quality=None):
+        with Image.open(path) as image:
+            rgb = image.convert('RGB')
+        self.width, self.height = rgb.size
+
+        if jpeg_quality:
+            buffer = io.BytesIO()
+            rgb.save(buffer, 'JPEG', quality=jpeg_quality)
+            buffer.seek(0)
+            self.reader = ImageReader(buffer)
+        else:
+            self.reader = ImageReader(rgb)
+        self.reader.getRGBData()  # Пиксели разбираются сейчас, а не в первом рендере
+        self._lock = threading.Lock()  # Один ImageReader на все потоки рендера, у JPEG — общий файл в памяти
+
+    def draw(self, canvas, x, y, width, height):
+        """Рисует фон; в документ изображение попадает один раз, сколько бы раз его ни рисовали"""
+        with self._lock:
+            canvas.drawImage(self.reader, x, y, width=width, height=height)
+
+
+_background_images = {}  # путь к фону → BackgroundImage
+
+
+def get_background_image(background_path):
+    """BackgroundImage процесса для этого файла (None — файла нет)"""
+    if background_path not in _background_images:
+        if not background_path or not os.path.exists(background_path):
+            return None
+        _background_images[background_path] = BackgroundImage(background_path, PDF_BACKGROUND_JPEG_QUALITY)
+    return _background_images[background_path]
+
+
+# Имя формы фона в документе: рисуется на первой странице, дальше страницы только ссылаются на неё
+BACKGROUND_FORM = 'PageBackground'
+
+
+def draw_background(canvas, background):
+    """Фон страницы через форму BACKGROUND_FORM: изображение кладётся в документ один раз"""
+    if not canvas.hasForm(BACKGROUND_FORM):
+        page_width, page_height = A4
+        canvas.beginForm(BACKGROUND_FORM)
+        background.draw(canvas, 0, 0, page_width, page_height)
+        canvas.endForm()
+    canvas.doForm(BACKGROUND_FORM)
+
+
 def add_background(canvas, doc, background_path):
     """Функция для добавления фона на каждую страницу"""
-    if background_path and os.path.exists(background_path):
-        canvas.saveState()
-        page_width, page_height = A4
-        canvas.drawImage(
-            background_path,
-            0, 0,
-            width=page_width,
-            height=page_height,
-            preserveAspectRatio=False
-        )
-        canvas.restoreState()
+    background = get_background_image(background_path)
+    if background is not None:
+        draw_background(canvas, background)
 
 
 def create_custom_styles(has_custom_fonts=False):
@@ -139,153 +173,155 @@ def create_custom_styles(has_custom_fonts=False):
         alignment=TA_CENTER
     ))
 
+    # Пункт списка (программы, рекомендации, шаги)
+    styles.add(ParagraphStyle(
+        name='ListItem',
+        parent=styles['CustomBody'],
+        leftIndent=0.6*cm,
+        bulletIndent=0.15*cm,
+        bulletFontName=font_name,
+        spaceAfter=5
+    ))
+
+    # Ячейка таблицы чакр
+    styles.add(ParagraphStyle(
+        name='ChakraCell',
+        parent=styles['CustomBody'],
+        fontSize=9,
+        leading=12,
+        spaceAfter=0
+    ))
+
+    # Формула трансформационных фраз — на светлой плашке
+    styles.add(ParagraphStyle(
+        name='PhraseFormula',
+        parent=styles['CustomBody'],
+        backColor=colors.HexColor('#F7EBF0'),
+        borderPadding=8,
+        leftIndent=8,
+        rightIndent=8,
+        spaceBefore=8,
+        spaceAfter=16,
+        leading=15
+    ))
+
+    # Короткая трансформационная фраза
+    styles.add(ParagraphStyle(
+        name='PhraseItem',
+        parent=styles['ListItem'],
+        textColor=heading_color
+    ))
+
     return styles
 
 
-def generate_pdf(analysis_text, username, output_path='analysis.pdf', background_path='pdf_background.png'):
+class PdfRenderer:
+    """
+    Рендер PDF с фоном. Шрифты, стили, вёрстка разделов и шаблоны страниц готовятся
+    один раз на процесс (get_pdf_renderer), render() только собирает story и строит документ.
+    Фреймы шаблонов хранят состояние во время build() — один экземпляр на поток
+    """
+
+    def __init__(self, background_path='pdf_background.png'):
+        self.background_path = background_path
+        self.has_fonts = register_fonts()
+        self.styles = create_custom_styles(self.has_fonts)
+        self.layout = SectionLayout(self.styles)
+        self.page_templates = self._create_page_templates()
+
+    def _draw_background(self, canvas, doc):
+        add_background(canvas, doc, self.background_path)
+
+    def _create_page_templates(self):
+        """Шаблоны первой и последующих страниц (фон добавляется через onPage)"""
+        # Frame для первой страницы (больше верхний отступ для заголовка: 6см сверху, 3.5см снизу)
+        frame_first = Frame(
+            2*cm,
+            3.5*cm,
+            A4[0] - 4*cm,
+            A4[1] - 6*cm - 3.5*cm,
+            id='first'
+        )
+
+        # Frame для остальных страниц (7см сверху начиная со 2-й страницы)
+        # Frame(x1, y1, width, height) где y1 - нижняя граница
+        # Для topMargin=7cm и bottomMargin=3.5cm:
+        frame_later = Frame(
+            2*cm,  # x1 (leftMargin)
+            3.5*cm,  # y1 (bottomMargin для @liza.kolessova)
+            A4[0] - 4*cm,  # width (левый 2см + правый 2см = 4см)
+            A4[1] - 7*cm - 3.5*cm,  # height (страница - topMargin 7см - bottomMargin 3.5см)
+            id='later'
+        )
+
+        first_page = PageTemplate(id='First', frames=[frame_first], onPage=self._draw_background)
+        later_pages = PageTemplate(id='Later', frames=[frame_later], onPage=self._draw_background)
+        return [first_page, later_pages]
+
+    def build_story(self, analysis):
+        """Элементы документа из AnalysisResult (вёрстка по разделам — SectionLayout)"""
+        # ВАЖНО: NextPageTemplate в начале - при ПЕРВОМ PageBreak переключится на Later
+        story = [NextPageTemplate('Later')]
+        story.extend(self.layout.build(analysis))
+
+        # Добавляем футер с датой
+        story.append(Spacer(1, 1*cm))
+        footer_text = f"<font size=8 color='#6B3D4F'>Сгенерировано {datetime.now().strftime('%d.%m.%Y')}</font>"
+        footer = Paragraph(footer_text, self.styles['CustomBody'])
+        story.append(footer)
+
+        return story
+
+    def render(self, analysis, username, output_path='analysis.pdf'):
+        """Строит PDF в output_path (путь или файловый объект); analysis — AnalysisResult или текст анализа"""
+        if not isinstance(analysis, AnalysisResult):
+            analysis = AnalysisResult.from_text(analysis, username)
+
+        # Создаем BaseDocTemplate для кастомных настроек страниц
+        doc = BaseDocTemplate(
+            output_path,
+            pagesize=A4,
+            rightMargin=2*cm,
+            leftMargin=2*cm,
+            topMargin=6*cm,  # Для первой страницы
+            bottomMargin=3.5*cm  # Увеличен для @liza.kolessova
+        )
+        doc.addPageTemplates(self.page_templates)
+
+        # Создаем PDF (фон добавляется через PageTemplate)
+        doc.build(self.build_story(analysis))
+
+        return output_path
+
+
+_local = threading.local()  # путь к фону → PdfRenderer, свой словарь у каждого потока
+
+
+def get_pdf_renderer(background_path='pdf_background.png'):
+    """PdfRenderer потока для этого фона (шрифты и стили готовятся при первом вызове)"""
+    renderers = getattr(_local, 'renderers', None)
+    if renderers is None:
+        renderers = _local.renderers = {}
+    if background_path not in renderers:
+        renderers[background_path] = PdfRenderer(background_path)
+    return renderers[background_path]
+
+
+def generate_pdf(analysis, username, output_path='analysis.pdf', background_path='pdf_background.png'):
     """
     Генерирует красивый PDF отчет с фоновым изображением
 
     Args:
-        analysis_text: текст анализа
+        analysis: AnalysisResult (или текст анализа — тогда он разбирается здесь)
         username: имя пользователя
         output_path: путь для сохранения PDF
         background_path: путь к фоновому изображению
     """
+    return get_pdf_renderer(background_path).render(analysis, username, output_path)
 
-    # Регистрируем шрифты
-    has_fonts = register_fonts()
-
-    # Заменяем эмодзи на текстовые символы
-    analysis_text = replace_emoji_for_pdf(analysis_text)
-
-    # Создаем BaseDocTemplate для кастомных настроек страниц
-    doc = BaseDocTemplate(
-        output_path,
-        pagesize=A4,
-        rightMargin=2*cm,
-        leftMargin=2*cm,
-        topMargin=6*cm,  # Для первой страницы
-        bottomMargin=3.5*cm  # Увеличен для @liza.kolessova
-    )
-
-    # Создаем Frame для первой страницы (больше верхний отступ для заголовка)
-    frame_first = Frame(
-        doc.leftMargin,
-        doc.bottomMargin,
-        doc.width,
-        doc.height,
-        id='first'
-    )
-
-    # Создаем Frame для остальных страниц (7см сверху начиная со 2-й страницы)
-    # Frame(x1, y1, width, height) где y1 - нижняя граница
-    # Для topMargin=7cm и bottomMargin=3.5cm:
-    frame_later = Frame(
-        2*cm,  # x1 (leftMargin)
-        3.5*cm,  # y1 (bottomMargin для @liza.kolessova)
-        A4[0] - 4*cm,  # width (левый 2см + правый 2см = 4см)
-        A4[1] - 7*cm - 3.5*cm,  # height (страница - topMargin 7см - bottomMargin 3.5см)
-        id='later'
-    )
-
-    # Создаем PageTemplate для первой и последующих страниц
-    first_page = PageTemplate(
-        id='First',
-        frames=[frame_first],
-        onPage=lambda c, d: add_background(c, d, background_path)
-    )
-
-    later_pages = PageTemplate(
-        id='Later',
-        frames=[frame_later],
-        onPage=lambda c, d: add_background(c, d, background_path)
-    )
-
-    # Добавляем шаблоны в документ
-    doc.addPageTemplates([first_page, later_pages])
-
-    # Получаем стили
-    styles = create_custom_styles(has_fonts)
-
-    # Список элементов документа
-    story = []
-
-    # ВАЖНО: Добавляем NextPageTemplate в начало - при ПЕРВОМ PageBreak переключится на Later
-    story.append(NextPageTemplate('Later'))
-
-    # Парсим текст анализа
-    lines = analysis_text.strip().split('\n')
-
-    for line in lines:
-        line = line.strip()
-
-        if not line:
-            story.append(Spacer(1, 0.3*cm))
-            continue
-
-        # Пропускаем заголовок "Сканер подсознания" - он уже на фоне
-        if 'Сканер подсознания' in line or '✨' in line:
-            continue
-
-        # Пропускаем служебные строки ФОРМАТ
-        if "ФОРМАТ:" in line:
-            continue
-
-        # Запрос
-        if line.startswith("🔹") and "Запрос:" in line:
-            clean_line = line.replace("🔹", "").replace("**", "").strip()
-            story.append(Paragraph(clean_line, styles["CustomHeading"]))
-            continue
-        # Подзаголовки разделов (с номерами)
-        elif re.match(r'^\*?\*?\d+\.', line) or line.startswith('**'):
-            clean_line = line.replace('**', '').strip()
-
-            # Разрыв страницы ПЕРЕД 5-м разделом
-            if clean_line.startswith('5.'):
-                story.append(PageBreak())
-
-            story.append(Paragraph(clean_line, styles['CustomHeading']))
-
-        # Обычный текст
-        else:
-            # Обрабатываем списки
-            if line.startswith('—') or line.startswith('-') or line.startswith('•'):
-                clean_line = '  ' + line
-            else:
-                clean_line = line
-
-            # Раскрашиваем символы ● в легенде чакр
-            if '● 90-100%' in clean_line:
-                clean_line = clean_line.replace('●', '<font color="#00C851">●</font>')  # Зелёный
-            elif '● 65-89%' in clean_line:
-                clean_line = clean_line.replace('●', '<font color="#FF8800">●</font>')  # Оранжевый
-            elif '● менее 65%' in clean_line:
-                clean_line = clean_line.replace('●', '<font color="#FF4444">●</font>')  # Красный
-
-            # Раскрашиваем символы ● в детальном разборе чакр по проценту
-            elif line.startswith('●') and '%' in line:
-                # Извлекаем процент из строки
-                # re уже импортирован в начале файла
-                percent_match = re.search(r'(\d+)%', line)
-                if percent_match:
-                    percent = int(percent_match.group(1))
-                    if percent >= 90:
-                        clean_line = clean_line.replace('●', '<font color="#00C851">●</font>', 1)  # Зелёный
-                    elif percent >= 65:
-                        clean_line = clean_line.replace('●', '<font color="#FF8800">●</font>', 1)  # Оранжевый
-                    else:
-                        clean_line = clean_line.replace('●', '<font color="#FF4444">●</font>', 1)  # Красный
-
-            story.append(Paragraph(clean_line, styles['CustomBody']))
-
-    # Добавляем футер с датой
-    story.append(Spacer(1, 1*cm))
-    footer_text = f"<font size=8 color='#6B3D4F'>Сгенерировано {datetime.now().strftime('%d.%m.%Y')}</font>"
-    footer = Paragraph(footer_text, styles['CustomBody'])
-    story.append(footer)
-
-    # Создаем PDF (фон добавляется через PageTemplate)
-    doc.build(story)
-
-    return output_path
+
+def generate_pdf_bytes(analysis, username, background_path='pdf_background.png'):
+    """PDF в памяти — для отправки в Telegram без файла на диске"""
+    buffer = io.BytesIO()
+    get_pdf_renderer(background_path).render(analysis, username, buffer)
+    return buffer.getvalue()
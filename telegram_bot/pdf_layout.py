@@ -0,0 +1,228 @@
+"""
+Вёрстка PDF по разделам анализа
+
+Раньше build_story() шла по тексту анализа построчно и на каждой строке
+прогоняла re.match заголовка, проверки подстрок и поиск процента для цвета
+кружка. SectionLayout берёт уже разобранный AnalysisResult: разделы (sections)
+идут в порядке текста, у каждого типа раздела свой сборщик:
+
+- energy — таблица чакр из analysis.chakras: кружок и процент в цвет
+  ChakraScore.color (по числу процента этой чакры), название, состояние и
+  комментарий. Текст раздела до и после строк чакр — обычными абзацами;
+- programs — список программ из analysis.programs;
+- phrases — блок трансформационных фраз: формула на плашке и короткие фразы;
+- остальные — текст раздела: пункты с маркером — списком, строки в ** — подзаголовками.
+
+Разрыв страницы — перед разделом «Главные уроки души».
+"""
+
+from reportlab.lib import colors
+from reportlab.lib.units import cm
+from reportlab.platypus import PageBreak, Paragraph, Spacer, Table, TableStyle
+
+from analysis_result import CHAKRA_LINE_RE
+
+
+def replace_emoji_for_pdf(text):
+    """Замена эмодзи на текстовые символы и цветные кружки для PDF"""
+
+    # Сначала заменяем эмодзи чакр на цветные HTML кружки
+    chakra_emoji_map = {
+        '🔴': '<font color="#FF4444">●</font>',  # Красный круг для 1-й чакры
+        '🟠': '<font color="#FF8800">●</font>',  # Оранжевый круг для 2-й чакры
+        '🟡': '<font color="#FFD700">●</font>',  # Желтый круг для 3-й чакры
+        '💚': '<font color="#00C851">●</font>',  # Зеленый круг для 4-й чакры
+        '💙': '<font color="#0099FF">●</font>',  # Голубой круг для 5-й чакры
+        '💜': '<font color="#AA66CC">●</font>',  # Фиолетовый круг для 6-й чакры
+        '🤍': '<font color="#FFFFFF">●</font>',  # Белый круг для 7-й чакры (с обводкой)
+    }
+
+    for emoji, replacement in chakra_emoji_map.items():
+        text = text.replace(emoji, replacement)
+
+    # Затем заменяем остальные эмодзи на текстовые символы
+    other_emoji_map = {
+        '✨': '*',
+        '🔮': '~',
+        '🌿': '~',
+        '💫': '*',
+        '🕊': '~',
+        '🌸': '~',
+        '🔹': '•',
+    }
+
+    for emoji, replacement in other_emoji_map.items():
+        text = text.replace(emoji, replacement)
+
+    return text
+
+
+# Вступление разбора (в тексте — до первого раздела)
+INTRO_TITLE = 'Что такое "Сканер подсознания"?'
+INTRO_TEXT = (
+    'Это глубинный анализ запроса через призму Мета-Метода. Я смотрю на программы подсознания, '
+    'родовые влияния, энергетику чакр и даю конкретные практики для трансформации.'
+)
+
+# Заголовки разделов по ключам analysis_result.SECTION_KEYS (старые ключи — для разборов в 10 разделов)
+SECTION_TITLES = {
+    'contracts': '1. Контракты и подключки',
+    'layers': '2. Слои программ. Откуда идёт программа',
+    'energy': '3. Энергоцентры (Чакры) и поток энергии',
+    'programs': '4. Главные программы, мешающие движению',
+    'lessons': '5. Главные уроки души',
+    'changes': '6. Что важно изменить. Рекомендации',
+    'phrases': '7. Трансформационные фразы',
+    'recommendation': '8. Следующий шаг',
+    'family': 'Родовые влияния',
+    'past_lives': 'Связи из прошлых жизней',
+    'archetype': 'Архетипический анализ',
+    'message': 'Вдохновляющее послание',
+}
+
+PAGE_BREAK_SECTION = 'lessons'  # Разрыв страницы перед этим разделом
+
+LIST_MARKERS = ('—', '–', '-', '•')
+
+# Легенда цветов чакр в старых разборах: «● 90-100% — ...» — кружок в цвет зоны
+LEGEND_DOTS = (
+    ('● 90-100%', '<font color="#00C851">●</font> 90-100%'),
+    ('● 65-89%', '<font color="#FF8800">●</font> 65-89%'),
+    ('● менее 65%', '<font color="#FF4444">●</font> менее 65%'),
+)
+
+CHAKRA_TABLE_WIDTHS = (0.6*cm, 3.4*cm, 1.4*cm, 11*cm)  # кружок, название, процент, состояние и комментарий
+
+
+class SectionLayout:
+    """Flowables документа по разделам AnalysisResult; стили — готовые стили PdfRenderer"""
+
+    def __init__(self, styles):
+        self.styles = styles
+        self.heading = styles['CustomHeading']
+        self.body = styles['CustomBody']
+        self.list_item = styles['ListItem']
+        self.builders = {
+            'request': self._request,
+            'energy': self._energy,
+            'programs': self._programs,
+            'phrases': self._phrases,
+        }
+        cell = styles['ChakraCell']
+        self.chakra_table_commands = (
+            ('FONTNAME', (0, 0), (-1, -1), cell.fontName),
+            ('FONTNAME', (1, 0), (2, -1), self.heading.fontName),
+            ('FONTSIZE', (0, 0), (-1, -1), cell.fontSize),
+            ('LEADING', (0, 0), (-1, -1), cell.leading),
+            ('TEXTCOLOR', (1, 0), (1, -1), cell.textColor),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LINEBELOW', (0, 0), (-1, -2), 0.5, colors.HexColor('#E3C9D2')),
+            ('LEFTPADDING', (0, 0), (-1, -1), 3),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        )
+
+    def build(self, analysis) -> list:
+        """Вступление, затем разделы в порядке текста разбора"""
+        story = [Paragraph(INTRO_TITLE, self.heading), Paragraph(INTRO_TEXT, self.body)]
+        if not analysis.sections:
+            # Текст не в формате разбора (разделы не нашлись) — выводим как есть
+            return story + self._text(analysis.text)
+        if 'request' not in analysis.sections and analysis.request_text:
+            story.extend(self._request(analysis.request_text, analysis))
+
+        for key, body in analysis.sections.items():
+            builder = self.builders.get(key)
+            if builder is None:
+                story.extend(self._heading(key))
+                story.extend(self._text(body))
+            else:
+                story.extend(builder(body, analysis))
+        return story
+
+    def _heading(self, key: str) -> list:
+        heading = Paragraph(SECTION_TITLES[key], self.heading)
+        return [PageBreak(), heading] if key == PAGE_BREAK_SECTION else [heading]
+
+    def _request(self, body: str, analysis) -> list:
+        return [
+            Paragraph('Запрос:', self.heading),
+            Paragraph(replace_emoji_for_pdf(body.strip()), self.styles['RequestStyle']),
+        ]
+
+    def _text(self, body: str) -> list:
+        """Текст раздела: пустая строка — отступ, пункт с маркером — элемент списка, строка в ** — подзаголовок"""
+        story = []
+        for line in replace_emoji_for_pdf(body).strip().split('\n'):
+            line = line.strip()
+            if not line:
+                story.append(Spacer(1, 0.3*cm))
+            elif line.startswith(LIST_MARKERS):
+                story.append(Paragraph(line.lstrip(''.join(LIST_MARKERS)).strip(), self.list_item, bulletText='•'))
+            elif line.startswith('**'):
+                story.append(Paragraph(line.replace('**', ''), self.heading))
+            else:
+                story.append(Paragraph(line, self.body))
+        return story
+
+    def _energy(self, body: str, analysis) -> list:
+        """Текст до строк чакр, таблица чакр, текст после; без разобранных чакр — просто текст"""
+        story = self._heading('energy')
+        matches = list(CHAKRA_LINE_RE.finditer(body))
+        if not analysis.chakras or not matches:
+            return story + self._text(body)
+
+        before, after = body[:matches[0].start()], body[matches[-1].end():]
+        for marker, dot in LEGEND_DOTS:
+            before = before.replace(marker, dot)
+        if before.strip():
+            story.extend(self._text(before))
+        story.append(self._chakra_table(analysis.chakras))
+        if after.strip():
+            story.extend(self._text(after))
+        return story
+
+    def _chakra_table(self, chakras) -> Table:
+        """
+        Строка на чакру; цвет кружка и процента — по проценту этой же чакры.
+        Кружок, название и процент — простые ячейки (шрифт и цвет задаёт стиль таблицы),
+        Paragraph — только у описания, которое переносится по строкам
+        """
+        cell = self.styles['ChakraCell']
+        rows, commands = [], list(self.chakra_table_commands)
+        for row, chakra in enumerate(chakras):
+            description = '. '.join(part for part in (chakra.state, chakra.comment) if part)
+            rows.append(['●', chakra.name, f'{chakra.percent}%', Paragraph(replace_emoji_for_pdf(description), cell)])
+            color = colors.HexColor(chakra.color)
+            commands.append(('TEXTCOLOR', (0, row), (0, row), color))
+            commands.append(('TEXTCOLOR', (2, row), (2, row), color))
+        return Table(rows, colWidths=CHAKRA_TABLE_WIDTHS, style=TableStyle(commands), hAlign='LEFT')
+
+    def _programs(self, body: str, analysis) -> list:
+        """Список программ из analysis.programs; если программы не разобрались — текст раздела"""
+        story = self._heading('programs')
+        if not analysis.programs:
+            return story + self._text(body)
+        story.extend(
+            Paragraph(f'«{replace_emoji_for_pdf(program)}»', self.list_item, bulletText='•')
+            for program in analysis.programs
+        )
+        return story
+
+    def _phrases(self, body: str, analysis) -> list:
+        """Формула — на плашке, короткие фразы — списком; служебная строка «ФОРМАТ:» в PDF не идёт"""
+        story = self._heading('phrases')
+        formula = []
+        for line in replace_emoji_for_pdf(body).split('\n'):
+            line = line.strip()
+            if not line or line.startswith('ФОРМАТ:'):
+                continue
+            if line.startswith(LIST_MARKERS):
+                story.append(Paragraph(line.lstrip(''.join(LIST_MARKERS)).strip(),
+                                       self.styles['PhraseItem'], bulletText='•'))
+            else:
+                formula.append(line)
+        if formula:
+            story.insert(1, Paragraph('<br/>'.join(formula), self.styles['PhraseFormula']))
+        return story
@@ -0,0 +1,138 @@
+"""
+Рендер PDF в пуле прогретых процессов
+
+Вёрстка ReportLab — чистый CPU на десятки-сотни миллисекунд: внутри обработчика
+она останавливает event loop, и бот никому не отвечает. PdfRenderPool отдаёт
+generate_pdf() в процессы-воркеры, обработчик только ждёт результат (await).
+render_bytes() возвращает PDF в памяти — бот отправляет его без файла на диске.
+
+Воркеры прогреваются при старте бота (start()): шрифты, стили и фон
+(get_pdf_renderer) загружаются в каждом процессе один раз, первый PDF
+пользователя не платит за разбор TTF и сжатие фона.
+
+Обратное давление: в работе и в очереди пула не больше PDF_POOL_MAX_PENDING
+рендеров, остальные сканы ждут места в asyncio (по очереди), а не копят
+задания в пуле. PDF_POOL_SIZE = 0 — рендер в потоке (без отдельных процессов).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+from pdf_generator_with_background import generate_pdf, generate_pdf_bytes, get_pdf_renderer
+
+logger = logging.getLogger(__name__)
+
+PDF_POOL_SIZE = getattr(config, 'PDF_POOL_SIZE', 2)
+PDF_POOL_MAX_PENDING = getattr(config, 'PDF_POOL_MAX_PENDING', PDF_POOL_SIZE * 2 or 2)
+PDF_BACKGROUND_PATH = 'pdf_background.png'
+
+
+def _warm_up(background_path):
+    """Инициализатор воркера: шрифты, стили и фон — до первого PDF"""
+    get_pdf_renderer(background_path)
+
+
+def _ping():
+    return True
+
+
+class PdfRenderPool:
+    def __init__(self, size: int = PDF_POOL_SIZE, max_pending: int = PDF_POOL_MAX_PENDING,
+                 background_path: str = PDF_BACKGROUND_PATH):
+        self.size = size
+        self.max_pending = max(max_pending, 1)
+        self.background_path = background_path
+        self._executor = None
+        self._slots = None  # asyncio.Semaphore создаётся в loop бота
+        self.waiting = 0  # Сканов ждут места в пуле
+
+    def _create_executor(self):
+        # spawn: в процессе бота есть потоки (пул OpenAI, БД), fork их копировать не должен
+        return ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_up,
+            initargs=(self.background_path,),
+        )
+
+    async def start(self):
+        """Поднимает и прогревает воркеров (вызывается из post_init бота)"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if self.size <= 0 or self._executor is not None:
+            return
+
+        started = time.perf_counter()
+        self._executor = self._create_executor()
+        loop = asyncio.get_running_loop()
+        # Воркеры создаются по требованию — size заданий одновременно поднимают всех
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.size)))
+        logger.info(f"🖨 Пул PDF: {self.size} процессов прогреты за {time.perf_counter() - started:.1f}с "
+                    f"(в работе и очереди до {self.max_pending})")
+
+    async def render(self, analysis, username: str, output_path: str) -> str:
+        """generate_pdf() вне event loop — PDF в файл output_path"""
+        return await self._call(generate_pdf, analysis, username, output_path, self.background_path)
+
+    async def render_bytes(self, analysis, username: str) -> bytes:
+        """generate_pdf_bytes() вне event loop — PDF в памяти"""
+        return await self._call(generate_pdf_bytes, analysis, username, self.background_path)
+
+    async def _call(self, func, *args):
+        """func(*args) в пуле; при заполненном пуле ждёт места"""
+        if self._slots is None:
+            await self.start()
+
+        if self._slots.locked():
+            logger.info(f"⏳ Пул PDF занят ({self.max_pending} в работе), ждут: {self.waiting + 1}")
+        self.waiting += 1
+        waited = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - waited
+
+        try:
+            started = time.perf_counter()
+            result = await self._run(func, *args)
+            logger.info(f"🖨 PDF готов за {time.perf_counter() - started:.2f}с (ожидание пула {waited:.2f}с)")
+            return result
+        finally:
+            self._slots.release()
+
+    async def _run(self, func, *args):
+        if self._executor is None:
+            return await asyncio.to_thread(func, *args)
+
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, func, *args)
+        except BrokenProcessPool:
+            # Воркер упал (OOM, kill) — пересоздаём пул и повторяем один раз
+            logger.warning("⚠️ Пул PDF сломан, пересоздаю")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._create_executor()
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def shutdown(self):
+        """Останавливает воркеров (вызывается из post_shutdown бота)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+_pool = None
+
+
+def get_pdf_pool() -> PdfRenderPool:
+    """Пул рендера PDF процесса бота"""
+    global _pool
+    if _pool is None:
+        _pool = PdfRenderPool()
+    return _pool
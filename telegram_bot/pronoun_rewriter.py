@@ -0,0 +1,171 @@
+"""
+Замена обращения на «ты» именем в нужном падеже — за один проход по тексту
+
+Одно регулярное выражение (модульное, компилируется один раз) находит любое
+местоимение: «ты», «тебе», «тобой», «твоя энергия»; предлог перед ним («у тебя»,
+«о тебе», «с тобой») проверяется только у найденных. Падеж имени выбирается по
+таблице (местоимение + предлог → падеж), строки замены для набора склонений
+готовятся один раз в PronounRewriter и переиспользуются для всех текстов этого
+имени (get_pronoun_rewriter). Текст собирается из кусков за один проход.
+
+Падежи:
+  тебя — родительный после у / для / без / от / из-за / кроме / до / после / с,
+         иначе винительный (на тебя, в тебя, тебя ждёт)
+  тебе — предложный после о / в / на / при («о тебе» → «об Анне»), иначе дательный
+  тобой, тобою — творительный
+  ты — именительный («на ты» не трогаем); глагол после него во 2-м лице — в 3-е:
+         «Ты чувствуешь» → «Анна чувствует», «ты не боишься» → «Анна не боится»
+  твой, твоя, твоего... — имя в родительном после существительного:
+         «твоя энергия» → «энергия Анны», «Твоя внутренняя сила» → «Внутренняя сила Анны»;
+         прилагательное без согласованного существительного после него — само
+         существительное: «Твоё прошлое держит» → «Прошлое Анны держит»
+
+Фраза, оказавшаяся в начале предложения вместо «Твой/Твоя...», начинается с заглавной.
+"""
+
+import re
+from functools import lru_cache
+
+from name_declension import CASES
+
+GENITIVE_PREPOSITIONS = {'у', 'для', 'без', 'от', 'из-за', 'кроме', 'до', 'после', 'около', 'с', 'со'}
+PREPOSITIONAL_PREPOSITIONS = {'о', 'об', 'обо', 'в', 'во', 'на', 'при'}
+
+_PREPOSITIONS = ('из-за', 'кроме', 'после', 'перед', 'через', 'около', 'для', 'без', 'про', 'при', 'над', 'под',
+                 'обо', 'об', 'до', 'от', 'на', 'за', 'со', 'во', 'по', 'к', 'у', 'в', 'о', 'с')
+PREPOSITIONS = set(_PREPOSITIONS)
+_PREPOSITION_WINDOW = max(map(len, _PREPOSITIONS)) + 8  # символов перед местоимением: предлог и пробелы
+
+# Прилагательное берётся в группу, только если за ним согласованное существительное:
+# «твоя внутренняя сила» → «внутренняя сила Анны». Иначе прилагательное само
+# существительное: «Твоё будущее зависит» → «Будущее Анны зависит», «Твои родные
+# говорят» → «Родные Анны говорят». Окончание прилагательного → окончание существительного
+_VERB_ENDINGS = r'(?:[аеёиоуыэюя]ет|ит|ют|ут|ят|ат|ся|сь|ть|л)'
+_ADJECTIVE_AGREEMENT = (
+    ('ая|яя', r'[а-яё]*[аяь]'),                                      # внутренняя сила
+    ('ое|ее', r'[а-яё]*(?:[оеё]|мя)'),                                # глубокое чувство
+    ('ые|ие', r'[а-яё]*[ыиая]'),                                      # родовые программы
+    ('ую|юю', r'[а-яё]*[уюь]'),                                       # внутреннюю силу
+    ('ого|его', r'[а-яё]*[аяоеу]'),                                   # внутреннего мира
+    ('ому|ему', r'[а-яё]*[уюие]'),                                    # внутреннему ребёнку
+    ('ыми|ими', r'[а-яё]*ми'),                                        # близкими людьми
+    ('ых|их', r'[а-яё]*(?:[ая]х|ов|ев|ей|[бвгджзклмнпрстфхцчшщ]ь?)'),  # близких людей
+    ('ый|ий', rf'(?![а-яё]*{_VERB_ENDINGS}\b)[а-яё]*[бвгджзклмнпрстфхцчшщйь]'),  # внутренний голос
+)
+
+# Слова, с которых не начинается «существительное после твой»: «твоя и моя» → «Анны и моя»
+_STOP_WORDS = '|'.join((
+    'и', 'или', 'а', 'но', 'не', 'ни', 'же', 'ли', 'бы', 'это', 'что', 'как', 'уже', 'ещё', 'еще', 'очень',
+    'так', 'тоже', 'также', 'только', 'всегда', 'сейчас', 'здесь', 'там', 'более', 'менее',
+    'самый', 'самая', 'самое', 'самые', 'ты', 'тебя', 'тебе', 'тобой', 'тобою', *_PREPOSITIONS,
+))
+_NOT_STOP_WORD = rf'(?!(?:{_STOP_WORDS})\b)'
+
+_ADJECTIVE_NOUN = '|'.join(
+    rf'[а-яё]+(?:{adjective})\s+{_NOT_STOP_WORD}{noun}\b' for adjective, noun in _ADJECTIVE_AGREEMENT
+)
+
+# Только местоимение (и существительное после притяжательного): текст сканируется быстро,
+# предлог перед совпадением — последнее короткое слово в окне из нескольких символов (WORD_BEFORE_RE)
+PRONOUN_RE = re.compile(
+    r'\b(?:'
+    r'(?P<possessive>[Тт]во(?:его|ему|ими|ей|ём|ем|им|их|ою|ой|й|я|ё|е|и|ю))'
+    rf'(?P<phrase>\s+{_NOT_STOP_WORD}(?:{_ADJECTIVE_NOUN}|[а-яё]+))?'
+    r'|(?P<personal>[Тт](?:ы|ебя|ебе|обою|обой))'
+    r')\b'
+)
+# Глагол во 2-м лице после «ты» (через частицы и наречия): основа, окончание, -ся
+VERB_AFTER_TY_RE = re.compile(
+    r'(\s+(?:(?:не|уже|ещё|еще|всё|все|всегда|сейчас|тоже|точно|обязательно|сама|сам)\s+)*)'
+    r'([а-яё]+?)(ешь|ёшь|ишь)(ся)?\b'
+)
+THIRD_PERSON_ENDINGS = {'ешь': 'ет', 'ёшь': 'ёт', 'ишь': 'ит'}
+WORD_BEFORE_RE = re.compile(rf'(?<![\w-])([\w-]{{1,{max(map(len, _PREPOSITIONS))}}})\s+$')
+
+VOWELS_AFTER_OB = 'аоуиэ'  # «об Анне», «об Ольге», но «о Юлии», «о Евгении»
+
+
+# (местоимение, класс предлога) → падеж имени; класс None — предлога нет.
+# Пары, которых нет (ты после предлога: «на ты»), остаются как есть
+_PREP_CLASSES = ('genitive', 'prepositional', 'other', None)
+CASE_TABLE = {
+    **{('тебя', prep_class): 'accusative' for prep_class in _PREP_CLASSES},
+    ('тебя', 'genitive'): 'genitive',
+    **{('тебе', prep_class): 'dative' for prep_class in _PREP_CLASSES},
+    ('тебе', 'prepositional'): 'prepositional',
+    **{('тобой', prep_class): 'instrumental' for prep_class in _PREP_CLASSES},
+    **{('тобою', prep_class): 'instrumental' for prep_class in _PREP_CLASSES},
+    ('ты', None): 'nominative',
+}
+
+
+class PronounRewriter:
+    """Замены для одного набора склонений; переиспользуется для всех текстов этого имени"""
+
+    def __init__(self, declensions: dict):
+        self.declensions = {case: declensions[case] for case in CASES}
+        self._table = {key: self.declensions[case] for key, case in CASE_TABLE.items()}
+        self._genitive = self.declensions['genitive']
+        self._ob = self.declensions['prepositional'][:1].lower() in VOWELS_AFTER_OB
+
+    @staticmethod
+    def _prep_class(prep: str):
+        if prep is None:
+            return None
+        if prep in GENITIVE_PREPOSITIONS:
+            return 'genitive'
+        if prep in PREPOSITIONAL_PREPOSITIONS:
+            return 'prepositional'
+        return 'other'
+
+    def rewrite(self, text: str) -> str:
+        parts = []
+        last = 0
+        for match in PRONOUN_RE.finditer(text):
+            start, end = match.span()
+            possessive, phrase, personal = match.group('possessive', 'phrase', 'personal')
+            before = prep = None
+            if start and text[start - 1].isspace():
+                before = WORD_BEFORE_RE.search(text, max(0, start - _PREPOSITION_WINDOW), start)
+                prep = before.group(1).lower() if before else None
+                if prep not in PREPOSITIONS:
+                    before = prep = None
+
+            if possessive:
+                name = f"{phrase.lstrip()} {self._genitive}" if phrase else self._genitive
+            else:
+                pronoun = personal.lower()
+                name = self._table.get((pronoun, self._prep_class(prep)))
+                if name is None:
+                    continue  # «на ты» и подобное — как есть
+                if pronoun == 'ты':
+                    verb = VERB_AFTER_TY_RE.match(text, match.end())
+                    if verb:
+                        # Имя — 3-е лицо: «Анна чувствует», а не «Анна чувствуешь»
+                        words, stem, ending, reflexive = verb.groups()
+                        name += f"{words}{stem}{THIRD_PERSON_ENDINGS[ending]}{reflexive or ''}"
+                        end = verb.end()
+                if prep == 'о' and pronoun == 'тебе' and self._ob:
+                    parts.append(text[last:before.end(1)])
+                    parts.append('б')
+                    last = before.end(1)
+
+            # В начале предложения «Твоя энергия» → «Энергия Анны», «Ты» → имя с заглавной
+            if not before and text[start].isupper():
+                name = name[0].upper() + name[1:]
+            parts.append(text[last:start])
+            parts.append(name)
+            last = end
+
+        parts.append(text[last:])
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=256)
+def _rewriter(forms: tuple) -> PronounRewriter:
+    return PronounRewriter(dict(zip(CASES, forms)))
+
+
+def get_pronoun_rewriter(declensions: dict) -> PronounRewriter:
+    """PronounRewriter для набора склонений (готовится один раз на набор)"""
+    return _rewriter(tuple(declensions[case] for case in CASES))
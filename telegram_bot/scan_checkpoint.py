@@ -0,0 +1,69 @@
+"""
+Чекпоинты скана в PostgreSQL
+
+ScanCheckpoint передаётся в MetaMethodAnalyzer.analyze_async(checkpoint=...):
+анализатор пишет ответ модели каждого шага сразу после шага, а при повторе
+(кнопка "Продолжить анализ" или перезапуск бота) берёт готовые шаги отсюда
+и вызывает модель только для недостающих.
+
+MemoryCheckpoint — то же в памяти процесса: для спекулятивных шагов, которые
+идут ещё до регистрации скана (speculative_scan.py).
+
+Методы синхронные (psycopg2): analyze_async вызывает их через asyncio.to_thread.
+
+Таблицы analysis_scans и scan_checkpoints — миграция 006.
+"""
+
+import logging
+
+from openai.types import CompletionUsage
+
+from metamethod_analyzer import cached_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ScanCheckpoint:
+    """Готовые шаги одного скана (analysis_scans.id)"""
+
+    def __init__(self, db, scan_id: int):
+        self.db = db
+        self.scan_id = scan_id
+
+    def load(self) -> dict:
+        """{шаг: (ответ_модели, usage, секунды)} — шаги, которые уже не надо вызывать"""
+        restored = {}
+        for step, row in self.db.get_scan_checkpoints(self.scan_id).items():
+            usage = CompletionUsage(
+                prompt_tokens=row['prompt_tokens'] or 0,
+                completion_tokens=row['completion_tokens'] or 0,
+                total_tokens=row['total_tokens'] or 0,
+                prompt_tokens_details={'cached_tokens': row['cached_tokens'] or 0},
+            )
+            restored[step] = (row['output'], usage, row['duration_seconds'] or 0.0)
+        return restored
+
+    def save(self, step: str, text: str, usage, duration: float):
+        """Ответ модели на шаге — сразу после шага"""
+        self.db.save_scan_checkpoint(
+            self.scan_id, step, text,
+            prompt_tokens=usage.prompt_tokens,
+            completion_tokens=usage.completion_tokens,
+            total_tokens=usage.total_tokens,
+            cached_tokens=cached_prompt_tokens(usage),
+            duration_seconds=round(duration, 2),
+        )
+        logger.info(f"💾 Скан #{self.scan_id}: шаг «{step}» сохранён")
+
+
+class MemoryCheckpoint:
+    """Готовые шаги в памяти процесса — интерфейс как у ScanCheckpoint"""
+
+    def __init__(self):
+        self.saved = {}  # шаг → (ответ_модели, usage, секунды)
+
+    def load(self) -> dict:
+        return dict(self.saved)
+
+    def save(self, step: str, text: str, usage, duration: float):
+        self.saved[step] = (text, usage, duration)
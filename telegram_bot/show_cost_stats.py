@@ -133,10 +133,129 @@ def show_recent_analyses():
     cur.close()
     conn.close()
 
+def show_queue_wait_stats():
+    """Ожидание места в очереди сканов по полосам (vip / paid / free) за 7 дней"""
+    conn = get_db()
+    cur = conn.cursor()
+
+    query = """
+        SELECT date, lane, total_analyses, avg_wait_seconds, p50_wait_seconds, p95_wait_seconds, max_wait_seconds
+        FROM queue_wait_by_lane
+        WHERE date >= CURRENT_DATE - INTERVAL '7 days'
+        ORDER BY date DESC, lane;
+    """
+
+    cur.execute(query)
+    rows = cur.fetchall()
+
+    print("\n" + "="*60)
+    print("🚥 ОЖИДАНИЕ В ОЧЕРЕДИ ПО ПОЛОСАМ (7 ДНЕЙ)")
+    print("="*60)
+
+    table = []
+    for row in rows:
+        table.append([
+            row[0].strftime('%d.%m.%Y'),  # date
+            row[1],  # lane
+            row[2],  # analyses
+            f"{row[3]:.1f}с",  # avg
+            f"{row[4]:.1f}с",  # p50
+            f"{row[5]:.1f}с",  # p95
+            f"{row[6]:.1f}с",  # max
+        ])
+
+    headers = ["Дата", "Полоса", "Анализов", "Среднее", "p50", "p95", "Макс"]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+
+    cur.close()
+    conn.close()
+
+def show_speculative_stats():
+    """Спекулятивные запуски шагов 1-4 за 7 дней: пригодились или отменены, и во что обошлись"""
+    conn = get_db()
+    cur = conn.cursor()
+
+    query = """
+        SELECT date, status, total_runs, steps_completed, total_tokens, total_cost_usd
+        FROM speculative_cost_by_date
+        WHERE date >= CURRENT_DATE - INTERVAL '7 days'
+        ORDER BY date DESC, status;
+    """
+
+    cur.execute(query)
+    rows = cur.fetchall()
+
+    print("\n" + "="*60)
+    print("🔮 СПЕКУЛЯТИВНЫЕ ЗАПУСКИ (7 ДНЕЙ)")
+    print("="*60)
+
+    table = []
+    wasted = 0
+    for row in rows:
+        if row[1] != 'adopted':
+            wasted += float(row[5] or 0)
+        table.append([
+            row[0].strftime('%d.%m.%Y'),  # date
+            row[1],  # status
+            row[2],  # runs
+            row[3],  # steps
+            f"{row[4]:,}",  # tokens
+            f"${float(row[5] or 0):.4f}",  # cost
+        ])
+
+    headers = ["Дата", "Статус", "Запусков", "Шагов", "Токенов", "Стоимость"]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    print(f"Потрачено на неиспользованные спекуляции: ${wasted:.4f}")
+
+    cur.close()
+    conn.close()
+
+def show_name_declension_stats():
+    """Склонения имён за 7 дней: попадания в кэш и сэкономленные запросы к модели"""
+    conn = get_db()
+    cur = conn.cursor()
+
+    query = """
+        SELECT date, total_lookups, cache_hits, hit_rate_percent, saved_api_calls, api_calls
+        FROM name_declension_hit_rate_by_date
+        WHERE date >= CURRENT_DATE - INTERVAL '7 days'
+        ORDER BY date DESC;
+    """
+
+    cur.execute(query)
+    rows = cur.fetchall()
+
+    print("\n" + "="*60)
+    print("📚 КЭШ СКЛОНЕНИЙ ИМЁН (7 ДНЕЙ)")
+    print("="*60)
+
+    table = []
+    saved = 0
+    for row in rows:
+        saved += row[4] or 0
+        table.append([
+            row[0].strftime('%d.%m.%Y'),  # date
+            row[1],  # lookups
+            row[2] or 0,  # cache hits
+            f"{row[3] or 0}%",  # hit rate
+            row[4] or 0,  # saved api calls
+            row[5] or 0,  # api calls
+        ])
+
+    headers = ["Дата", "Склонений", "Из кэша", "Попаданий", "Без модели", "Запросов к модели"]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+    print(f"Сэкономлено запросов к модели: {saved}")
+
+    cur.close()
+    conn.close()
+
 if __name__ == "__main__":
     try:
         show_total_stats()
         show_user_stats()
         show_recent_analyses()
+        show_queue_wait_stats()
+        show_speculative_stats()
+        show_name_declension_stats()
     except Exception as e:
         print(f"❌ Ошибка: {e}")
@@ -0,0 +1,136 @@
+"""
+Спекулятивный старт анализа
+
+Шагам 1-4 (программы, род, чакры, фразы) имя не нужно — только текст запроса.
+Как только запрос известен, а бот ещё ждёт имя или фото, SpeculativeRun запускает
+эти шаги в фоне и держит ответы в памяти (MemoryCheckpoint). Когда скан стартует
+с тем же запросом, ответы переносятся в чекпоинт скана — остаются только
+склонение имени и финальная компоновка.
+
+Работа отменяется, если запрос изменился, пользователь начал заново (/start)
+или не вернулся за SPECULATION_TTL секунд. Каждый запуск пишется в speculative_runs
+со статусом (adopted / changed / abandoned / expired) и стоимостью готовых шагов —
+так видно, сколько стоят спекуляции, которые не пригодились. Запрос, прерванный
+отменой посреди шага, в стоимость не попадает: usage по нему не приходит.
+
+Спекуляция занимает место в очереди сканов (полоса 'speculative' — ниже всех, со
+своим лимитом): под нагрузкой она не отнимает места у настоящих сканов. Если скан
+стартовал, а спекуляция ещё ждёт места, она отменяется — скан посчитает шаги сам.
+
+Настройки — в config.py (SPECULATION_ENABLED, SPECULATION_TTL).
+"""
+
+import asyncio
+import logging
+import time
+
+import config
+from config import OPENAI_MODEL
+from cost_calculator import calculate_cost
+from analysis_queue import get_analysis_queue
+from metamethod_analyzer import MetaMethodAnalyzer, cached_prompt_tokens
+from scan_checkpoint import MemoryCheckpoint
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_ENABLED = getattr(config, 'SPECULATION_ENABLED', True)
+SPECULATION_TTL = getattr(config, 'SPECULATION_TTL', 1800)  # секунд ждём имя/фото, потом отменяем
+
+
+class SpeculativeRun:
+    """Шаги анализа без имени по тексту запроса — запущены до старта скана"""
+
+    def __init__(self, db, request_text: str, user_id: int, analyzer: MetaMethodAnalyzer):
+        self.db = db
+        self.request_text = request_text
+        self.user_id = user_id
+        self.analyzer = analyzer
+        self.checkpoint = MemoryCheckpoint()
+        self.status = 'running'
+        self.has_slot = False  # получила место в очереди сканов
+        self.started = time.monotonic()
+        self.task = asyncio.create_task(self._run())
+        self._expiry = asyncio.get_running_loop().call_later(SPECULATION_TTL, self.cancel, 'expired')
+
+    @classmethod
+    def start(cls, db, request_text: str, user_id: int, mode: str = None):
+        """Запускает спекуляцию; None — если нечего считать заранее (режим 'structured') или она выключена"""
+        if not SPECULATION_ENABLED or not request_text:
+            return None
+        analyzer = MetaMethodAnalyzer(mode=mode)
+        if not analyzer.speculative_steps:
+            return None
+        return cls(db, request_text, user_id, analyzer)
+
+    def matches(self, request_text: str, mode: str = None) -> bool:
+        """Подходит ли спекуляция скану с этим запросом и режимом"""
+        return (
+            self.status == 'running'
+            and request_text == self.request_text
+            and (mode is None or mode == self.analyzer.mode)
+        )
+
+    async def _run(self):
+        logger.info(f"🔮 Спекуляция для {self.user_id}: {', '.join(self.analyzer.speculative_steps)}")
+        try:
+            async with get_analysis_queue().slot('speculative'):
+                self.has_slot = True
+                await self.analyzer.analyze_async(
+                    self.request_text, '',
+                    user_id=self.user_id,
+                    checkpoint=self.checkpoint,
+                    steps=self.analyzer.speculative_steps,
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Скан сам досчитает шаги, которых нет в чекпоинте
+            logger.warning(f"⚠️ Спекуляция для {self.user_id} не завершилась: {e}")
+
+    async def adopt(self, checkpoint) -> list:
+        """
+        Дожидается спекулятивных шагов и переносит готовые в checkpoint скана (ScanCheckpoint).
+        Возвращает список перенесённых шагов
+        """
+        self._expiry.cancel()
+        self.status = 'adopted'
+        if not self.has_slot:
+            # Ещё ждёт места в очереди — скан не ждёт её, а считает шаги сам
+            self.task.cancel()
+        await asyncio.wait([self.task])
+
+        for step, (text, usage, duration) in self.checkpoint.saved.items():
+            await asyncio.to_thread(checkpoint.save, step, text, usage, duration)
+
+        self._record()
+        steps = list(self.checkpoint.saved)
+        logger.info(f"🔮 Спекуляция для {self.user_id} пригодилась: {', '.join(steps) or 'нет готовых шагов'}")
+        return steps
+
+    def cancel(self, reason: str):
+        """Отменяет спекуляцию: reason — changed (новый запрос) / abandoned (/start) / expired"""
+        if self.status != 'running':
+            return
+        self.status = reason
+        self._expiry.cancel()
+        self.task.cancel()
+        self._record()
+        logger.info(f"🔮 Спекуляция для {self.user_id} отменена ({reason})")
+
+    def _record(self):
+        """Пишет запуск и стоимость готовых шагов в speculative_runs; ошибка БД не мешает скану"""
+        usages = [usage for _, usage, _ in self.checkpoint.saved.values()]
+        prompt_tokens = sum(usage.prompt_tokens for usage in usages)
+        completion_tokens = sum(usage.completion_tokens for usage in usages)
+        cached_tokens = sum(cached_prompt_tokens(usage) for usage in usages)
+        try:
+            self.db.save_speculative_run(
+                user_id=self.user_id,
+                status=self.status,
+                steps_completed=len(usages),
+                tokens_used=prompt_tokens + completion_tokens,
+                api_cost_usd=calculate_cost(OPENAI_MODEL, prompt_tokens, completion_tokens, cached_tokens),
+                lifetime_seconds=round(time.monotonic() - self.started, 1),
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось записать спекуляцию: {e}")
@@ -0,0 +1,71 @@
+"""
+Параллельная обработка апдейтов Telegram с порядком внутри пользователя
+
+По умолчанию python-telegram-bot обрабатывает апдейты строго по одному: пока
+обработчик одного пользователя ждёт скан (минута и больше), остальные не получают
+ответа, даже если сам анализ асинхронный. concurrent_updates(True) снимает это,
+но ConversationHandler и user_sessions рассчитаны на то, что сообщения одного
+пользователя разбираются по порядку (фото → запрос → имя).
+
+PerUserUpdateProcessor: апдейты разных пользователей обрабатываются параллельно
+(до MAX_CONCURRENT_UPDATES), апдейты одного пользователя — строго по очереди
+(asyncio.Lock на пользователя, FIFO). Пока у пользователя идёт скан, его новые
+сообщения ждут окончания скана, как раньше, но остальные пользователи — нет.
+Сверх USER_MAX_PENDING_UPDATES ожидающих апдейтов пользователя лишние
+отбрасываются: один пользователь не займёт все места процессора.
+"""
+
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+import config
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_UPDATES = getattr(config, 'MAX_CONCURRENT_UPDATES', 256)
+USER_MAX_PENDING_UPDATES = getattr(config, 'USER_MAX_PENDING_UPDATES', 10)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Апдейты разных пользователей — параллельно, одного пользователя — по порядку"""
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES,
+                 user_max_pending: int = USER_MAX_PENDING_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self.user_max_pending = user_max_pending
+        self._locks = {}    # user_id -> asyncio.Lock
+        self._pending = {}  # user_id -> апдейтов в работе и в ожидании
+
+    async def do_process_update(self, update, coroutine):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            # Апдейты без пользователя (посты каналов и т.п.) порядок сессий не затрагивают
+            await coroutine
+            return
+
+        user_id = user.id
+        if self._pending.get(user_id, 0) >= self.user_max_pending:
+            logger.warning(f"⚠️ У пользователя {user_id} уже {self.user_max_pending} апдейтов в очереди, "
+                           f"апдейт {update.update_id} пропущен")
+            coroutine.close()
+            return
+
+        self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                del self._locks[user_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass